@@ -0,0 +1,328 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Synthetic cookie store generator for benchmarks.
+
+Generates Chrome and Firefox SQLite databases with realistic schemas, and Safari
+binary cookies files. Chrome values are encrypted the same way as Chrome on
+Linux, using TEST_PASSWORD, so that benchmarks can exercise decryption.
+
+Generation is deterministic for a given count and seed.
+"""
+
+import random
+import sqlite3
+import string
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator
+
+from cookiescope.cookies import CookieData
+from cookiescope.extractors import BinaryCookiesWriter
+
+#: Storage password used to encrypt Chrome fixture values.
+TEST_PASSWORD = 'cookiescope-benchmark'
+#: Default random seed.
+DEFAULT_SEED = 1970
+
+#: Chrome epoch (1601) offset from the Unix epoch in seconds.
+CHROME_EPOCH_OFFSET = 11644473600
+#: Fixed "current" time, for reproducible fixtures.
+GENERATOR_NOW = 1700000000
+
+TOP_LEVEL_DOMAINS = ['com', 'net', 'org', 'io', 'co.uk', 'de', 'com.au']
+SUBDOMAINS = ['', '', 'www.', 'api.', 'accounts.', 'cdn.', 'static.', 'login.']
+COOKIE_NAMES = ['_ga', '_gid', 'NID', 'SID', 'session_id', 'csrftoken', '__Secure-3PSID', 'consent',
+                'AMCV_', '_fbp', 'lang', 'theme', 'tz', 'uid', 'visitor_id', 'cart']
+PATHS = ['/', '/', '/', '/app', '/account', '/api/v1', '/shop/cart']
+VALUE_CHARACTERS = string.ascii_letters + string.digits + '-_.%'
+
+CHROME_SCHEMA = '''
+CREATE TABLE meta(key LONGVARCHAR NOT NULL UNIQUE PRIMARY KEY, value LONGVARCHAR);
+CREATE TABLE cookies(
+    creation_utc INTEGER NOT NULL,
+    host_key TEXT NOT NULL,
+    top_frame_site_key TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    encrypted_value BLOB NOT NULL,
+    path TEXT NOT NULL,
+    expires_utc INTEGER NOT NULL,
+    is_secure INTEGER NOT NULL,
+    is_httponly INTEGER NOT NULL,
+    last_access_utc INTEGER NOT NULL,
+    has_expires INTEGER NOT NULL,
+    is_persistent INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    samesite INTEGER NOT NULL,
+    source_scheme INTEGER NOT NULL,
+    source_port INTEGER NOT NULL,
+    is_same_party INTEGER NOT NULL,
+    last_update_utc INTEGER NOT NULL);
+CREATE UNIQUE INDEX cookies_unique_index ON cookies(host_key, top_frame_site_key, name, path);
+INSERT INTO meta(key, value) VALUES('version', '18');
+'''
+
+FIREFOX_SCHEMA = '''
+CREATE TABLE moz_cookies (
+    id INTEGER PRIMARY KEY,
+    originAttributes TEXT NOT NULL DEFAULT '',
+    name TEXT,
+    value TEXT,
+    host TEXT,
+    path TEXT,
+    expiry INTEGER,
+    lastAccessed INTEGER,
+    creationTime INTEGER,
+    isSecure INTEGER,
+    isHttpOnly INTEGER,
+    inBrowserElement INTEGER DEFAULT 0,
+    sameSite INTEGER DEFAULT 0,
+    rawSameSite INTEGER DEFAULT 0,
+    schemeMap INTEGER DEFAULT 0,
+    CONSTRAINT moz_uniqueid UNIQUE (name, host, path, originAttributes));
+'''
+
+#: Generated store kinds mapped to file names.
+STORE_FILE_NAMES = {
+    'chrome': 'Cookies',
+    'firefox': 'cookies.sqlite',
+    'safari': 'Cookies.binarycookies',
+}
+
+
+@dataclass
+class SyntheticCookie:
+    """Generated cookie with Unix timestamps."""
+    domain: str
+    name: str
+    path: str
+    value: str
+    http_only: bool
+    secure: bool
+    #: Expiration timestamp or 0 for a session cookie.
+    expires: int
+    created: int
+
+
+def generate_synthetic_cookies(count: int, seed: int = DEFAULT_SEED) -> Iterator[SyntheticCookie]:
+    """
+    Generate unique synthetic cookies.
+
+    (domain, name, path) keys are unique, as required by browser schemas.
+
+    Args:
+        count: number of cookies
+        seed: random seed
+
+    Returns:
+        synthetic cookie iterator
+    """
+    rng = random.Random(seed)
+    num_sites = max(1, count // 20)
+    sites = [
+        f'{"".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12)))}'
+        f'.{rng.choice(TOP_LEVEL_DOMAINS)}'
+        for _idx in range(num_sites)
+    ]
+    num_hosts = num_sites * len(SUBDOMAINS)
+    for cookie_idx in range(count):
+        host_idx = rng.randrange(num_hosts)
+        site = sites[host_idx % num_sites]
+        subdomain = SUBDOMAINS[host_idx // num_sites]
+        # Domain cookies have a leading dot, host-only cookies don't.
+        domain = f'.{subdomain}{site}' if rng.random() < 0.6 else f'{subdomain}{site}'
+        # The cookie index suffix guarantees key uniqueness.
+        name = f'{rng.choice(COOKIE_NAMES)}{cookie_idx}'
+        path = rng.choice(PATHS)
+        value = ''.join(rng.choices(VALUE_CHARACTERS, k=int(rng.expovariate(1 / 60)) + 1))
+        created = GENERATOR_NOW - rng.randrange(365 * 86400)
+        if rng.random() < 0.15:
+            expires = 0
+        else:
+            expires = GENERATOR_NOW + rng.randrange(-30 * 86400, 2 * 365 * 86400)
+        yield SyntheticCookie(
+            domain=domain,
+            name=name,
+            path=path,
+            value=value,
+            http_only=rng.random() < 0.3,
+            secure=rng.random() < 0.6,
+            expires=expires,
+            created=created,
+        )
+
+
+def get_chrome_encryptor(password: str = TEST_PASSWORD):
+    """
+    Get a function that encrypts values like Chrome on Linux ("v10" format).
+
+    Args:
+        password: storage password
+
+    Returns:
+        function to convert a plaintext string to an encrypted value
+    """
+    from cryptography.hazmat.primitives.ciphers import Cipher
+    from cryptography.hazmat.primitives.ciphers.algorithms import AES
+    from cryptography.hazmat.primitives.ciphers.modes import CBC
+    from cryptography.hazmat.primitives.hashes import SHA1
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    from cryptography.hazmat.primitives.padding import PKCS7
+    kdf = PBKDF2HMAC(algorithm=SHA1(), iterations=1, length=16, salt=b'saltysalt')
+    cipher = Cipher(algorithm=AES(kdf.derive(password.encode('utf8'))), mode=CBC(b' ' * 16))
+
+    def _encrypt(value: str) -> bytes:
+        padder = PKCS7(128).padder()
+        padded = padder.update(value.encode('utf8')) + padder.finalize()
+        encryptor = cipher.encryptor()
+        return b'v10' + encryptor.update(padded) + encryptor.finalize()
+
+    return _encrypt
+
+
+def generate_chrome_db(path: Path, count: int, seed: int = DEFAULT_SEED, encrypt: bool = True):
+    """
+    Generate a Chrome cookies database.
+
+    Args:
+        path: output database path (replaced if it exists)
+        count: number of cookies
+        seed: random seed
+        encrypt: encrypt values with TEST_PASSWORD if True
+    """
+    encrypt_value = get_chrome_encryptor() if encrypt else None
+    path.unlink(missing_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(CHROME_SCHEMA)
+
+        def _generate_rows() -> Iterator[tuple]:
+            for cookie in generate_synthetic_cookies(count, seed):
+                created = (cookie.created + CHROME_EPOCH_OFFSET) * 1000000
+                expires = (cookie.expires + CHROME_EPOCH_OFFSET) * 1000000 if cookie.expires else 0
+                yield (
+                    created,
+                    cookie.domain,
+                    '',
+                    cookie.name,
+                    '' if encrypt_value else cookie.value,
+                    encrypt_value(cookie.value) if encrypt_value else b'',
+                    cookie.path,
+                    expires,
+                    int(cookie.secure),
+                    int(cookie.http_only),
+                    created,
+                    int(bool(cookie.expires)),
+                    int(bool(cookie.expires)),
+                    1,
+                    -1,
+                    2 if cookie.secure else 1,
+                    443 if cookie.secure else 80,
+                    0,
+                    created,
+                )
+
+        connection.executemany('INSERT INTO cookies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               _generate_rows())
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def generate_firefox_db(path: Path, count: int, seed: int = DEFAULT_SEED):
+    """
+    Generate a Firefox cookies database.
+
+    Args:
+        path: output database path (replaced if it exists)
+        count: number of cookies
+        seed: random seed
+    """
+    path.unlink(missing_ok=True)
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(FIREFOX_SCHEMA)
+
+        def _generate_rows() -> Iterator[tuple]:
+            for cookie in generate_synthetic_cookies(count, seed):
+                yield (
+                    cookie.name,
+                    cookie.value,
+                    cookie.domain,
+                    cookie.path,
+                    cookie.expires,
+                    cookie.created * 1000000,
+                    cookie.created * 1000000,
+                    int(cookie.secure),
+                    int(cookie.http_only),
+                )
+
+        connection.executemany('INSERT INTO moz_cookies (name, value, host, path, expiry, lastAccessed,'
+                               ' creationTime, isSecure, isHttpOnly) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               _generate_rows())
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def generate_binary_cookies_file(path: Path, count: int, seed: int = DEFAULT_SEED, page_cookies: int = 100):
+    """
+    Generate a Safari binary cookies file.
+
+    Args:
+        path: output file path (replaced if it exists)
+        count: number of cookies
+        seed: random seed
+        page_cookies: maximum cookies per page
+    """
+    with path.open('wb') as binary_file:
+        with BinaryCookiesWriter(binary_file, page_cookies=page_cookies) as writer:
+            for cookie in generate_synthetic_cookies(count, seed):
+                writer.write_cookie(CookieData(**asdict(cookie)))
+
+
+def generate_store(kind: str, directory: Path, count: int, seed: int = DEFAULT_SEED) -> Path:
+    """
+    Generate a cookie store, reusing a previously-generated one if present.
+
+    Args:
+        kind: store kind, i.e. a STORE_FILE_NAMES key
+        directory: fixtures directory
+        count: number of cookies
+        seed: random seed
+
+    Returns:
+        generated store path
+    """
+    store_directory = directory / f'{kind}-{count}-{seed}'
+    path = store_directory / STORE_FILE_NAMES[kind]
+    if path.is_file():
+        return path
+    store_directory.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f'{path.name}.tmp')
+    if kind == 'chrome':
+        generate_chrome_db(temporary_path, count, seed)
+    elif kind == 'firefox':
+        generate_firefox_db(temporary_path, count, seed)
+    elif kind == 'safari':
+        generate_binary_cookies_file(temporary_path, count, seed)
+    else:
+        raise ValueError(f'Unsupported store kind: {kind}')
+    temporary_path.rename(path)
+    return path
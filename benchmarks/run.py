@@ -0,0 +1,357 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope benchmark runner.
+
+Times each processing stage for generated Chrome, Firefox, and Safari cookie
+stores, and measures peak traced memory in a separate pass, so that tracing
+overhead doesn't skew timings. Results can be saved as named JSON baselines and
+compared against later runs to flag regressions.
+
+Example:
+
+    python3 -m benchmarks.run --sizes 1k,100k --save before
+    ... change code ...
+    python3 -m benchmarks.run --sizes 1k,100k --compare before
+"""
+
+import argparse
+import json
+import platform
+import sqlite3
+import sys
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+from tempfile import gettempdir
+from time import perf_counter
+from typing import Any, Callable
+
+from cookiescope.browsers import BrowserBase, FirefoxBrowser, SafariBrowser
+from cookiescope.cookies import (
+    DEFAULT_SORT_FIELDS,
+    CookieData,
+    display_cookie_jar,
+    display_cookies,
+    sort_cookies,
+)
+from cookiescope.extractors import generate_binary_cookies
+from .generate import DEFAULT_SEED, STORE_FILE_NAMES, TEST_PASSWORD, generate_store
+
+#: Directory holding saved baselines.
+BASELINES_DIR = Path(__file__).parent / 'baselines'
+#: Default generated fixtures directory.
+DEFAULT_FIXTURES_DIR = Path(gettempdir()) / 'cookiescope-benchmarks'
+#: Default store kinds.
+DEFAULT_KINDS = list(STORE_FILE_NAMES.keys())
+#: Default store sizes.
+DEFAULT_SIZES = '1k,100k'
+#: Default number of timing repetitions, of which the fastest is kept.
+DEFAULT_REPEAT = 3
+#: Default relative slowdown flagged as a regression.
+DEFAULT_THRESHOLD = 0.2
+#: Absolute slowdown below which timing changes are treated as noise.
+MIN_FLAGGED_SECONDS = 0.001
+#: Filter used for the filter stage (matches a subset of generated domains).
+BENCHMARK_FILTER_BY = [('domain', ['www.', 'api.'])]
+
+#: Stage function type. Stages return a row count.
+Stage = Callable[[], int]
+
+
+class NullWriter:
+    """Output sink that discards everything written to it."""
+
+    def write(self, text: str) -> int:
+        """Discard text."""
+        return len(text)
+
+    def flush(self):
+        """Nothing to flush."""
+        pass
+
+
+def parse_size(size_string: str) -> int:
+    """
+    Parse a size string with an optional "k" or "m" multiplier suffix.
+
+    Args:
+        size_string: size string, e.g. "100k"
+
+    Returns:
+        size as an integer
+    """
+    size_string = size_string.strip().lower()
+    multiplier = 1
+    if size_string.endswith('k'):
+        multiplier = 1000
+        size_string = size_string[:-1]
+    elif size_string.endswith('m'):
+        multiplier = 1000000
+        size_string = size_string[:-1]
+    return int(size_string) * multiplier
+
+
+def open_browser(kind: str, path: Path) -> BrowserBase:
+    """
+    Open a generated store, using a test password decryptor for Chrome.
+
+    Args:
+        kind: store kind
+        path: store path
+
+    Returns:
+        browser object
+    """
+    if kind == 'chrome':
+        from cookiescope.browsers import ChromeBrowser
+        from cookiescope.browsers.chrome_generic import GenericChromeSQLiteCookies
+        from cookiescope.decryptors.posix import PosixDecryptorBase
+
+        class BenchmarkDecryptor(PosixDecryptorBase):
+            """Decryptor with a known password and Linux iteration count."""
+            iterations = 1
+
+            def get_password(self) -> str:
+                """Provide the fixture password."""
+                return TEST_PASSWORD
+
+        cookies_db = GenericChromeSQLiteCookies(path, ChromeBrowser.name, decryptor=BenchmarkDecryptor('Chrome'))
+        return ChromeBrowser(path, cookies_db)
+    if kind == 'firefox':
+        return FirefoxBrowser.from_file(path)
+    return SafariBrowser.from_file(path)
+
+
+def get_stages(kind: str, path: Path) -> dict[str, Stage]:
+    """
+    Build stage functions for a store.
+
+    Stages share state, e.g. later stages use cookies produced by earlier ones,
+    so they must run in order.
+
+    Args:
+        kind: store kind
+        path: store path
+
+    Returns:
+        stage functions mapped by name, in execution order
+    """
+    state: dict[str, Any] = {}
+
+    def _open() -> int:
+        state['browser'] = open_browser(kind, path)
+        return 1
+
+    def _scan() -> int:
+        if kind == 'safari':
+            return sum(1 for _cookie in generate_binary_cookies(path))
+        connection = sqlite3.connect(path)
+        try:
+            return sum(1 for _row in connection.execute(state['browser'].cookies_db.cookie_query))
+        finally:
+            connection.close()
+
+    def _decrypt() -> int:
+        cookies_db = state['browser'].cookies_db
+        connection = sqlite3.connect(path)
+        try:
+            encrypted_values = [row[0] for row in connection.execute(
+                f'SELECT {cookies_db.encrypted_value_column} FROM {cookies_db.table_name}')]
+        finally:
+            connection.close()
+        decrypt = cookies_db.decryptor.decrypt
+        for encrypted_value in encrypted_values:
+            decrypt(encrypted_value)
+        return len(encrypted_values)
+
+    def _generate() -> int:
+        state['cookies'] = list(state['browser'].generate_cookies(None, None))
+        return len(state['cookies'])
+
+    def _filter() -> int:
+        return sum(1 for _cookie in state['browser'].generate_cookies(BENCHMARK_FILTER_BY, None))
+
+    def _sort() -> int:
+        state['sorted_cookies'] = list(sort_cookies(state['cookies'], DEFAULT_SORT_FIELDS))
+        return len(state['sorted_cookies'])
+
+    def _output() -> int:
+        sorted_cookies: list[CookieData] = state['sorted_cookies']
+        with redirect_stdout(NullWriter()):
+            display_cookies(sorted_cookies, heading=str(path))
+            display_cookie_jar(sorted_cookies)
+        return len(sorted_cookies)
+
+    stages: dict[str, Stage] = {'open': _open, 'scan': _scan}
+    if kind == 'chrome':
+        stages['decrypt'] = _decrypt
+    stages.update(generate=_generate, filter=_filter, sort=_sort, output=_output)
+    return stages
+
+
+def run_store_benchmark(kind: str, path: Path, repeat: int, measure_memory: bool) -> dict[str, dict]:
+    """
+    Benchmark all stages for a store.
+
+    Args:
+        kind: store kind
+        path: store path
+        repeat: timing repetitions (fastest is kept)
+        measure_memory: measure peak traced memory if True
+
+    Returns:
+        stage results with "seconds", "rows", and optional "peak_bytes"
+    """
+    results: dict[str, dict] = {}
+    for _repetition in range(repeat):
+        for stage_name, stage in get_stages(kind, path).items():
+            start_time = perf_counter()
+            rows = stage()
+            seconds = perf_counter() - start_time
+            result = results.setdefault(stage_name, {'seconds': seconds, 'rows': rows})
+            result['seconds'] = min(result['seconds'], seconds)
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            for stage_name, stage in get_stages(kind, path).items():
+                tracemalloc.reset_peak()
+                baseline_bytes = tracemalloc.get_traced_memory()[0]
+                stage()
+                results[stage_name]['peak_bytes'] = tracemalloc.get_traced_memory()[1] - baseline_bytes
+        finally:
+            tracemalloc.stop()
+    return results
+
+
+def compare_results(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """
+    Compare results against a baseline.
+
+    Args:
+        results: benchmark results mapped by "<kind>-<size>" names
+        baseline: baseline results, same layout
+        threshold: relative slowdown or memory growth to flag
+
+    Returns:
+        regression messages
+    """
+    regressions: list[str] = []
+    for store_name, stage_results in results.items():
+        for stage_name, result in stage_results.items():
+            baseline_result = baseline.get(store_name, {}).get(stage_name)
+            if baseline_result is None:
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                if metric not in result or not baseline_result.get(metric):
+                    continue
+                if metric == 'seconds' and result[metric] - baseline_result[metric] < MIN_FLAGGED_SECONDS:
+                    continue
+                ratio = result[metric] / baseline_result[metric]
+                if ratio > 1 + threshold:
+                    regressions.append(f'{store_name} {stage_name} {metric}:'
+                                       f' {baseline_result[metric]:.6g} -> {result[metric]:.6g}'
+                                       f' ({(ratio - 1) * 100:+.0f}%)')
+    return regressions
+
+
+def display_results(results: dict[str, dict], baseline: dict[str, dict] = None):
+    """
+    Display results as a text table.
+
+    Args:
+        results: benchmark results mapped by "<kind>-<size>" names
+        baseline: optional baseline results to show relative changes
+    """
+    for store_name, stage_results in results.items():
+        print(f'=== {store_name} ===')
+        for stage_name, result in stage_results.items():
+            line = f'{stage_name:<10} {result["seconds"]:10.4f}s {result["rows"]:>10} rows'
+            if 'peak_bytes' in result:
+                line += f' {result["peak_bytes"] / (1024 * 1024):10.2f} MiB'
+            baseline_result = (baseline or {}).get(store_name, {}).get(stage_name)
+            if baseline_result and baseline_result.get('seconds'):
+                line += f' {(result["seconds"] / baseline_result["seconds"] - 1) * 100:+7.1f}%'
+            print(line)
+
+
+def main():
+    """Benchmark main function."""
+    arg_parser = argparse.ArgumentParser(description='Cookiescope benchmarks.')
+    arg_parser.add_argument('--kinds', dest='KINDS', default=','.join(DEFAULT_KINDS),
+                            help=f'comma-separated store kinds (default: {",".join(DEFAULT_KINDS)})')
+    arg_parser.add_argument('--sizes', dest='SIZES', default=DEFAULT_SIZES,
+                            help=f'comma-separated store sizes, e.g. 1k,100k,1m (default: {DEFAULT_SIZES})')
+    arg_parser.add_argument('--seed', dest='SEED', type=int, default=DEFAULT_SEED,
+                            help=f'generator random seed (default: {DEFAULT_SEED})')
+    arg_parser.add_argument('--fixtures', dest='FIXTURES', type=Path, default=DEFAULT_FIXTURES_DIR,
+                            help=f'generated fixtures directory (default: {DEFAULT_FIXTURES_DIR})')
+    arg_parser.add_argument('--repeat', dest='REPEAT', type=int, default=DEFAULT_REPEAT,
+                            help=f'timing repetitions, keeping the fastest (default: {DEFAULT_REPEAT})')
+    arg_parser.add_argument('--no-memory', dest='NO_MEMORY', action='store_true',
+                            help='skip peak memory measurement')
+    arg_parser.add_argument('--save', dest='SAVE', metavar='NAME',
+                            help='save results as a named baseline')
+    arg_parser.add_argument('--compare', dest='COMPARE', metavar='NAME',
+                            help='compare results against a named baseline')
+    arg_parser.add_argument('--threshold', dest='THRESHOLD', type=float, default=DEFAULT_THRESHOLD,
+                            help=f'relative change flagged as a regression (default: {DEFAULT_THRESHOLD})')
+    args = arg_parser.parse_args()
+    baseline: dict[str, dict] | None = None
+    if args.COMPARE:
+        baseline_path = BASELINES_DIR / f'{args.COMPARE}.json'
+        if not baseline_path.is_file():
+            sys.exit(f'Baseline not found: {baseline_path}')
+        baseline = json.loads(baseline_path.read_text())['results']
+    results: dict[str, dict] = {}
+    for size in [parse_size(size_string) for size_string in args.SIZES.split(',')]:
+        for kind in args.KINDS.split(','):
+            if kind not in STORE_FILE_NAMES:
+                sys.exit(f'Unsupported store kind: {kind}')
+            store_name = f'{kind}-{size}'
+            sys.stderr.write(f'Benchmarking {store_name}...\n')
+            path = generate_store(kind, args.FIXTURES, size, args.SEED)
+            results[store_name] = run_store_benchmark(kind, path, args.REPEAT, not args.NO_MEMORY)
+    display_results(results, baseline)
+    if args.SAVE:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        document = {
+            'machine': {
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+            },
+            'seed': args.SEED,
+            'results': results,
+        }
+        baseline_path = BASELINES_DIR / f'{args.SAVE}.json'
+        baseline_path.write_text(json.dumps(document, indent=2))
+        sys.stderr.write(f'Saved baseline: {baseline_path}\n')
+    if baseline is not None:
+        regressions = compare_results(results, baseline, args.THRESHOLD)
+        if regressions:
+            print('')
+            print('=== Regressions ===')
+            for regression in regressions:
+                print(regression)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
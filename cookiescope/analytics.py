@@ -0,0 +1,350 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope time and size analytics over cookie columns.
+
+Cookie expiration times, creation times, and value sizes are loaded as columns,
+e.g. straight from SQLite result rows or binary cookies record headers, rather
+than as CookieData objects. With NumPy installed the columns are int64 arrays,
+and windows, histograms, and per-domain distributions are vectorized. Without
+NumPy the same results are computed with plain Python loops.
+"""
+
+import json
+from bisect import bisect_left
+from dataclasses import asdict, dataclass, field
+from statistics import median
+from time import time
+from typing import Any, Iterable, Sequence
+
+from cookiescope.stats import EXPIRY_BUCKETS
+
+#: Age bucket (label, maximum age in seconds) pairs, in ascending order. Cookies
+#: beyond the last maximum land in the final bucket.
+AGE_BUCKETS: list[tuple[str, int | None]] = [
+    ('<1d', 86400),
+    ('<7d', 7 * 86400),
+    ('<30d', 30 * 86400),
+    ('<365d', 365 * 86400),
+    ('>=365d', None),
+]
+#: Value size percentiles to report.
+VALUE_SIZE_PERCENTILES = [50, 90, 99]
+#: Seconds per day for reported durations.
+DAY_SECONDS = 86400
+
+#: Column row, i.e. (domain, expires, created, value size or None) tuple.
+ColumnRow = tuple[str, int, int, int | None]
+
+
+def get_numpy() -> Any | None:
+    """
+    Get the NumPy module if it is installed.
+
+    Returns:
+        numpy module or None
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@dataclass
+class CookieColumns:
+    """Cookie data columns for analytics."""
+    #: Domains.
+    domains: Sequence[str]
+    #: Expiration timestamps, 0 for session cookies.
+    expires: Sequence[int]
+    #: Creation timestamps, 0 if unknown.
+    created: Sequence[int]
+    #: Value sizes in bytes, or None if not collected.
+    value_sizes: Sequence[int] | None
+    #: NumPy module if the columns are NumPy arrays.
+    numpy: Any | None = None
+
+    def __len__(self) -> int:
+        return len(self.domains)
+
+
+def load_columns(rows: Iterable[ColumnRow], value_sizes: bool, use_numpy: bool = True) -> CookieColumns:
+    """
+    Load column rows into columns.
+
+    Args:
+        rows: (domain, expires, created, value size) column rows
+        value_sizes: keep value sizes if True
+        use_numpy: use NumPy arrays if NumPy is installed and this is True
+
+    Returns:
+        cookie columns
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    if rows:
+        domains, expires, created, sizes = zip(*rows)
+    else:
+        domains, expires, created, sizes = (), (), (), ()
+    numpy = get_numpy() if use_numpy else None
+    if numpy is None:
+        return CookieColumns(
+            domains=domains,
+            expires=[int(value) for value in expires],
+            created=[int(value) for value in created],
+            value_sizes=[int(value or 0) for value in sizes] if value_sizes else None,
+        )
+    return CookieColumns(
+        domains=numpy.array(domains, dtype=object),
+        expires=numpy.array(expires, dtype=numpy.float64).astype(numpy.int64),
+        created=numpy.array(created, dtype=numpy.float64).astype(numpy.int64),
+        value_sizes=(numpy.array([value or 0 for value in sizes], dtype=numpy.int64)
+                     if value_sizes else None),
+        numpy=numpy,
+    )
+
+
+@dataclass
+class DomainAnalytics:
+    """Per-domain time distribution."""
+    #: Domain name.
+    domain: str
+    #: Cookie count.
+    count: int = 0
+    #: Expired cookie count.
+    expired: int = 0
+    #: Session cookie count.
+    session: int = 0
+    #: Median age in days of cookies with known creation times.
+    median_age_days: float | None = None
+    #: Maximum age in days of cookies with known creation times.
+    max_age_days: float | None = None
+    #: Median days until expiry of non-session cookies (negative if expired).
+    median_expiry_days: float | None = None
+
+
+@dataclass
+class CookieAnalytics:
+    """Expiry windows, age buckets, and value size distribution."""
+    #: Cookie count.
+    count: int = 0
+    #: Session cookie count.
+    session: int = 0
+    #: Cookie counts by expiry bucket label.
+    expiry: dict[str, int] = field(default_factory=dict)
+    #: Cookies without a known creation time.
+    unknown_age: int = 0
+    #: Cookie counts by age bucket label.
+    age: dict[str, int] = field(default_factory=dict)
+    #: Value size percentiles, maximum, and total, if collected.
+    value_sizes: dict[str, int] | None = None
+    #: Per-domain distributions, if requested.
+    domains: list[DomainAnalytics] | None = None
+
+
+def _get_bucket_counts(numpy: Any | None,
+                       values: Sequence[int],
+                       buckets: list[tuple[str, int | None]],
+                       ) -> dict[str, int]:
+    # Values at a bucket maximum belong to that bucket, like get_expiry_bucket().
+    bounds = [max_value for _label, max_value in buckets if max_value is not None]
+    if numpy is not None:
+        counts = numpy.bincount(numpy.searchsorted(numpy.array(bounds), values, side='left'),
+                                minlength=len(buckets))
+    else:
+        counts = [0] * len(buckets)
+        for value in values:
+            counts[bisect_left(bounds, value)] += 1
+    return {label: int(count) for (label, _max_value), count in zip(buckets, counts)}
+
+
+def _get_percentile(sorted_values: Sequence[int], percentile: int) -> int:
+    # Nearest-rank percentile.
+    rank = max(1, -(-percentile * len(sorted_values) // 100))
+    return int(sorted_values[rank - 1])
+
+
+def _get_domain_analytics_numpy(numpy: Any, columns: CookieColumns, now: int) -> list[DomainAnalytics]:
+    domains, inverse = numpy.unique(columns.domains.astype(str), return_inverse=True)
+    inverse = inverse.ravel()
+    domain_count = len(domains)
+    session_mask = columns.expires == 0
+    counts = numpy.bincount(inverse, minlength=domain_count)
+    sessions = numpy.bincount(inverse, weights=session_mask, minlength=domain_count)
+    expired = numpy.bincount(inverse, weights=~session_mask & (columns.expires <= now), minlength=domain_count)
+
+    def _get_group_medians(mask, values) -> tuple[Any, Any, Any]:
+        # Sort by group, then value, so each group's values are contiguous.
+        groups = inverse[mask]
+        values = values[mask]
+        order = numpy.lexsort((values, groups))
+        sorted_values = values[order]
+        group_counts = numpy.bincount(groups, minlength=domain_count)
+        starts = numpy.concatenate(([0], numpy.cumsum(group_counts)[:-1]))
+        has_values = group_counts > 0
+        low = numpy.where(has_values, starts + (group_counts - 1) // 2, 0)
+        high = numpy.where(has_values, starts + group_counts // 2, 0)
+        last = numpy.where(has_values, starts + group_counts - 1, 0)
+        if len(sorted_values) == 0:
+            return has_values, numpy.zeros(domain_count), numpy.zeros(domain_count)
+        medians = (sorted_values[low] + sorted_values[high]) / 2
+        return has_values, medians, sorted_values[last]
+
+    known_age_mask = columns.created > 0
+    has_ages, median_ages, max_ages = _get_group_medians(known_age_mask, now - columns.created)
+    has_expiries, median_expiries, _max_expiries = _get_group_medians(~session_mask, columns.expires - now)
+    # Convert whole columns to Python values once, rather than per element.
+    median_age_days = (numpy.rint(median_ages * 100 / DAY_SECONDS) / 100).tolist()
+    max_age_days = (numpy.rint(max_ages * 100 / DAY_SECONDS) / 100).tolist()
+    median_expiry_days = (numpy.rint(median_expiries * 100 / DAY_SECONDS) / 100).tolist()
+    return [
+        DomainAnalytics(
+            domain=domain,
+            count=count,
+            expired=expired_count,
+            session=session_count,
+            median_age_days=median_age_days[idx] if has_age else None,
+            max_age_days=max_age_days[idx] if has_age else None,
+            median_expiry_days=median_expiry_days[idx] if has_expiry else None,
+        )
+        for idx, (domain, count, expired_count, session_count, has_age, has_expiry) in enumerate(zip(
+            domains.tolist(), counts.tolist(), expired.astype(numpy.int64).tolist(),
+            sessions.astype(numpy.int64).tolist(), has_ages.tolist(), has_expiries.tolist()))
+    ]
+
+
+def _get_days(seconds: float) -> float:
+    # Round to 0.01 days the same way as the NumPy path, i.e. half to even.
+    return round(seconds * 100 / DAY_SECONDS) / 100
+
+
+def _get_domain_analytics_python(columns: CookieColumns, now: int) -> list[DomainAnalytics]:
+    results: dict[str, DomainAnalytics] = {}
+    ages: dict[str, list[int]] = {}
+    expiries: dict[str, list[int]] = {}
+    for domain, expires, created in zip(columns.domains, columns.expires, columns.created):
+        result = results.get(domain)
+        if result is None:
+            result = results[domain] = DomainAnalytics(domain)
+            ages[domain] = []
+            expiries[domain] = []
+        result.count += 1
+        if not expires:
+            result.session += 1
+        else:
+            expiries[domain].append(expires - now)
+            if expires <= now:
+                result.expired += 1
+        if created > 0:
+            ages[domain].append(now - created)
+    for domain, result in results.items():
+        if ages[domain]:
+            result.median_age_days = _get_days(median(ages[domain]))
+            result.max_age_days = _get_days(max(ages[domain]))
+        if expiries[domain]:
+            result.median_expiry_days = _get_days(median(expiries[domain]))
+    return [results[domain] for domain in sorted(results.keys())]
+
+
+def analyze_columns(columns: CookieColumns, by_domain: bool = False, now: int = None) -> CookieAnalytics:
+    """
+    Compute expiry windows, age buckets, and value size distribution.
+
+    Args:
+        columns: cookie columns
+        by_domain: also compute per-domain distributions if True
+        now: optional current timestamp (default: current time)
+
+    Returns:
+        cookie analytics
+    """
+    now = int(time()) if now is None else now
+    numpy = columns.numpy
+    analytics = CookieAnalytics(count=len(columns))
+    if numpy is not None:
+        session_mask = columns.expires == 0
+        analytics.session = int(session_mask.sum())
+        remaining = columns.expires[~session_mask] - now
+        known_age_mask = columns.created > 0
+        analytics.unknown_age = int((~known_age_mask).sum())
+        ages = now - columns.created[known_age_mask]
+        sorted_sizes = numpy.sort(columns.value_sizes) if columns.value_sizes is not None else None
+    else:
+        remaining = [expires - now for expires in columns.expires if expires]
+        analytics.session = len(columns) - len(remaining)
+        ages = [now - created for created in columns.created if created > 0]
+        analytics.unknown_age = len(columns) - len(ages)
+        sorted_sizes = sorted(columns.value_sizes) if columns.value_sizes is not None else None
+    analytics.expiry = _get_bucket_counts(numpy, remaining, EXPIRY_BUCKETS)
+    analytics.age = _get_bucket_counts(numpy, ages, AGE_BUCKETS)
+    if sorted_sizes is not None:
+        analytics.value_sizes = {}
+        if len(sorted_sizes):
+            for percentile in VALUE_SIZE_PERCENTILES:
+                analytics.value_sizes[f'p{percentile}'] = _get_percentile(sorted_sizes, percentile)
+            analytics.value_sizes['max'] = int(sorted_sizes[-1])
+        analytics.value_sizes['total'] = int(sum(sorted_sizes)) if numpy is None else int(sorted_sizes.sum())
+    if by_domain:
+        if numpy is not None:
+            analytics.domains = _get_domain_analytics_numpy(numpy, columns, now)
+        else:
+            analytics.domains = _get_domain_analytics_python(columns, now)
+    return analytics
+
+
+def display_analytics(analytics: CookieAnalytics, heading: str = None):
+    """
+    Display cookie analytics as text.
+
+    Args:
+        analytics: cookie analytics
+        heading: optional heading to display
+    """
+    if heading:
+        print(f'=== {heading} ===')
+    print(f'cookies: {analytics.count}')
+    print(f'session: {analytics.session}')
+    print('expiry: ' + '  '.join(f'{label}={count}' for label, count in analytics.expiry.items()))
+    print('age: ' + '  '.join(f'{label}={count}' for label, count in analytics.age.items())
+          + f'  unknown={analytics.unknown_age}')
+    if analytics.value_sizes is not None:
+        print('value_bytes: ' + '  '.join(f'{label}={size}' for label, size in analytics.value_sizes.items()))
+    if analytics.domains is not None:
+        columns = ['domain', 'count', 'expired', 'session', 'median_age_days', 'max_age_days',
+                   'median_expiry_days']
+        rows = [[str(value) if value is not None else '-' for value in asdict(domain).values()]
+                for domain in analytics.domains]
+        widths = [max([len(column)] + [len(row[idx]) for row in rows]) for idx, column in enumerate(columns)]
+        print('')
+        print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+        for row in rows:
+            print('  '.join(
+                value.ljust(width) if idx == 0 else value.rjust(width)
+                for idx, (value, width) in enumerate(zip(row, widths))
+            ))
+
+
+def display_analytics_json(analytics: CookieAnalytics, source: str = None):
+    """
+    Display cookie analytics as a JSON document.
+
+    Args:
+        analytics: cookie analytics
+        source: optional source description
+    """
+    print(json.dumps({'source': source, **asdict(analytics)}, indent=2))
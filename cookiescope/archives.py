@@ -0,0 +1,162 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope cookie sources inside tar and zip archives.
+
+Archive member sources are written as "ARCHIVE!/MEMBER", e.g.
+"backup.tar.gz!/home/u/.config/chromium/Default/Cookies". The member is read
+into memory, without temporary files. Readers open it like a file, i.e. as a
+stream over the buffered bytes, and SQLite databases are deserialized into an
+in-memory connection.
+
+Write-ahead log (-wal) members are not applied, so uncheckpointed changes in
+archived SQLite databases are not visible.
+"""
+
+import sqlite3
+import tarfile
+import zipfile
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+from typing import IO
+
+from cookiescope.utility import abort
+
+#: Separator between the archive path and the member path in cookie sources.
+ARCHIVE_MEMBER_SEPARATOR = '!/'
+#: SQLite header offset of the file format write and read version bytes.
+SQLITE_FORMAT_VERSION_OFFSET = 18
+#: SQLite file format version bytes for write-ahead logging (WAL) mode.
+SQLITE_WAL_FORMAT_VERSION = b'\x02\x02'
+#: SQLite file format version bytes for legacy (rollback journal) mode.
+SQLITE_LEGACY_FORMAT_VERSION = b'\x01\x01'
+
+
+class ArchiveMember:
+    """
+    Cookie source file inside a tar or zip archive.
+
+    Provides the subset of the Path interface used to read cookie sources. The
+    member data is read once and kept in memory.
+    """
+
+    def __init__(self, archive_path: Path, member_name: str):
+        """
+        Archive member constructor.
+
+        Args:
+            archive_path: tar (optionally compressed) or zip archive path
+            member_name: member path inside the archive, without a leading "/"
+        """
+        self.archive_path = archive_path
+        self.member_name = member_name
+        self._data: bytes | None = None
+
+    @classmethod
+    def from_cookie_source(cls, cookie_source: str) -> 'ArchiveMember | None':
+        """
+        Parse an "ARCHIVE!/MEMBER" cookie source.
+
+        Args:
+            cookie_source: cookie source string
+
+        Returns:
+            archive member, or None if the source doesn't name a member of an existing file
+        """
+        archive_string, separator, member_name = cookie_source.partition(ARCHIVE_MEMBER_SEPARATOR)
+        if not separator or not member_name or not Path(archive_string).is_file():
+            return None
+        return cls(Path(archive_string), member_name.lstrip('/'))
+
+    @property
+    def name(self) -> str:
+        """
+        Member file name property.
+
+        Returns:
+            final member path component
+        """
+        return PurePosixPath(self.member_name).name
+
+    def __str__(self) -> str:
+        return f'{self.archive_path}{ARCHIVE_MEMBER_SEPARATOR}{self.member_name}'
+
+    def read_bytes(self) -> bytes:
+        """
+        Read the member data, streaming it from the archive on first use.
+
+        Tar archives are read sequentially, stopping at the member, so that
+        compressed archives don't need random access.
+
+        Returns:
+            member data
+        """
+        if self._data is None:
+            self._data = self._read_member()
+        return self._data
+
+    def _read_member(self) -> bytes:
+        # Accept member names stored with or without a "./" or "/" prefix.
+        member_names = {self.member_name, f'./{self.member_name}', f'/{self.member_name}'}
+        try:
+            if zipfile.is_zipfile(self.archive_path):
+                with zipfile.ZipFile(self.archive_path) as zip_file:
+                    for info in zip_file.infolist():
+                        if info.filename in member_names and not info.is_dir():
+                            return zip_file.read(info)
+            else:
+                with tarfile.open(self.archive_path, 'r|*') as tar_file:
+                    for info in tar_file:
+                        if info.name in member_names and info.isfile():
+                            return tar_file.extractfile(info).read()
+        except (OSError, tarfile.TarError, zipfile.BadZipFile) as exc:
+            abort('Unable to read archive due to exception:', str(self.archive_path), str(exc))
+        abort('Archive member not found:', str(self))
+
+    def open(self, mode: str = 'rb') -> IO:
+        """
+        Open the member data as a binary stream.
+
+        Args:
+            mode: open mode, which must be "rb"
+
+        Returns:
+            binary stream over the member data
+        """
+        if mode != 'rb':
+            raise ValueError(f'Archive members only support mode "rb": {self}')
+        return BytesIO(self.read_bytes())
+
+    def open_sqlite(self) -> sqlite3.Connection:
+        """
+        Open the member data as an in-memory SQLite database.
+
+        Write-ahead log (WAL) mode is switched off in the header copy, because
+        deserialized databases can't use it.
+
+        Returns:
+            database connection
+        """
+        data = self.read_bytes()
+        version_end = SQLITE_FORMAT_VERSION_OFFSET + len(SQLITE_WAL_FORMAT_VERSION)
+        if data[SQLITE_FORMAT_VERSION_OFFSET:version_end] == SQLITE_WAL_FORMAT_VERSION:
+            data = b''.join([data[:SQLITE_FORMAT_VERSION_OFFSET], SQLITE_LEGACY_FORMAT_VERSION,
+                             data[version_end:]])
+        connection = sqlite3.connect(':memory:')
+        connection.deserialize(data)
+        return connection
@@ -0,0 +1,345 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope Cookie request header size ("bloat") report.
+
+A request target is a host and path present in the cookie store. Its Cookie
+header holds every unexpired cookie that domain-matches the host and
+path-matches the path, with secure cookies omitted over plain HTTP.
+
+The report is computed in one sweep over cookies sorted by reversed domain
+labels, where a domain's subdomains immediately follow it. A stack holds the
+domains enclosing the current one, so the cookies sent to a host are its
+host-only cookies plus the domain cookies on the stack. Per-cookie totals are
+final once a domain leaves the stack, so only the worst targets and largest
+cookies are kept.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from heapq import heappush, heappushpop, nlargest
+from time import time
+from typing import Iterable
+
+from cookiescope.cookies import CookieData, get_site_key
+
+#: Default number of worst request targets to report.
+DEFAULT_BLOAT_TARGETS = 20
+#: Default number of largest contributing cookies reported per target.
+DEFAULT_BLOAT_CONTRIBUTORS = 5
+#: Default header size limit in bytes, e.g. the common 8 KB server request header buffer.
+DEFAULT_HEADER_LIMIT = 8192
+#: Header field name prefix counted in header sizes.
+HEADER_PREFIX = 'Cookie: '
+#: Separator between cookie pairs in a header.
+PAIR_SEPARATOR = '; '
+#: Cookie sort order required by the sweep, i.e. reversed domain labels.
+BLOAT_SORT_FIELDS = ['site']
+
+
+@dataclass
+class CookieContribution:
+    """Cookie contribution to request headers."""
+    #: Cookie domain.
+    domain: str
+    #: Cookie name.
+    name: str
+    #: Cookie path.
+    path: str
+    #: Size in bytes of the name=value pair.
+    bytes: int
+    #: Number of request targets that receive the cookie.
+    targets: int = 0
+    #: Total bytes contributed to all request targets.
+    total_bytes: int = 0
+
+
+@dataclass
+class RequestTarget:
+    """Cookie header size for a host and path."""
+    #: Request host.
+    host: str
+    #: Request path.
+    path: str
+    #: Number of cookies sent over HTTPS.
+    count: int
+    #: Header size in bytes over HTTPS.
+    bytes: int
+    #: Header size in bytes over plain HTTP, i.e. without secure cookies.
+    http_bytes: int
+    #: Largest cookies sent over HTTPS, in descending size order.
+    contributors: list[CookieContribution] = field(default_factory=list)
+
+
+@dataclass
+class BloatReport:
+    """Cookie header size report."""
+    #: Header size limit in bytes.
+    limit: int
+    #: Number of hosts.
+    hosts: int = 0
+    #: Number of request targets.
+    targets: int = 0
+    #: Number of request targets with headers over the limit.
+    over_limit: int = 0
+    #: Worst request targets in descending header size order.
+    worst: list[RequestTarget] = field(default_factory=list)
+    #: Cookies contributing the most bytes over all request targets.
+    largest_cookies: list[CookieContribution] = field(default_factory=list)
+
+
+def get_header_size(pair_sizes: Iterable[int]) -> int:
+    """
+    Get the size of a Cookie header holding name=value pairs.
+
+    Args:
+        pair_sizes: name=value pair sizes in bytes
+
+    Returns:
+        header size in bytes, including the "Cookie: " prefix, or 0 without pairs
+    """
+    count = 0
+    total = 0
+    for pair_size in pair_sizes:
+        count += 1
+        total += pair_size
+    if not count:
+        return 0
+    return len(HEADER_PREFIX) + total + len(PAIR_SEPARATOR) * (count - 1)
+
+
+def is_path_match(request_path: str, cookie_path: str) -> bool:
+    """
+    Check if a cookie path matches a request path (RFC 6265 section 5.1.4).
+
+    Args:
+        request_path: request path
+        cookie_path: cookie path, where empty means "/"
+
+    Returns:
+        True if the cookie is sent for the request path
+    """
+    cookie_path = cookie_path or '/'
+    if not request_path.startswith(cookie_path):
+        return False
+    return (len(request_path) == len(cookie_path)
+            or cookie_path.endswith('/')
+            or request_path[len(cookie_path)] == '/')
+
+
+@dataclass(slots=True)
+class _SentCookie:
+    # Cookie header contribution with its secure flag.
+    contribution: CookieContribution
+    secure: bool
+
+
+@dataclass
+class _DomainNode:
+    # Cookies of a domain, i.e. of "example.com" and ".example.com".
+    key: bytes
+    host: str
+    domain_cookies: list[_SentCookie] = field(default_factory=list)
+    host_cookies: list[_SentCookie] = field(default_factory=list)
+
+
+class _BloatSweep:
+    # State of the sweep over sorted cookies.
+
+    def __init__(self, limit: int, top: int, contributors: int):
+        self.report = BloatReport(limit=limit)
+        self.top = top
+        self.contributors = contributors
+        self.stack: list[_DomainNode] = []
+        # Bounded min-heaps of (sort key, order, item) tuples.
+        self.worst_heap: list[tuple] = []
+        self.cookie_heap: list[tuple] = []
+        self.order = 0
+
+    def _keep(self, heap: list[tuple], size: int, item):
+        # Keep the largest items, preferring earlier ones for equal sizes.
+        if not self.top:
+            return
+        self.order += 1
+        entry = (size, -self.order, item)
+        if len(heap) < self.top:
+            heappush(heap, entry)
+        elif entry > heap[0]:
+            heappushpop(heap, entry)
+
+    def _finish_cookies(self, sent_cookies: list[_SentCookie]):
+        for sent_cookie in sent_cookies:
+            contribution = sent_cookie.contribution
+            if contribution.targets:
+                self._keep(self.cookie_heap, contribution.total_bytes, contribution)
+
+    def add_host(self, node: _DomainNode):
+        """Add request targets for the host of the node on top of the stack."""
+        applicable = list(node.host_cookies)
+        for enclosing_node in self.stack:
+            applicable.extend(enclosing_node.domain_cookies)
+        if not applicable:
+            return
+        self.report.hosts += 1
+        for path in sorted({sent_cookie.contribution.path or '/' for sent_cookie in applicable}):
+            sent_cookies = [sent_cookie for sent_cookie in applicable
+                            if is_path_match(path, sent_cookie.contribution.path)]
+            header_size = get_header_size(sent_cookie.contribution.bytes for sent_cookie in sent_cookies)
+            for sent_cookie in sent_cookies:
+                sent_cookie.contribution.targets += 1
+                sent_cookie.contribution.total_bytes += sent_cookie.contribution.bytes
+            self.report.targets += 1
+            if header_size > self.report.limit:
+                self.report.over_limit += 1
+            if self.top and (len(self.worst_heap) < self.top or header_size > self.worst_heap[0][0]):
+                target = RequestTarget(
+                    host=node.host,
+                    path=path,
+                    count=len(sent_cookies),
+                    bytes=header_size,
+                    http_bytes=get_header_size(sent_cookie.contribution.bytes for sent_cookie in sent_cookies
+                                               if not sent_cookie.secure),
+                    contributors=[sent_cookie.contribution for sent_cookie in
+                                  nlargest(self.contributors, sent_cookies,
+                                           key=lambda sent_cookie: sent_cookie.contribution.bytes)],
+                )
+                self._keep(self.worst_heap, header_size, target)
+        self._finish_cookies(node.host_cookies)
+
+    def enter(self, key: bytes, host: str) -> _DomainNode:
+        """Push a node, after popping nodes that don't enclose it."""
+        while self.stack and not key.startswith(self.stack[-1].key + b'\x01'):
+            self._finish_cookies(self.stack.pop().domain_cookies)
+        node = _DomainNode(key, host)
+        self.stack.append(node)
+        return node
+
+    def finish(self) -> BloatReport:
+        """Finish the sweep and return the report."""
+        while self.stack:
+            self._finish_cookies(self.stack.pop().domain_cookies)
+        self.report.worst = [item for _size, _order, item in sorted(self.worst_heap, reverse=True)]
+        self.report.largest_cookies = [item for _size, _order, item in sorted(self.cookie_heap, reverse=True)]
+        return self.report
+
+
+def compute_bloat(cookies: Iterable[CookieData],
+                  limit: int = DEFAULT_HEADER_LIMIT,
+                  top: int = DEFAULT_BLOAT_TARGETS,
+                  contributors: int = DEFAULT_BLOAT_CONTRIBUTORS,
+                  now: int = None,
+                  ) -> BloatReport:
+    """
+    Compute Cookie header sizes for every host and path in one sweep.
+
+    Domains starting with "." are domain cookies, which are also sent to
+    subdomains. Other domains are host-only cookies. Expired cookies are
+    ignored. Values are sized as written to cookie jars, i.e. as stored.
+
+    Args:
+        cookies: cookies sorted by BLOAT_SORT_FIELDS
+        limit: header size limit in bytes for counting oversized headers
+        top: number of worst request targets and largest cookies to report
+        contributors: number of largest cookies to report per request target
+        now: optional current timestamp (default: current time)
+
+    Returns:
+        bloat report
+    """
+    now = int(time()) if now is None else now
+    sweep = _BloatSweep(limit, top, contributors)
+    node: _DomainNode | None = None
+    for cookie in cookies:
+        if cookie.expires and cookie.expires <= now:
+            continue
+        key = get_site_key(cookie.domain)
+        if node is None or key != node.key:
+            if node is not None:
+                sweep.add_host(node)
+            node = sweep.enter(key, cookie.domain.lstrip('.').lower())
+        value = cookie.get_jar_value()
+        pair_size = len(cookie.name) + 1 + len(value)
+        if not (cookie.name.isascii() and value.isascii()):
+            pair_size = len(f'{cookie.name}={value}'.encode('utf-8', 'surrogatepass'))
+        sent_cookie = _SentCookie(CookieContribution(cookie.domain, cookie.name, cookie.path, pair_size),
+                                  cookie.secure)
+        if cookie.domain.startswith('.'):
+            node.domain_cookies.append(sent_cookie)
+        else:
+            node.host_cookies.append(sent_cookie)
+    if node is not None:
+        sweep.add_host(node)
+    return sweep.finish()
+
+
+def _display_table(columns: list[str], rows: list[list], details: list[list[str]] = None):
+    # Display a table with left-aligned text and right-aligned numbers, and
+    # optional indented detail lines below each row.
+    text_rows = [[str(value) for value in row] for row in rows]
+    widths = [max([len(column)] + [len(row[idx]) for row in text_rows]) for idx, column in enumerate(columns)]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row_idx, row in enumerate(rows):
+        print('  '.join(
+            text.rjust(width) if isinstance(value, int) else text.ljust(width)
+            for value, text, width in zip(row, text_rows[row_idx], widths)
+        ))
+        if details:
+            for line in details[row_idx]:
+                print(f'    {line}')
+
+
+def display_bloat(report: BloatReport, heading: str = None):
+    """
+    Display a bloat report as text.
+
+    Args:
+        report: bloat report
+        heading: optional heading to display
+    """
+    if heading:
+        print(f'=== {heading} ===')
+    print(f'hosts: {report.hosts}  targets: {report.targets}'
+          f'  over {report.limit} bytes: {report.over_limit}')
+    print('')
+    print('worst targets:')
+    _display_table(
+        ['host', 'path', 'cookies', 'bytes', 'http_bytes'],
+        [[target.host, target.path, target.count, target.bytes, target.http_bytes] for target in report.worst],
+        [[f'{contribution.bytes:>6}  {contribution.name}  ({contribution.domain} {contribution.path})'
+          for contribution in target.contributors]
+         for target in report.worst],
+    )
+    print('')
+    print('largest cookies:')
+    _display_table(
+        ['name', 'domain', 'path', 'bytes', 'targets', 'total_bytes'],
+        [[contribution.name, contribution.domain, contribution.path, contribution.bytes,
+          contribution.targets, contribution.total_bytes]
+         for contribution in report.largest_cookies],
+    )
+
+
+def display_bloat_json(report: BloatReport, source: str = None):
+    """
+    Display a bloat report as a JSON document.
+
+    Args:
+        report: bloat report
+        source: optional source description
+    """
+    print(json.dumps({'source': source, **asdict(report)}, indent=2))
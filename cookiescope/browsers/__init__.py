@@ -23,4 +23,6 @@ from .chrome_generic import GenericChromeBrowser
 from .chromium import ChromiumBrowser
 from .edge import EdgeBrowser
 from .firefox import FirefoxBrowser
+from .jsonl import JSONLBrowser
+from .netscape import NetscapeJarBrowser
 from .safari import SafariBrowser
@@ -19,12 +19,19 @@
 Cookiescope base browser class.
 """
 
+import os
 import sys
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Iterable, Self
 
+from cookiescope.analytics import ColumnRow
+from cookiescope.archives import ArchiveMember
 from cookiescope.cookies import CookieData, FilterBy, SortBy
+from cookiescope.metrics import METRICS
+from cookiescope.pagination import CookiesPage, get_cookies_page, get_page_sort_fields
+from cookiescope.stats import GroupStats, StatsAggregator
+from cookiescope.utility import abort, expand_home
 
 #: Mapping of platform to possible file locations.
 LocationMap = dict[str, Iterable[str | Path]]
@@ -39,10 +46,21 @@ class BrowserBase(ABC):
         """
         Browser base constructor.
 
+        Counts the store and its size in the operational metrics.
+
         Args:
             file_path: cookies file or database path
         """
         self.file_path = file_path
+        METRICS.increment('stores_opened_total', browser=self.name)
+        try:
+            if isinstance(file_path, ArchiveMember):
+                size = len(file_path.read_bytes())
+            else:
+                size = os.stat(file_path).st_size
+        except OSError:
+            size = 0
+        METRICS.increment('store_bytes_total', size, browser=self.name)
 
     @classmethod
     @abstractmethod
@@ -60,44 +78,163 @@ class BrowserBase(ABC):
 
     @classmethod
     @abstractmethod
-    def find_cookies(cls, profile: str | None) -> Path | None:
+    def find_cookies(cls, profile: str | None, home: Path = None, platform: str = None) -> Path | None:
         """
         Required method to find the cookies file.
 
         Args:
             profile: optional profile name
+            home: optional home directory replacing "~" (default: current user home)
+            platform: optional platform name (default: current platform)
 
         Returns:
             cookies file path if found
         """
         ...
 
+    @classmethod
+    def find_all_cookies(cls, home: Path = None, platform: str = None) -> list[tuple[str | None, Path]]:
+        """
+        Find cookies files for all profiles.
+
+        The default implementation only finds the default profile cookies file.
+
+        Args:
+            home: optional home directory replacing "~" (default: current user home)
+            platform: optional platform name (default: current platform)
+
+        Returns:
+            (profile name or None for the default profile, cookies file path) pairs
+        """
+        path = cls.find_cookies(None, home=home, platform=platform)
+        return [(None, path)] if path is not None else []
+
     @abstractmethod
-    def generate_cookies(self, filter_by: FilterBy, sort_by: SortBy) -> Iterable[CookieData]:
+    def generate_cookies(self,
+                         filter_by: FilterBy,
+                         sort_by: SortBy,
+                         sort_memory_limit: int | None = None,
+                         jobs: int | None = None,
+                         ) -> Iterable[CookieData]:
         """
         Required method to generate cookies with optional filtering and sorting.
 
         Args:
             filter_by: filters as a mapping of attribute names to filtered values
             sort_by: sort by named attributes in order provided
+            sort_memory_limit: optional sort memory budget in bytes
+            jobs: optional number of worker processes, for sources that support parallel scanning
         """
         ...
 
+    def generate_stats(self,
+                       group_by: str,
+                       filter_by: FilterBy,
+                       value_sizes: bool,
+                       ) -> Iterable[GroupStats]:
+        """
+        Generate aggregate statistics grouped by a cookie field.
+
+        The default implementation aggregates generated cookies. Subclasses may
+        override it to aggregate more efficiently.
+
+        Args:
+            group_by: grouping field name
+            filter_by: filters as a mapping of attribute names to filtered values
+            value_sizes: collect value sizes if True
+
+        Returns:
+            group statistics ordered by key
+        """
+        aggregator = StatsAggregator(group_by, value_sizes)
+        aggregator.add_all(self.generate_cookies(filter_by, None))
+        return aggregator.generate_stats()
+
+    def generate_column_rows(self, filter_by: FilterBy, value_sizes: bool) -> Iterable[ColumnRow]:
+        """
+        Generate (domain, expires, created, value size) column rows for analytics.
+
+        The default implementation converts generated cookies. Subclasses may
+        override it to read columns more efficiently.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            value_sizes: provide UTF-8 stored value sizes if True, otherwise None
+
+        Returns:
+            column rows
+        """
+        for cookie in self.generate_cookies(filter_by, None):
+            value_size = len(cookie.get_stored_value().encode('utf-8')) if value_sizes else None
+            yield cookie.domain, cookie.expires, cookie.created, value_size
+
+    def get_cookies_page(self,
+                         filter_by: FilterBy | None,
+                         sort_by: SortBy | None,
+                         page_size: int,
+                         page_token: str = None,
+                         ) -> CookiesPage:
+        """
+        Get one page of cookies, with a continuation token for the next page.
+
+        The default implementation scans generated cookies, using positions to
+        break ties. Subclasses may override it to seek more efficiently.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            sort_by: optional sort field names in priority order
+            page_size: maximum cookies per page
+            page_token: optional continuation token from the previous page
+
+        Returns:
+            cookie page
+        """
+        return get_cookies_page(self.generate_cookies(filter_by, None), get_page_sort_fields(sort_by),
+                                filter_by, page_size, page_token)
+
+    def purge_cookies(self,
+                      filter_by: FilterBy | None,
+                      expired: bool = False,
+                      vacuum: bool = False,
+                      dry_run: bool = False,
+                      batch_size: int = None,
+                      ) -> int:
+        """
+        Delete cookies matching filters and/or expiration.
+
+        The default implementation aborts, because the cookie store is read-only.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            expired: only purge expired cookies if True
+            vacuum: compact the store after purging if True
+            dry_run: count matching cookies without deleting if True
+            batch_size: optional maximum rows per delete operation
+
+        Returns:
+            purged cookie count, or matching cookie count for a dry run
+        """
+        abort(f'Purging {self.name} cookies is not supported.')
+
     @classmethod
-    def find_file(cls, location_map: LocationMap) -> Path | None:
+    def find_file(cls, location_map: LocationMap, home: Path = None, platform: str = None) -> Path | None:
         """
         Utility method to search for a file given multiple possible platform-specific paths.
 
         Args:
             location_map: possible file locations mapped by platform
+            home: optional home directory replacing "~" (default: current user home)
+            platform: optional platform name (default: current platform)
 
         Returns:
             found path
         """
-        if sys.platform not in location_map:
+        if platform is None:
+            platform = sys.platform
+        if platform not in location_map:
             return None
-        for path in location_map[sys.platform]:
-            path = Path(path).expanduser()
+        for path in location_map[platform]:
+            path = expand_home(path, home)
             if path.is_file():
                 return path
         return None
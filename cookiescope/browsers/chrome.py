@@ -31,6 +31,7 @@ class ChromeBrowser(GenericChromeBrowser):
             '~/Library/Application Support/Google/Chrome/Default/Cookies',
         ],
         'linux': [
+            '~/.config/google-chrome/Default/Cookies',
             '~/.config/chrome/Cookies',
         ],
         'win32': [
@@ -48,77 +48,179 @@ Cookiescope generic Chrome browser support.
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import json
 import sys
-from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, Self
+from typing import Callable, Iterable, Self
+from urllib.parse import unquote
 
-from cookiescope.cookies import CookieData, FilterBy, SortBy
-from cookiescope.extractors import SQLiteCookiesBase
+from cookiescope.analytics import ColumnRow
+from cookiescope.cookies import CookieData, CookieView, FilterBy, SortBy
+from cookiescope.decryptors.base import DecryptorBase
+from cookiescope.discovery import PROFILE_CACHE
+from cookiescope.extractors import DEFAULT_PURGE_BATCH_SIZE, SQLiteCookiesBase
+from cookiescope.metrics import METRICS
+from cookiescope.pagination import CookiesPage
+from cookiescope.profiling import PROFILER
+from cookiescope.stats import GroupStats
+from cookiescope.utility import expand_home
 from .base import BrowserBase, LocationMap
 
+#: Default profile folder name, which location map paths pass through.
+DEFAULT_PROFILE_FOLDER = 'Default'
+#: Profile configuration file name in the user data folder.
+LOCAL_STATE_FILE_NAME = 'Local State'
+#: Cookies database paths relative to a profile folder, in order of preference.
+PROFILE_COOKIES_PATHS = [Path('Network') / 'Cookies', Path('Cookies')]
+
+
+def parse_local_state(path: Path) -> dict[str, str] | None:
+    """
+    Parse profile folder and display names from a Chrome "Local State" file.
+
+    Args:
+        path: "Local State" file path
+
+    Returns:
+        display names mapped by profile folder name, or None if unparseable
+    """
+    try:
+        with path.open(encoding='utf-8') as local_state_file:
+            local_state = json.load(local_state_file)
+        info_cache = local_state['profile']['info_cache']
+        return {folder: info.get('name') or folder for folder, info in info_cache.items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
 
 class GenericChromeSQLiteCookies(SQLiteCookiesBase):
 
-    #: Required database row named tuple.
-    DatabaseRow = namedtuple(
-        'DatabaseRow',
-        [
-            'host_key',
-            'name',
-            'value',
-            'encrypted_value',
-            'path',
-            'has_expires',
-            'expires_utc',
-            'creation_utc',
-            'is_httponly',
-            'is_secure',
-        ],
-    )
+    #: Chrome timestamps are microseconds since 1601.
+    field_expressions = {
+        'domain': 'host_key',
+        'name': 'name',
+        'path': 'path',
+        'value': 'value',
+        'http_only': 'is_httponly',
+        'secure': 'is_secure',
+        'expires': 'CASE WHEN has_expires THEN expires_utc / 1000000 - 11644473600 ELSE 0 END',
+        'created': 'creation_utc / 1000000 - 11644473600',
+    }
 
-    # Ignore unresolved references due to excluded platform-specific code.
-    # noinspection PyUnresolvedReferences
-    def __init__(self, path: Path, name: str):
+    encrypted_value_column = 'encrypted_value'
+
+    def __init__(self, path: Path, name: str, decryptor: DecryptorBase = None):
         """
         SQLiteCookies constructor.
 
+        The platform decryptor is created when first needed, because it may
+        require keyring access. Scans start creating it in a background thread,
+        once they know that matching rows are encrypted.
+
         Args:
             path: cookies database file path
             name: browser name
+            decryptor: optional decryptor to use instead of the platform decryptor
+        """
+        self.browser_name = name
+        self._decryptor = decryptor
+        self._decryptor_future: Future | None = None
+        super().__init__(path, 'cookies')
+
+    @property
+    def decryptor(self) -> DecryptorBase:
+        """
+        Decryptor property, created on first access.
+
+        Returns:
+            decryptor
+        """
+        if self._decryptor is None:
+            if self._decryptor_future is not None:
+                # Re-raises any exception, including SystemExit from abort().
+                self._decryptor = self._decryptor_future.result()
+                self._decryptor_future = None
+            else:
+                self._decryptor = self.create_decryptor()
+        return self._decryptor
+
+    # Ignore unresolved references due to excluded platform-specific code.
+    # noinspection PyUnresolvedReferences
+    def create_decryptor(self) -> DecryptorBase:
+        """
+        Create the platform decryptor.
+
+        Returns:
+            platform decryptor
         """
         if sys.platform == 'darwin':
             from cookiescope.decryptors.macos import MacOSDecryptor
-            self.decryptor = MacOSDecryptor(name)
+            decryptor = MacOSDecryptor(self.browser_name)
         elif sys.platform == 'linux':
             from cookiescope.decryptors.linux import LinuxDecryptor
-            self.decryptor = LinuxDecryptor(name)
+            decryptor = LinuxDecryptor(self.browser_name)
         elif sys.platform == 'win32':
             from cookiescope.decryptors.windows import WindowsDecryptor
             # Windows decryption needs to open the state file, which is 3 directories
             # above the cookies database for Chrome-based browsers.
-            state_file = path.parent.parent.parent / 'Local State'
-            self.decryptor = WindowsDecryptor(name, state_file)
+            state_file = self.path.parent.parent.parent / 'Local State'
+            decryptor = WindowsDecryptor(self.browser_name, state_file)
         else:
-            raise ValueError(f'Unsupported platform for {name} browser: {sys.platform}')
-        super().__init__(path, 'cookies')
+            raise ValueError(f'Unsupported platform for {self.browser_name} browser: {sys.platform}')
+        if PROFILER.enabled:
+            decryptor.decrypt = PROFILER.function('decrypt', decryptor.decrypt, count_bytes=True)
+        return decryptor
 
-    def canonicalize_row(self, row: DatabaseRow) -> SQLiteCookiesBase.CanonicalRow:
-        if row.encrypted_value:
-            value = self.decryptor.decrypt(row.encrypted_value)
-        else:
-            value = row.value
-        return SQLiteCookiesBase.CanonicalRow(
-            domain=row.host_key,
-            name=row.name,
-            value=value,
-            path=row.path,
-            has_expires=row.has_expires,
-            expires_utc=row.expires_utc / 1000000 - 11644473600,
-            creation_utc=row.creation_utc / 1000000 - 11644473600,
-            httponly=row.is_httponly,
-            secure=row.is_secure,
-        )
+    def prepare_decryption(self):
+        """Override to create the decryptor, or wait for background creation."""
+        _decryptor = self.decryptor
+
+    def start_decryption(self):
+        """Override to create the decryptor in a background thread."""
+        if self._decryptor is None and self._decryptor_future is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='decryptor')
+            self._decryptor_future = executor.submit(self.create_decryptor)
+            # The thread exits after creating the decryptor.
+            executor.shutdown(wait=False)
+
+    def is_decryption_ready(self) -> bool:
+        """Override to check for a created decryptor or a finished background creation."""
+        if self._decryptor is not None:
+            return True
+        return self._decryptor_future is not None and self._decryptor_future.done()
+
+    def get_cookie_factory(self, unquote_value: Callable[[str], str] = unquote) -> Callable[[tuple], CookieData]:
+        """Override to convert rows with encrypted values to cookies that decrypt them when first read."""
+        # Bound lazily, because the decryptor may need keyring access.
+        decrypt_value = self.decrypt_value
+
+        def _make_cookie(row: tuple) -> CookieData:
+            domain, name, path, value, http_only, secure, expires, created, encrypted_value = row
+            if encrypted_value:
+                return CookieView(domain, name, path, http_only == 1, secure == 1, expires, created,
+                                  encrypted_value, decrypt_value, unquote_value)
+            return CookieView(domain, name, path, http_only == 1, secure == 1, expires, created,
+                              value, None, unquote_value)
+        return _make_cookie
+
+    def decrypt_value(self, encrypted_value: bytes) -> str:
+        """
+        Decrypt a value with the platform decryptor, counting successes and failures.
+
+        Args:
+            encrypted_value: encrypted value
+
+        Returns:
+            decrypted value
+        """
+        try:
+            value = self.decryptor.decrypt(encrypted_value)
+        except Exception:
+            METRICS.increment('decrypt_failures_total', browser=self.browser_name)
+            raise
+        METRICS.increment('values_decrypted_total', browser=self.browser_name)
+        return value
 
 
 class GenericChromeBrowser(BrowserBase):
@@ -126,7 +228,7 @@ class GenericChromeBrowser(BrowserBase):
 
     name = 'Chrome (generic)'
 
-    # Should be overridden.
+    # Should be overridden, except for cookies files opened by path.
     db_paths: LocationMap = {}
 
     def __init__(self, file_path: Path, cookies_db: GenericChromeSQLiteCookies):
@@ -136,7 +238,6 @@ class GenericChromeBrowser(BrowserBase):
         Args:
             file_path: cookies file or database path
         """
-        assert self.db_paths
         super().__init__(file_path)
         self.cookies_db = cookies_db
 
@@ -149,10 +250,117 @@ class GenericChromeBrowser(BrowserBase):
         return cls(path, cookies_db)
 
     @classmethod
-    def find_cookies(cls, profile: str | None) -> Path | None:
-        """Required override to locate the cookies database."""
-        return cls.find_file(cls.db_paths)
+    def find_user_data_folders(cls, home: Path = None, platform: str = None) -> list[Path]:
+        """
+        Find user data folders, i.e. location map paths above a "Default" folder.
+
+        Args:
+            home: optional home directory replacing "~" (default: current user home)
+            platform: optional platform name (default: current platform)
+
+        Returns:
+            existing user data folder paths
+        """
+        folders: list[Path] = []
+        for db_path in cls.db_paths.get(platform or sys.platform, []):
+            parts = Path(db_path).parts
+            if DEFAULT_PROFILE_FOLDER in parts:
+                folder = expand_home(Path(*parts[:parts.index(DEFAULT_PROFILE_FOLDER)]), home)
+                if folder not in folders and folder.is_dir():
+                    folders.append(folder)
+        return folders
+
+    @classmethod
+    def find_profiles(cls, home: Path = None, platform: str = None) -> list[tuple[str, str, Path]]:
+        """
+        Find every profile with a cookies database.
+
+        Profiles come from the "Local State" profile information cache, which is
+        parsed through the profile cache. Without it only "Default" is checked.
+
+        Args:
+            home: optional home directory replacing "~" (default: current user home)
+            platform: optional platform name (default: current platform)
+
+        Returns:
+            (profile folder name, display name, cookies database path) tuples
+        """
+        found: list[tuple[str, str, Path]] = []
+        for user_data_folder in cls.find_user_data_folders(home=home, platform=platform):
+            profiles = PROFILE_CACHE.get('chrome-local-state',
+                                         user_data_folder / LOCAL_STATE_FILE_NAME,
+                                         parse_local_state)
+            if not profiles:
+                profiles = {DEFAULT_PROFILE_FOLDER: DEFAULT_PROFILE_FOLDER}
+            for folder, display_name in profiles.items():
+                for cookies_path in PROFILE_COOKIES_PATHS:
+                    db_path = user_data_folder / folder / cookies_path
+                    if db_path.is_file():
+                        found.append((folder, display_name, db_path))
+                        break
+        return found
+
+    @classmethod
+    def find_cookies(cls, profile: str | None, home: Path = None, platform: str = None) -> Path | None:
+        """Required override to locate the cookies database by profile folder or display name."""
+        if not profile:
+            db_path = cls.find_file(cls.db_paths, home=home, platform=platform)
+            if db_path is not None:
+                return db_path
+            profile = DEFAULT_PROFILE_FOLDER
+        profile = profile.lower()
+        for folder, display_name, db_path in cls.find_profiles(home=home, platform=platform):
+            if profile in (folder.lower(), display_name.lower()):
+                return db_path
+        return None
 
-    def generate_cookies(self, filter_by: FilterBy, sort_by: SortBy) -> Iterable[CookieData]:
+    @classmethod
+    def find_all_cookies(cls, home: Path = None, platform: str = None) -> list[tuple[str | None, Path]]:
+        """Override to find cookies databases for every profile."""
+        found = [(None if folder == DEFAULT_PROFILE_FOLDER else folder, db_path)
+                 for folder, _display_name, db_path in cls.find_profiles(home=home, platform=platform)]
+        if not found:
+            return super().find_all_cookies(home=home, platform=platform)
+        return found
+
+    def generate_cookies(self,
+                         filter_by: FilterBy,
+                         sort_by: SortBy,
+                         sort_memory_limit: int | None = None,
+                         jobs: int | None = None,
+                         ) -> Iterable[CookieData]:
         """Required override to generate cookies."""
-        return self.cookies_db.generate_cookies(filter_by, sort_by)
+        return self.cookies_db.generate_cookies(filter_by, sort_by, sort_memory_limit, jobs)
+
+    def generate_stats(self,
+                       group_by: str,
+                       filter_by: FilterBy,
+                       value_sizes: bool,
+                       ) -> Iterable[GroupStats]:
+        """Override to aggregate statistics inside SQLite."""
+        return self.cookies_db.generate_stats(group_by, filter_by, value_sizes)
+
+    def generate_column_rows(self, filter_by: FilterBy, value_sizes: bool) -> Iterable[ColumnRow]:
+        """Override to read analytics columns inside SQLite."""
+        return self.cookies_db.generate_column_rows(filter_by, value_sizes)
+
+    def get_cookies_page(self,
+                         filter_by: FilterBy | None,
+                         sort_by: SortBy | None,
+                         page_size: int,
+                         page_token: str = None,
+                         ) -> CookiesPage:
+        """Override to page through cookies with keyset queries."""
+        return self.cookies_db.get_cookies_page(filter_by, sort_by, page_size, page_token)
+
+    def purge_cookies(self,
+                      filter_by: FilterBy | None,
+                      expired: bool = False,
+                      vacuum: bool = False,
+                      dry_run: bool = False,
+                      batch_size: int = None,
+                      ) -> int:
+        """Override to purge cookies with SQL DELETE statements."""
+        if batch_size is None:
+            batch_size = DEFAULT_PURGE_BATCH_SIZE
+        return self.cookies_db.purge_cookies(filter_by, expired, vacuum, dry_run, batch_size)
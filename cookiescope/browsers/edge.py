@@ -31,6 +31,7 @@ class EdgeBrowser(GenericChromeBrowser):
             '~/Library/Application Support/Microsoft Edge/Default/Cookies',
         ],
         'linux': [
+            '~/.config/microsoft-edge/Default/Cookies',
             '~/.config/edge/Default/Cookies',
         ],
         'win32': [
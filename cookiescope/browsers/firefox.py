@@ -19,17 +19,40 @@
 Cookiescope Firefox browser support.
 """
 
-from collections import namedtuple
+import configparser
 from configparser import ConfigParser
 from pathlib import Path
 from typing import Iterable, Self
 
+from cookiescope.analytics import ColumnRow
 from cookiescope.cookies import CookieData, FilterBy, SortBy
-from cookiescope.extractors import SQLiteCookiesBase
+from cookiescope.discovery import PROFILE_CACHE
+from cookiescope.extractors import DEFAULT_PURGE_BATCH_SIZE, SQLiteCookiesBase
+from cookiescope.pagination import CookiesPage
+from cookiescope.stats import GroupStats
 from cookiescope.utility import error
 from .base import BrowserBase, LocationMap
 
 
+def parse_profiles_ini(path: Path) -> dict[str, dict[str, str]] | None:
+    """
+    Parse a Firefox "profiles.ini" file into sections.
+
+    Args:
+        path: "profiles.ini" file path
+
+    Returns:
+        section options mapped by section name, or None if unparseable
+    """
+    profiles = ConfigParser(interpolation=None)
+    try:
+        if not profiles.read(path):
+            return None
+    except (UnicodeDecodeError, configparser.Error):
+        return None
+    return {section: dict(profiles.items(section, raw=True)) for section in profiles.sections()}
+
+
 class FirefoxBrowser(BrowserBase):
     """Firefox browser implementation."""
 
@@ -49,19 +72,17 @@ class FirefoxBrowser(BrowserBase):
 
     class SQLiteCookies(SQLiteCookiesBase):
 
-        DatabaseRow = namedtuple(
-            'DatabaseRow',
-            [
-                'host',
-                'name',
-                'value',
-                'path',
-                'expiry',
-                'creationTime',
-                'isHttpOnly',
-                'isSecure',
-            ],
-        )
+        #: Firefox creation times are microseconds since 1970.
+        field_expressions = {
+            'domain': 'host',
+            'name': 'name',
+            'path': 'path',
+            'value': 'value',
+            'http_only': 'isHttpOnly',
+            'secure': 'isSecure',
+            'expires': 'expiry',
+            'created': 'creationTime / 1000000',
+        }
 
         def __init__(self, path: Path):
             """
@@ -72,19 +93,6 @@ class FirefoxBrowser(BrowserBase):
             """
             super().__init__(path, 'moz_cookies')
 
-        def canonicalize_row(self, row: DatabaseRow) -> SQLiteCookiesBase.CanonicalRow:
-            return SQLiteCookiesBase.CanonicalRow(
-                domain=row.host,
-                name=row.name,
-                value=row.value,
-                path=row.path,
-                has_expires=row.expiry,
-                expires_utc=row.expiry,
-                creation_utc=row.creationTime / 1000000,
-                httponly=row.isHttpOnly,
-                secure=row.isSecure,
-            )
-
     def __init__(self, file_path: Path, cookies_db: SQLiteCookies):
         """
         Browser base constructor.
@@ -104,30 +112,69 @@ class FirefoxBrowser(BrowserBase):
         return cls(path, cookies_db)
 
     @classmethod
-    def find_cookies(cls, profile: str | None) -> Path | None:
+    def read_profiles(cls,
+                      home: Path = None,
+                      platform: str = None,
+                      ) -> tuple[Path, ConfigParser] | tuple[None, None]:
+        """
+        Find and parse the Firefox profiles configuration.
+
+        Args:
+            home: optional home directory replacing "~" (default: current user home)
+            platform: optional platform name (default: current platform)
+
+        Returns:
+            (profiles.ini path, parsed configuration) or (None, None) if unavailable
+        """
+        profiles_ini_path = cls.find_file(cls.profiles_ini_paths, home=home, platform=platform)
+        if profiles_ini_path is None:
+            return None, None
+        sections = PROFILE_CACHE.get('firefox-profiles-ini', profiles_ini_path, parse_profiles_ini)
+        if sections is None:
+            error(f'Unable to parse Firefox profiles configuration: {profiles_ini_path}')
+            return None, None
+        profiles = ConfigParser(interpolation=None)
+        profiles.read_dict(sections)
+        return profiles_ini_path, profiles
+
+    @classmethod
+    def get_profile_folder(cls, profiles_ini_path: Path, profiles: ConfigParser, section: str) -> Path | None:
+        """
+        Get a profile folder path from a profiles configuration section.
+
+        Args:
+            profiles_ini_path: profiles.ini path
+            profiles: parsed profiles configuration
+            section: profile section name
+
+        Returns:
+            profile folder path or None if the section has no path
+        """
+        profile_folder = profiles.get(section, 'Path', fallback=None)
+        if not profile_folder:
+            return None
+        if profiles.get(section, 'IsRelative', fallback=None) == '1':
+            return profiles_ini_path.parent / profile_folder
+        return Path(profile_folder)
+
+    @classmethod
+    def find_cookies(cls, profile: str | None, home: Path = None, platform: str = None) -> Path | None:
         """Required override to find the cookies database file."""
         # NB: Firefox seems to be a bit flakey with how it handles finding the
         # active profile. So in some cases users may need to explicitly specify
         # a profile, because the default may not actually be active.
-        profiles = ConfigParser()
-        profiles_ini_path = cls.find_file(cls.profiles_ini_paths)
-        if profiles_ini_path is None:
+        profiles_ini_path, profiles = cls.read_profiles(home=home, platform=platform)
+        if profiles is None:
             error(f'Unable to find Firefox profiles configuration.')
             return None
-        parsed_files = profiles.read(profiles_ini_path)
-        if not parsed_files:
-            error(f'Unable to parse Firefox profiles configuration: {profiles_ini_path}')
-            return None
         # Find the cookies database path.
         if profile:
             # Match specific profile.
             for section in profiles.sections():
-                if profiles.get(section, 'Name', fallback=None) == profile:
-                    cookies_db_path = profiles.get(section, 'Path', fallback=None)
-                    if cookies_db_path is not None:
-                        if profiles.get(section, 'IsRelative', fallback=None):
-                            return profiles_ini_path.parent / cookies_db_path
-                        return Path(cookies_db_path)
+                if (profiles.get(section, 'Name', fallback=None) or '').lower() == profile.lower():
+                    profile_folder = cls.get_profile_folder(profiles_ini_path, profiles, section)
+                    if profile_folder is not None:
+                        return profile_folder / 'cookies.sqlite'
                     return None
         # Otherwise look for default profile with cookie file.
         for section in profiles.sections():
@@ -141,20 +188,67 @@ class FirefoxBrowser(BrowserBase):
                     if cookies_db_path.is_file():
                         return cookies_db_path
                     return profiles_ini_path.parent / cookies_db_path
-                profile_folder = profiles.get(section, 'Path', fallback=None)
+                profile_folder = cls.get_profile_folder(profiles_ini_path, profiles, section)
                 if profile_folder:
-                    if profiles.get(section, 'IsRelative', fallback=None):
-                        profile_folder = profiles_ini_path.parent / profile_folder
-                    else:
-                        profile_folder = Path(profile_folder)
                     cookies_db_path = profile_folder / 'cookies.sqlite'
                     if cookies_db_path.is_file():
                         return cookies_db_path
         return None
 
+    @classmethod
+    def find_all_cookies(cls, home: Path = None, platform: str = None) -> list[tuple[str | None, Path]]:
+        """Override to find cookies databases for every configured profile."""
+        profiles_ini_path, profiles = cls.read_profiles(home=home, platform=platform)
+        if profiles is None:
+            return []
+        found: list[tuple[str | None, Path]] = []
+        for section in profiles.sections():
+            profile_folder = cls.get_profile_folder(profiles_ini_path, profiles, section)
+            if profile_folder is None:
+                continue
+            cookies_db_path = profile_folder / 'cookies.sqlite'
+            if cookies_db_path.is_file():
+                found.append((profiles.get(section, 'Name', fallback=section), cookies_db_path))
+        return found
+
     def generate_cookies(self,
                          filter_by: FilterBy,
                          sort_by: SortBy,
+                         sort_memory_limit: int | None = None,
+                         jobs: int | None = None,
                          ) -> Iterable[CookieData]:
         """Required override to generate cookies."""
-        return self.cookies_db.generate_cookies(filter_by, sort_by)
+        return self.cookies_db.generate_cookies(filter_by, sort_by, sort_memory_limit, jobs)
+
+    def generate_stats(self,
+                       group_by: str,
+                       filter_by: FilterBy,
+                       value_sizes: bool,
+                       ) -> Iterable[GroupStats]:
+        """Override to aggregate statistics inside SQLite."""
+        return self.cookies_db.generate_stats(group_by, filter_by, value_sizes)
+
+    def generate_column_rows(self, filter_by: FilterBy, value_sizes: bool) -> Iterable[ColumnRow]:
+        """Override to read analytics columns inside SQLite."""
+        return self.cookies_db.generate_column_rows(filter_by, value_sizes)
+
+    def get_cookies_page(self,
+                         filter_by: FilterBy | None,
+                         sort_by: SortBy | None,
+                         page_size: int,
+                         page_token: str = None,
+                         ) -> CookiesPage:
+        """Override to page through cookies with keyset queries."""
+        return self.cookies_db.get_cookies_page(filter_by, sort_by, page_size, page_token)
+
+    def purge_cookies(self,
+                      filter_by: FilterBy | None,
+                      expired: bool = False,
+                      vacuum: bool = False,
+                      dry_run: bool = False,
+                      batch_size: int = None,
+                      ) -> int:
+        """Override to purge cookies with SQL DELETE statements."""
+        if batch_size is None:
+            batch_size = DEFAULT_PURGE_BATCH_SIZE
+        return self.cookies_db.purge_cookies(filter_by, expired, vacuum, dry_run, batch_size)
@@ -0,0 +1,55 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope Netscape cookie jar file support.
+"""
+
+from pathlib import Path
+from typing import Iterable, Self
+
+from cookiescope.cookies import CookieData, FilterBy, SortBy, filter_cookies, sort_cookies
+from cookiescope.extractors import generate_cookie_jar_cookies, is_cookie_jar_file
+from cookiescope.profiling import PROFILER
+from .base import BrowserBase
+
+
+class NetscapeJarBrowser(BrowserBase):
+    """Netscape cookie jar file implementation, e.g. for archived exports."""
+
+    name = 'Netscape cookie jar'
+
+    @classmethod
+    def from_file(cls, path: Path) -> Self | None:
+        """Required conditional factory method."""
+        return cls(path) if is_cookie_jar_file(path) else None
+
+    @classmethod
+    def find_cookies(cls, profile: str | None, home: Path = None, platform: str = None) -> Path | None:
+        """Required method to locate the cookies file, which only exists as an explicit path."""
+        return None
+
+    def generate_cookies(self,
+                         filter_by: FilterBy,
+                         sort_by: SortBy,
+                         sort_memory_limit: int | None = None,
+                         jobs: int | None = None,
+                         ) -> Iterable[CookieData]:
+        """Required override: query cookies with optional filtering and sorting."""
+        cookies = PROFILER.iterate('jar_parse', generate_cookie_jar_cookies(self.file_path))
+        filtered_cookies = filter_cookies(cookies, filter_by)
+        return sort_cookies(filtered_cookies, sort_by, sort_memory_limit)
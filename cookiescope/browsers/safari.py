@@ -21,11 +21,25 @@
 Cookiescope Safari browser support.
 """
 
+import os
 from pathlib import Path
+from tempfile import mkstemp
+from time import time
 from typing import Iterable, Self
 
-from cookiescope.extractors import generate_binary_cookies, is_binary_cookies_file
+from cookiescope.analytics import ColumnRow
+from cookiescope.archives import ArchiveMember
+from cookiescope.extractors import (
+    generate_binary_cookie_columns,
+    generate_binary_cookies,
+    generate_indexed_binary_cookies,
+    is_binary_cookies_file,
+    load_binary_cookies_index,
+    rewrite_binary_cookies,
+)
 from cookiescope.cookies import CookieData, FilterBy, SortBy, filter_cookies, sort_cookies
+from cookiescope.profiling import PROFILER
+from cookiescope.utility import replace_file
 from .base import BrowserBase, LocationMap
 
 
@@ -47,11 +61,82 @@ class SafariBrowser(BrowserBase):
         return cls(path) if is_binary_cookies_file(path) else None
 
     @classmethod
-    def find_cookies(cls, profile: str | None) -> Path | None:
+    def find_cookies(cls, profile: str | None, home: Path = None, platform: str = None) -> Path | None:
         """Required method to locate the cookies file."""
-        return cls.find_file(cls.cookies_paths)
+        return cls.find_file(cls.cookies_paths, home=home, platform=platform)
 
-    def generate_cookies(self, filter_by: FilterBy, sort_by: SortBy) -> Iterable[CookieData]:
-        """Required override: query cookies with optional filtering and sorting."""
-        filtered_cookies = filter_cookies(generate_binary_cookies(self.file_path), filter_by)
-        return sort_cookies(filtered_cookies, sort_by)
+    def generate_cookies(self,
+                         filter_by: FilterBy,
+                         sort_by: SortBy,
+                         sort_memory_limit: int | None = None,
+                         jobs: int | None = None,
+                         ) -> Iterable[CookieData]:
+        """
+        Required override: query cookies with optional filtering and sorting.
+
+        Domain and site filters on large files use the sidecar domain index to
+        decode only matching records. Archive members are always parsed in memory.
+        """
+        # Sites are part of domains, so site filter values also select domains.
+        domain_filters = [
+            [value.lower() for value in values] for name, values in filter_by or [] if name in ('domain', 'site')
+        ]
+        index = None
+        if domain_filters and not isinstance(self.file_path, ArchiveMember):
+            with PROFILER.stage('index_load'):
+                index = load_binary_cookies_index(self.file_path)
+        if index is not None:
+            cookies = generate_indexed_binary_cookies(self.file_path, index.find_record_offsets(domain_filters))
+        else:
+            cookies = generate_binary_cookies(self.file_path)
+        cookies = PROFILER.iterate('binary_parse', cookies)
+        filtered_cookies = filter_cookies(cookies, filter_by)
+        return sort_cookies(filtered_cookies, sort_by, sort_memory_limit)
+
+    def generate_column_rows(self, filter_by: FilterBy, value_sizes: bool) -> Iterable[ColumnRow]:
+        """Override to read unfiltered analytics columns from record headers."""
+        if filter_by:
+            return super().generate_column_rows(filter_by, value_sizes)
+        columns = PROFILER.iterate('binary_parse', generate_binary_cookie_columns(self.file_path))
+        if value_sizes:
+            return columns
+        return ((domain, expires, created, None) for domain, expires, created, _value_size in columns)
+
+    def purge_cookies(self,
+                      filter_by: FilterBy | None,
+                      expired: bool = False,
+                      vacuum: bool = False,
+                      dry_run: bool = False,
+                      batch_size: int = None,
+                      ) -> int:
+        """
+        Override to purge cookies by rewriting the binary cookies file.
+
+        Untouched pages are copied byte-for-byte to a temporary file that then
+        atomically replaces the original. Rewriting always compacts the file, so
+        "vacuum" and "batch_size" are ignored.
+        """
+        now = int(time())
+
+        def _purge(cookie: CookieData) -> bool:
+            if expired and not 0 < cookie.expires <= now:
+                return False
+            return any(True for _cookie in filter_cookies([cookie], filter_by))
+
+        if dry_run:
+            return sum(1 for cookie in generate_binary_cookies(self.file_path) if _purge(cookie))
+        original_stat = os.stat(self.file_path)
+        file_descriptor, temporary_path_string = mkstemp(
+            prefix=f'.{self.file_path.name}.', suffix='.purge', dir=self.file_path.parent)
+        temporary_path = Path(temporary_path_string)
+        try:
+            with PROFILER.stage('rewrite'):
+                with os.fdopen(file_descriptor, 'wb') as temporary_file:
+                    count = rewrite_binary_cookies(self.file_path, temporary_file,
+                                                   lambda cookie: not _purge(cookie))
+            with PROFILER.stage('replace'):
+                replace_file(temporary_path, self.file_path, original_stat)
+        finally:
+            if temporary_path.exists():
+                temporary_path.unlink()
+        return count
@@ -0,0 +1,221 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope lazy http.cookiejar adapter.
+
+LazyCookieJar is a CookieJar backed by a cookiescope cookie source. Nothing is
+read when it is created. Cookies are looked up, decrypted, and converted only for
+the hosts that requests are made to, e.g. through urllib's HTTPCookieProcessor,
+which calls add_cookie_header(). Loaded cookie domains are kept in a least
+recently used (LRU) cache, so memory is proportional to the hosts visited.
+Loaded cookies are dropped and lazily reloaded when the source file changes.
+
+Clients that don't call add_cookie_header() on the jar itself, e.g. requests
+sessions, which merge jars by iteration, can call load_host() first.
+"""
+
+import os
+from collections import OrderedDict
+from http.cookiejar import Cookie, CookieJar, CookiePolicy, request_host
+from pathlib import Path
+
+from cookiescope.archives import ArchiveMember
+from cookiescope.browsers import BrowserBase
+from cookiescope.cookies import CookieData
+from cookiescope.metrics import METRICS
+from cookiescope.sites import get_site
+
+#: Default maximum number of cookie domains kept loaded.
+DEFAULT_MAX_DOMAINS = 256
+
+#: Source file signature, i.e. (size, modification time) pairs for the file and
+#: any SQLite write-ahead log.
+SourceSignature = tuple
+
+
+def get_host_cookie_domains(host: str) -> list[str]:
+    """
+    Get the cookie domains that may apply to a host.
+
+    These are the host itself and every parent domain down to the host's site,
+    i.e. registrable domain, with and without a leading dot. Public suffixes,
+    e.g. "co.uk", can't have cookies, so they aren't included.
+
+    Args:
+        host: lower-case host name without port
+
+    Returns:
+        cookie domains
+    """
+    site = get_site(host)
+    labels = host.split('.')
+    domains = [host, f'.{host}']
+    for label_idx in range(1, len(labels)):
+        parent_domain = '.'.join(labels[label_idx:])
+        if len(parent_domain) < len(site):
+            break
+        domains.extend([parent_domain, f'.{parent_domain}'])
+    return domains
+
+
+def make_cookie(cookie: CookieData) -> Cookie:
+    """
+    Convert cookie data to an http.cookiejar Cookie.
+
+    Values are the same as in Netscape cookie jar output.
+
+    Args:
+        cookie: cookie data
+
+    Returns:
+        http.cookiejar cookie
+    """
+    domain_cookie = cookie.domain.startswith('.')
+    return Cookie(
+        version=0,
+        name=cookie.name,
+        value=cookie.get_jar_value(),
+        port=None,
+        port_specified=False,
+        domain=cookie.domain,
+        domain_specified=domain_cookie,
+        domain_initial_dot=domain_cookie,
+        path=cookie.path,
+        path_specified=True,
+        secure=cookie.secure,
+        expires=cookie.expires or None,
+        discard=not cookie.expires,
+        comment=None,
+        comment_url=None,
+        rest={'HttpOnly': None} if cookie.http_only else {},
+    )
+
+
+class LazyCookieJar(CookieJar):
+    """CookieJar that loads cookies from a cookiescope source per domain on demand."""
+
+    def __init__(self,
+                 browser: BrowserBase,
+                 policy: CookiePolicy = None,
+                 max_domains: int = DEFAULT_MAX_DOMAINS,
+                 ):
+        """
+        Lazy cookie jar constructor.
+
+        Args:
+            browser: browser object for the cookie source
+            policy: optional cookie policy (default: DefaultCookiePolicy)
+            max_domains: maximum number of cookie domains kept loaded, exceeded only
+                by the domains of a single host
+        """
+        super().__init__(policy)
+        self.browser = browser
+        self.max_domains = max_domains
+        # Loaded cookie domains, least recently used first, mapped to loaded cookies.
+        self._loaded_domains: OrderedDict[str, list[Cookie]] = OrderedDict()
+        self._source_signature = self._get_source_signature()
+
+    @classmethod
+    def from_cookie_source(cls, cookie_source: str, **kwargs) -> 'LazyCookieJar':
+        """
+        Create a lazy cookie jar for a cookie source string.
+
+        Args:
+            cookie_source: file path, archive member path, or browser[:profile] name
+            kwargs: additional constructor keyword arguments
+
+        Returns:
+            lazy cookie jar
+        """
+        # Imported here, because the command line module imports everything else.
+        from cookiescope.main import get_browser_for_cookie_source
+        return cls(get_browser_for_cookie_source(cookie_source), **kwargs)
+
+    def _get_source_signature(self) -> SourceSignature | None:
+        file_path = self.browser.file_path
+        # Archive members don't change once read.
+        if isinstance(file_path, ArchiveMember):
+            return None
+        signature: list[tuple[int, int] | None] = []
+        for path in (Path(file_path), Path(f'{file_path}-wal')):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _unload_domain(self, domain: str):
+        # Only remove cookies that weren't replaced, e.g. by responses.
+        for cookie in self._loaded_domains.pop(domain):
+            paths = self._cookies.get(cookie.domain, {})
+            if paths.get(cookie.path, {}).get(cookie.name) is cookie:
+                del paths[cookie.path][cookie.name]
+
+    def load_host(self, host: str):
+        """
+        Load source cookies that may apply to a host, unless already loaded.
+
+        Args:
+            host: host name, optionally with a port
+        """
+        host = host.lower().split(':', maxsplit=1)[0]
+        with self._cookies_lock:
+            signature = self._get_source_signature()
+            if signature != self._source_signature:
+                self._source_signature = signature
+                for domain in list(self._loaded_domains.keys()):
+                    self._unload_domain(domain)
+            candidate_domains = get_host_cookie_domains(host)
+            missing_domains = set()
+            for domain in candidate_domains:
+                if domain in self._loaded_domains:
+                    self._loaded_domains.move_to_end(domain)
+                else:
+                    missing_domains.add(domain)
+            if not missing_domains:
+                METRICS.increment('cache_hits_total', cache='cookiejar')
+                return
+            METRICS.increment('cache_misses_total', cache='cookiejar')
+            # Domain filters are partial matches, so keep only exact domain matches.
+            filter_values = sorted({domain.lstrip('.') for domain in missing_domains})
+            loaded_cookies: dict[str, list[Cookie]] = {domain: [] for domain in missing_domains}
+            for cookie_data in self.browser.generate_cookies([('domain', filter_values)], None):
+                domain_cookies = loaded_cookies.get(cookie_data.domain.lower())
+                if domain_cookies is not None:
+                    cookie = make_cookie(cookie_data)
+                    self.set_cookie(cookie)
+                    domain_cookies.append(cookie)
+            self._loaded_domains.update(loaded_cookies)
+            # Evict least recently used domains, but not those of the current host.
+            candidate_domain_set = set(candidate_domains)
+            for domain in list(self._loaded_domains.keys()):
+                if len(self._loaded_domains) <= self.max_domains:
+                    break
+                if domain not in candidate_domain_set:
+                    self._unload_domain(domain)
+
+    def add_cookie_header(self, request):
+        """
+        Override to load cookies for the request host before adding the header.
+
+        Args:
+            request: urllib.request.Request or compatible object
+        """
+        self.load_host(request_host(request))
+        super().add_cookie_header(request)
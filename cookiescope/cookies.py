@@ -19,15 +19,21 @@
 Cookiescope cookie types and functions.
 """
 
-from dataclasses import dataclass
+import json
+from dataclasses import asdict, dataclass, fields
+from heapq import merge
+from itertools import chain
+from operator import attrgetter
 from time import gmtime, strftime
-from typing import Iterable
-from urllib.parse import quote
+from typing import Any, Callable, Iterable, Iterator
+from urllib.parse import quote, unquote
 
+from cookiescope.profiling import PROFILER
+from cookiescope.sites import get_site
 from cookiescope.utility import abort, warning
 
 
-@dataclass
+@dataclass(slots=True)
 class CookieData:
     """
     Cookie data class.
@@ -71,6 +77,43 @@ class CookieData:
         if self.created:
             yield 'created', strftime('%c', gmtime(self.created))
 
+    @property
+    def site(self) -> str:
+        """
+        Site property, i.e. the registrable domain (eTLD+1) of the domain.
+
+        Returns:
+            site domain, e.g. "example.co.uk" for ".www.example.co.uk"
+        """
+        return get_site(self.domain)
+
+    def get_stored_value(self) -> str:
+        """
+        Get the value as stored by browsers, i.e. HTTP-quoted.
+
+        Returns:
+            stored value
+        """
+        return quote(self.value)
+
+    def get_jar_value(self) -> str:
+        """
+        Get the value as written to cookie jars, i.e. HTTP-quoted.
+
+        Returns:
+            cookie jar value
+        """
+        return quote(self.value)
+
+    def estimate_value_size(self) -> int:
+        """
+        Estimate the value size, e.g. for sort memory budgets.
+
+        Returns:
+            approximate value length
+        """
+        return len(self.value)
+
     def as_cookie_file_line(self):
         """
         Convert to Netscape cookie file format line.
@@ -87,25 +130,148 @@ class CookieData:
             'TRUE' if self.secure else 'FALSE',
             str(self.expires),
             self.name,
-            quote(self.value),
+            self.get_jar_value(),
         ])
 
 
+class CookieView(CookieData):
+    """
+    Cookie with a value that is decoded, decrypted, and unquoted when first read.
+
+    Extractors create views over the raw stored value, e.g. an encrypted
+    database column or a binary record slice, so that cookies rejected by
+    filters on other fields, or written to cookie jars, skip the work. The
+    stored (HTTP-quoted) value is written to cookie jars as is, when it is safe
+    for the jar format, rather than being unquoted and quoted again.
+
+    Pickled views keep the stored value, so that cookies from worker processes
+    write the same cookie jar values.
+    """
+    __slots__ = ('_raw_value', '_decode_raw_value', '_unquote_value', '_value')
+
+    def __init__(self,
+                 domain: str,
+                 name: str,
+                 path: str,
+                 http_only: bool,
+                 secure: bool,
+                 expires: int,
+                 created: int,
+                 raw_value: Any,
+                 decode_raw_value: Callable[[Any], str] = None,
+                 unquote_value: Callable[[str], str] = unquote,
+                 ):
+        """
+        Cookie view constructor.
+
+        Args:
+            domain: full or partial domain name
+            name: cookie name
+            path: cookie path
+            http_only: HTTP-only flag
+            secure: is-secure flag
+            expires: expiration timestamp
+            created: creation timestamp
+            raw_value: stored value string, or data for decode_raw_value
+            decode_raw_value: optional function to convert raw_value to the stored value string
+            unquote_value: value unquoting function
+        """
+        self.domain = domain
+        self.name = name
+        self.path = path
+        self.http_only = http_only
+        self.secure = secure
+        self.expires = expires
+        self.created = created
+        self._raw_value = raw_value
+        self._decode_raw_value = decode_raw_value
+        self._unquote_value = unquote_value
+        self._value = None
+
+    @property
+    def raw_value(self) -> str:
+        """
+        Stored value property, i.e. decoded or decrypted, but still HTTP-quoted.
+
+        Returns:
+            stored value
+        """
+        if self._decode_raw_value is not None:
+            self._raw_value = self._decode_raw_value(self._raw_value)
+            self._decode_raw_value = None
+        return self._raw_value
+
+    @property
+    def value(self) -> str:
+        """
+        Unquoted value property.
+
+        Returns:
+            value
+        """
+        if self._value is None:
+            self._value = self._unquote_value(self.raw_value)
+        return self._value
+
+    def get_stored_value(self) -> str:
+        """Override to return the stored value without unquoting and quoting it again."""
+        return self.raw_value
+
+    def get_jar_value(self) -> str:
+        """Override to write printable stored values without unquoting and quoting them again."""
+        raw_value = self.raw_value
+        if raw_value.isascii() and raw_value.isprintable():
+            return raw_value
+        return quote(self.value)
+
+    def estimate_value_size(self) -> int:
+        """Override to estimate from the raw value without decoding it."""
+        if self._value is not None:
+            return len(self._value)
+        return len(self._raw_value)
+
+    def __eq__(self, other) -> bool:
+        # Compare with plain CookieData too, unlike the dataclass comparison.
+        if not isinstance(other, CookieData):
+            return NotImplemented
+        return all(getattr(self, field_name) == getattr(other, field_name) for field_name in COOKIE_FIELD_NAMES)
+
+    def __reduce__(self):
+        return CookieView, (self.domain, self.name, self.path, self.http_only, self.secure,
+                            self.expires, self.created, self.raw_value)
+
+
 # --- Types.
 #: Filter field name and possible values handled with logical OR.
 Filter = tuple[str, list[str]]
 #: Multiple filters handled with logical AND.
 FilterBy = Iterable[Filter]
-#: Sorting specified as a sequence of field names.
+#: Sorting specified as a sequence of field names, prefixed with "-" for descending order.
 SortBy = Iterable[str]
+#: Sort key function type.
+SortKey = Callable[[CookieData], Any]
 
 # --- Constants.
-#: Field names supported for filtering.
-FILTER_FIELDS = ['domain', 'name', 'path', 'value']
-#: Field names supported for sorting.
-SORT_FIELDS = ['domain', 'name', 'path', 'value']
+#: Cookie field names in display order.
+COOKIE_FIELD_NAMES = [cookie_field.name for cookie_field in fields(CookieData)]
+#: Field names supported for filtering, including "site" for registrable domains.
+FILTER_FIELDS = ['domain', 'name', 'path', 'value', 'site']
+#: Field names supported for sorting, including "site" for reversed domain labels,
+#: which keeps each site's domains together without public suffix lookups.
+SORT_FIELDS = ['domain', 'name', 'path', 'value', 'http_only', 'secure', 'expires', 'created', 'site']
+#: Numeric (including boolean) sort fields, which are negated for descending order.
+NUMERIC_SORT_FIELDS = ['http_only', 'secure', 'expires', 'created']
+#: Sort field name prefix for descending order.
+DESCENDING_PREFIX = '-'
 #: Default sort fields.
 DEFAULT_SORT_FIELDS = ['domain', 'path']
+#: Byte translation table that inverts byte order, for descending string keys.
+_INVERTED_BYTES = bytes(range(255, -1, -1))
+#: Separator of site key labels. It sorts before any domain name character, so
+#: that subdomains follow their parent, and stays below the descending key terminator.
+_SITE_LABEL_SEPARATOR = '\x01'
+#: Default sort memory budget in bytes before switching to an external sort.
+DEFAULT_SORT_MEMORY_LIMIT = 256 * 1024 * 1024
 
 
 def get_filter_by(filter_exprs: Iterable[str]) -> FilterBy:
@@ -145,57 +311,193 @@ def filter_cookies(unfiltered_cookies: Iterable[CookieData],
     Returns:
         iterable filtered cookies
     """
-    if filter_by is None:
+    if not filter_by:
         return unfiltered_cookies
     # Lower-case the filter values for normalized comparison.
-    filter_by = [(name, [value.lower() for value in values]) for name, values in filter_by]
-    for cookie in unfiltered_cookies:
-        for name, values in filter_by:
-            if name not in FILTER_FIELDS:
-                warning(f'Ignoring bad filter field name: {name}')
-                break
-            for value in values:
+    normalized_filter_by: list[Filter] = []
+    for name, values in filter_by:
+        if name not in FILTER_FIELDS:
+            warning(f'Ignoring bad filter field name: {name}')
+            continue
+        normalized_filter_by.append((name, [value.lower() for value in values]))
+
+    def _generate() -> Iterator[CookieData]:
+        for cookie in unfiltered_cookies:
+            for name, values in normalized_filter_by:
                 # Normalize comparison by lower-casing cookie values.
-                if getattr(cookie, name).lower().find(value) == -1:
+                field_value = getattr(cookie, name).lower()
+                for value in values:
+                    if value in field_value:
+                        break
+                else:
                     break
             else:
-                continue
-            break
+                yield cookie
+
+    return PROFILER.iterate('filter', _generate())
+
+
+def get_sort_by(sort_expr: str) -> SortBy:
+    """
+    Convert a comma-separated sort expression to a sort-by list.
+
+    Args:
+        sort_expr: sort fields, e.g. "domain,-expires,name", or empty for no sorting
+
+    Returns:
+        sort field names with optional descending prefixes
+    """
+    sort_by = [sort_field.strip() for sort_field in sort_expr.split(',') if sort_field.strip()]
+    for sort_field in sort_by:
+        if sort_field.removeprefix(DESCENDING_PREFIX) not in SORT_FIELDS:
+            abort(f'Bad sort field: {sort_field}', f'Supported sort fields: {",".join(SORT_FIELDS)}')
+    return sort_by
+
+
+def get_site_key(domain: str) -> bytes:
+    """
+    Get a sort key that orders domains by reversed labels.
+
+    E.g. "www.example.com" becomes "com", "example", "www", so that subdomains
+    sort together after their parent domain. A leading dot is ignored.
+
+    Args:
+        domain: cookie domain
+
+    Returns:
+        site sort key
+    """
+    labels = domain.lstrip('.').lower().split('.')
+    labels.reverse()
+    return _SITE_LABEL_SEPARATOR.join(labels).encode('utf-8', 'surrogatepass')
+
+
+def get_descending_key(key: bytes) -> bytes:
+    """
+    Invert a bytes sort key for descending order.
+
+    The terminator makes shorter keys sort after longer keys they prefix.
+    UTF-8 text never contains zero bytes, so inverted text never contains it.
+
+    Args:
+        key: ascending key
+
+    Returns:
+        descending key
+    """
+    return key.translate(_INVERTED_BYTES) + b'\xff'
+
+
+def get_sort_key(sort_fields: list[str]) -> SortKey:
+    """
+    Build a function that computes a compact sort key once per cookie.
+
+    Ascending fields are fetched as is. Descending numeric fields are negated,
+    and descending strings become inverted UTF-8 bytes. The "site" field is a
+    bytes key with reversed domain labels.
+
+    Args:
+        sort_fields: valid sort field names with optional descending prefixes
+
+    Returns:
+        key function returning a single value or a tuple
+    """
+    if not any(sort_field.startswith(DESCENDING_PREFIX) or sort_field == 'site' for sort_field in sort_fields):
+        return attrgetter(*sort_fields)
+    getters: list[SortKey] = []
+    for sort_field in sort_fields:
+        name = sort_field.removeprefix(DESCENDING_PREFIX)
+        descending = name != sort_field
+        if name == 'site':
+            if descending:
+                getters.append(lambda cookie: get_descending_key(get_site_key(cookie.domain)))
+            else:
+                getters.append(lambda cookie: get_site_key(cookie.domain))
+        elif not descending:
+            getters.append(attrgetter(name))
+        elif name in NUMERIC_SORT_FIELDS:
+            getters.append(lambda cookie, get=attrgetter(name): -get(cookie))
         else:
-            yield cookie
+            getters.append(lambda cookie, get=attrgetter(name):
+                           get_descending_key(get(cookie).encode('utf-8', 'surrogatepass')))
+    if len(getters) == 1:
+        return getters[0]
+    return lambda cookie: tuple([get(cookie) for get in getters])
+
+
+def _check_sort_fields(sort_by: SortBy | None) -> tuple[list[str], list[str]]:
+    # Split sort fields into usable fields and bad or repeated fields.
+    bad_fields: list[str] = []
+    sort_fields: list[str] = []
+    sort_names: set[str] = set()
+    for sort_field in sort_by or []:
+        name = sort_field.removeprefix(DESCENDING_PREFIX)
+        if name in SORT_FIELDS and name not in sort_names:
+            sort_fields.append(sort_field)
+            sort_names.add(name)
+        else:
+            bad_fields.append(sort_field)
+    return sort_fields, bad_fields
 
 
 def sort_cookies(unsorted_cookies: Iterable[CookieData],
                  sort_by: SortBy | None,
+                 memory_limit: int | None = None,
                  ) -> Iterable[CookieData]:
     """
     Sort cookies.
 
+    Cookie sets larger than the memory budget are sorted externally, using
+    temporary files, and streamed back in order. The sort is stable, including
+    for descending fields.
+
     Args:
         unsorted_cookies: unsorted input cookies
-        sort_by: optional attribute names to sort by in priority order
+        sort_by: optional attribute names to sort by in priority order, prefixed with "-" for descending order
+        memory_limit: optional memory budget in bytes (default: DEFAULT_SORT_MEMORY_LIMIT)
 
     Returns:
         iterable sorted cookies
     """
-    if not sort_by:
-        return unsorted_cookies
-    bad_fields: list[str] = []
-    sort_fields: list[str] = []
-    for sort_field in sort_by:
-        if sort_field in SORT_FIELDS and sort_field not in sort_fields:
-            sort_fields.append(sort_field)
-        else:
-            bad_fields.append(sort_field)
+    sort_fields, bad_fields = _check_sort_fields(sort_by)
     if bad_fields:
         warning(f'Ignoring bad sort field(s): {" ".join(bad_fields)}')
     if not sort_fields:
         return unsorted_cookies
+    sort_key = get_sort_key(sort_fields)
 
-    def get_sort_values(cookie: CookieData) -> list[str]:
-        return [getattr(cookie, name) for name in sort_fields]
+    # Imported here to avoid a circular import.
+    from cookiescope.external_sort import external_sort
+    if memory_limit is None:
+        memory_limit = DEFAULT_SORT_MEMORY_LIMIT
+    with PROFILER.stage('sort'):
+        sorted_cookies = external_sort(unsorted_cookies, sort_key, memory_limit)
+    # Spilled runs are merged lazily.
+    return PROFILER.iterate('sort_merge', sorted_cookies)
 
-    return sorted(unsorted_cookies, key=get_sort_values)
+
+def merge_sorted_cookies(sorted_sources: Iterable[Iterable[CookieData]],
+                         sort_by: SortBy | None,
+                         ) -> Iterable[CookieData]:
+    """
+    K-way merge cookie sources that are each sorted the same way.
+
+    Only the next cookie of each source is held. Ties go to the earlier source,
+    so the result matches sorting the concatenated sources. Sources are
+    concatenated if there are no usable sort fields.
+
+    Args:
+        sorted_sources: cookies for each source, sorted by sort_cookies() with the same sort_by
+        sort_by: optional attribute names to sort by in priority order, prefixed with "-" for descending order
+
+    Returns:
+        iterable merged cookies
+    """
+    # Bad fields were already reported when the sources were sorted.
+    sort_fields, _bad_fields = _check_sort_fields(sort_by)
+    if not sort_fields:
+        return chain.from_iterable(sorted_sources)
+    return PROFILER.iterate('source_merge', merge(*sorted_sources, key=get_sort_key(sort_fields)))
 
 
 def display_cookies(cookies: Iterable[CookieData], heading: str = None):
@@ -206,13 +508,17 @@ def display_cookies(cookies: Iterable[CookieData], heading: str = None):
         cookies: iterable cookies to display
         heading: optional heading to display
     """
-    if heading:
-        print(f'=== {heading} ===')
-    for cookie in cookies:
+    def _display_cookie(cookie: CookieData):
         print('')
         for name, value in cookie.as_strings():
             print(f'{name}={value}')
 
+    display_cookie = PROFILER.function('output', _display_cookie)
+    if heading:
+        print(f'=== {heading} ===')
+    for cookie in cookies:
+        display_cookie(cookie)
+
 
 def display_cookie_jar(cookies: Iterable[CookieData]):
     """
@@ -224,5 +530,26 @@ def display_cookie_jar(cookies: Iterable[CookieData]):
         cookies: cookies to display
     """
 
-    for cookie in cookies:
+    def _display_cookie(cookie: CookieData):
         print(cookie.as_cookie_file_line())
+
+    display_cookie = PROFILER.function('output', _display_cookie)
+    print('# Netscape HTTP Cookie File')
+    for cookie in cookies:
+        display_cookie(cookie)
+
+
+def display_cookies_jsonl(cookies: Iterable[CookieData]):
+    """
+    Display cookies as JSON lines, i.e. one JSON object per cookie.
+
+    Args:
+        cookies: cookies to display
+    """
+
+    def _display_cookie(cookie: CookieData):
+        print(json.dumps(asdict(cookie)))
+
+    display_cookie = PROFILER.function('output', _display_cookie)
+    for cookie in cookies:
+        display_cookie(cookie)
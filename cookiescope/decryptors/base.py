@@ -34,6 +34,19 @@ class DecryptorBase(ABC):
         """
         self.browser_name = browser_name
 
+    def __getstate__(self) -> dict:
+        """
+        Get picklable state, e.g. for worker processes.
+
+        Instance-level method wrappers, such as profiling wrappers, are dropped.
+
+        Returns:
+            state dictionary
+        """
+        state = self.__dict__.copy()
+        state.pop('decrypt', None)
+        return state
+
     @abstractmethod
     def decrypt(self, encrypted_value: bytes) -> str:
         """
@@ -46,3 +59,19 @@ class DecryptorBase(ABC):
             decrypted value
         """
         ...
+
+
+class NullDecryptor(DecryptorBase):
+    """Decryptor that skips decryption, e.g. when keys are inaccessible."""
+
+    def decrypt(self, encrypted_value: bytes) -> str:
+        """
+        Skip decryption.
+
+        Args:
+            encrypted_value: encrypted value (ignored)
+
+        Returns:
+            empty string
+        """
+        return ''
@@ -55,6 +55,7 @@ from cryptography.hazmat.primitives.ciphers.modes import CBC
 from cryptography.hazmat.primitives.hashes import SHA1
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from cookiescope.profiling import PROFILER
 from .base import DecryptorBase
 
 
@@ -74,10 +75,34 @@ class PosixDecryptorBase(DecryptorBase, ABC):
         assert self.iterations
         super().__init__(browser_name)
         kdf = PBKDF2HMAC(algorithm=SHA1(), iterations=self.iterations, length=16, salt=b'saltysalt')
-        password = self.get_password()
-        encryption_key = kdf.derive(password.encode('utf8'))
-        algorithm = AES(encryption_key)
-        self.cipher = Cipher(algorithm=algorithm, mode=CBC(b' ' * 16))
+        with PROFILER.stage('keyring'):
+            password = self.get_password()
+        with PROFILER.stage('kdf'):
+            self.encryption_key = kdf.derive(password.encode('utf8'))
+        self.cipher = Cipher(algorithm=AES(self.encryption_key), mode=CBC(b' ' * 16))
+
+    def __getstate__(self) -> dict:
+        """
+        Get picklable state with the derived key instead of the cipher.
+
+        Unpickled copies don't repeat keyring access and key derivation.
+
+        Returns:
+            state dictionary
+        """
+        state = super().__getstate__()
+        del state['cipher']
+        return state
+
+    def __setstate__(self, state: dict):
+        """
+        Restore pickled state and rebuild the cipher.
+
+        Args:
+            state: state dictionary
+        """
+        self.__dict__.update(state)
+        self.cipher = Cipher(algorithm=AES(self.encryption_key), mode=CBC(b' ' * 16))
 
     @abstractmethod
     def get_password(self) -> str:
@@ -27,6 +27,7 @@ import win32crypt
 from Crypto.Cipher import AES
 from pathlib import Path
 
+from cookiescope.profiling import PROFILER
 from .base import DecryptorBase
 
 
@@ -54,11 +55,12 @@ class WindowsDecryptor(DecryptorBase):
         Returns:
             decrypted value
         """
-        with open(self.state_file, 'r') as file:
-            encrypted_key = json.loads(file.read())['os_crypt']['encrypted_key']
-        encrypted_key = base64.b64decode(encrypted_key)                                       # Base64 decoding
-        encrypted_key = encrypted_key[5:]                                                     # Remove DPAPI
-        decrypted_key = win32crypt.CryptUnprotectData(encrypted_key, None, None, None, 0)[1]  # Decrypt key
+        with PROFILER.stage('state_key'):
+            with open(self.state_file, 'r') as file:
+                encrypted_key = json.loads(file.read())['os_crypt']['encrypted_key']
+            encrypted_key = base64.b64decode(encrypted_key)                                   # Base64 decoding
+            encrypted_key = encrypted_key[5:]                                                 # Remove DPAPI
+            decrypted_key = win32crypt.CryptUnprotectData(encrypted_key, None, None, None, 0)[1]  # Decrypt key
         # data = bytes.fromhex('763130...') # the encrypted cookie
         nonce = encrypted_value[3:3+12]
         ciphertext = encrypted_value[3+12:-16]
@@ -0,0 +1,92 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope cross-source cookie de-duplication.
+
+Cookies are identified by (domain, name, path), or optionally by (site, name,
+path) to also collapse cookies set by sibling hosts of a site. The index maps a fixed-size
+digest of that key to the winning cookie, so memory grows with the number of
+unique cookies rather than the total number of cookies read. Winners are only
+known once every source is exhausted, so results stream out afterwards.
+"""
+
+from hashlib import blake2b
+from typing import Iterable, Iterator
+
+from cookiescope.cookies import CookieData
+from cookiescope.profiling import PROFILER
+
+#: De-duplication policies. "newest" keeps the most recently created cookie, and
+#: "first" keeps the cookie from the earliest source.
+DEDUPE_POLICIES = ['newest', 'first']
+#: Fields that identify the cookie owner in de-duplication keys.
+DEDUPE_KEY_FIELDS = ['domain', 'site']
+#: Key digest size in bytes. Collisions are negligible at this size.
+KEY_DIGEST_SIZE = 16
+
+
+def get_key_digest(cookie: CookieData, key_field: str = 'domain') -> bytes:
+    """
+    Get the de-duplication key digest for a cookie.
+
+    Args:
+        cookie: cookie to digest
+        key_field: owner field, i.e. one of DEDUPE_KEY_FIELDS
+
+    Returns:
+        (domain or site, name, path) key digest
+    """
+    key = '\0'.join((getattr(cookie, key_field), cookie.name, cookie.path))
+    return blake2b(key.encode('utf-8', errors='surrogatepass'), digest_size=KEY_DIGEST_SIZE).digest()
+
+
+def dedupe_cookies(sources: Iterable[Iterable[CookieData]],
+                   policy: str,
+                   key_field: str = 'domain',
+                   ) -> Iterator[CookieData]:
+    """
+    Collapse cookies that share (domain or site, name, path) across sources.
+
+    Ties under the "newest" policy go to the earlier cookie. Output follows
+    the order in which keys were first seen.
+
+    Args:
+        sources: cookies for each source, in priority order
+        policy: de-duplication policy, i.e. one of DEDUPE_POLICIES
+        key_field: owner field, i.e. one of DEDUPE_KEY_FIELDS
+
+    Returns:
+        de-duplicated cookie iterator
+    """
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f'Unsupported de-duplication policy: {policy}')
+    if key_field not in DEDUPE_KEY_FIELDS:
+        raise ValueError(f'Unsupported de-duplication key field: {key_field}')
+    index: dict[bytes, CookieData] = {}
+    keep_newest = policy == 'newest'
+    with PROFILER.stage('dedupe'):
+        for cookies in sources:
+            for cookie in cookies:
+                digest = get_key_digest(cookie, key_field)
+                winner = index.get(digest)
+                if winner is None:
+                    index[digest] = cookie
+                elif keep_newest and cookie.created > winner.created:
+                    index[digest] = cookie
+        PROFILER.count('dedupe', items=len(index))
+    yield from index.values()
@@ -0,0 +1,153 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope cached browser profile discovery.
+
+Profile configuration files, i.e. Chrome "Local State" and Firefox
+"profiles.ini", are parsed into JSON-compatible data. Parsed data is cached in
+memory and in a JSON file in the user cache directory, keyed on each file's path,
+modification time, and size. So "browser:profile" lookups and multi-profile
+scans only re-parse configuration files that changed.
+
+The cache directory can be overridden with the COOKIESCOPE_CACHE_DIR
+environment variable. Set it to an empty string to disable the file cache.
+"""
+
+import atexit
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Callable
+
+from cookiescope.metrics import METRICS
+
+#: Environment variable overriding the cache directory.
+CACHE_DIR_ENV_VAR = 'COOKIESCOPE_CACHE_DIR'
+#: Cache file name in the cache directory.
+PROFILE_CACHE_FILE_NAME = 'profiles.json'
+#: Cache file format version, bumped when parsed data changes shape.
+PROFILE_CACHE_VERSION = 1
+
+#: Parsed configuration data, i.e. a JSON-compatible value.
+ConfigData = Any
+
+
+def get_cache_directory() -> Path | None:
+    """
+    Get the platform-specific user cache directory for Cookiescope.
+
+    Returns:
+        cache directory path, or None if disabled
+    """
+    override = os.environ.get(CACHE_DIR_ENV_VAR)
+    if override is not None:
+        return Path(override) if override else None
+    if sys.platform == 'darwin':
+        return Path('~/Library/Caches/cookiescope').expanduser()
+    if sys.platform == 'win32':
+        local_app_data = os.environ.get('LOCALAPPDATA')
+        base_directory = Path(local_app_data) if local_app_data else Path('~/AppData/Local').expanduser()
+        return base_directory / 'cookiescope' / 'Cache'
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+    base_directory = Path(xdg_cache_home) if xdg_cache_home else Path('~/.cache').expanduser()
+    return base_directory / 'cookiescope'
+
+
+class ProfileCache:
+    """Parsed profile configuration cache keyed on file modification times."""
+
+    def __init__(self):
+        """Profile cache constructor."""
+        # Entries map resolved path strings to {kind, mtime_ns, size, data}.
+        self.entries: dict[str, dict] = {}
+        self._loaded = False
+        self._dirty = False
+
+    def _get_cache_path(self) -> Path | None:
+        cache_directory = get_cache_directory()
+        return cache_directory / PROFILE_CACHE_FILE_NAME if cache_directory else None
+
+    def _load(self):
+        self._loaded = True
+        cache_path = self._get_cache_path()
+        if cache_path is None:
+            return
+        try:
+            with cache_path.open(encoding='utf-8') as cache_file:
+                document = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        if isinstance(document, dict) and document.get('version') == PROFILE_CACHE_VERSION:
+            self.entries.update(document.get('entries', {}))
+
+    def save(self):
+        """Save changed entries to the cache file, ignoring failures."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        cache_path = self._get_cache_path()
+        if cache_path is None:
+            return
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+            with temporary_path.open('w', encoding='utf-8') as cache_file:
+                json.dump({'version': PROFILE_CACHE_VERSION, 'entries': self.entries}, cache_file)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            pass
+
+    def get(self, kind: str, path: Path, parse: Callable[[Path], ConfigData]) -> ConfigData | None:
+        """
+        Get parsed configuration data, parsing only if the file changed.
+
+        Args:
+            kind: configuration kind, e.g. "chrome-local-state", to keep parsers apart
+            path: configuration file path
+            parse: parser function that returns JSON-compatible data, or None on failure
+
+        Returns:
+            parsed data, or None if the file is missing or unparseable
+        """
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if not self._loaded:
+            self._load()
+        key = str(path.absolute())
+        entry = self.entries.get(key)
+        if (entry is not None
+                and entry.get('kind') == kind
+                and entry.get('mtime_ns') == stat.st_mtime_ns
+                and entry.get('size') == stat.st_size):
+            METRICS.increment('cache_hits_total', cache='profiles')
+            return entry.get('data')
+        METRICS.increment('cache_misses_total', cache='profiles')
+        data = parse(path)
+        self.entries[key] = {'kind': kind, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'data': data}
+        if not self._dirty:
+            # Save once at exit, rather than after every parse, e.g. during scans.
+            self._dirty = True
+            atexit.register(self.save)
+        return data
+
+
+#: Global profile cache used by browser discovery.
+PROFILE_CACHE = ProfileCache()
@@ -0,0 +1,159 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+External merge sort for cookie sets that may not fit in memory.
+
+Cookies are accumulated until an estimated memory budget is reached. Each full
+batch is sorted and written as a "run" to an anonymous temporary file. The runs
+are then streamed back and k-way merged. Python's sort and heapq.merge() are
+both stable, so the result is ordered identically to sorted().
+"""
+
+import marshal
+from heapq import merge
+from tempfile import TemporaryFile
+from typing import IO, Iterable, Iterator
+
+from cookiescope.cookies import CookieData, CookieView, SortKey
+
+#: Rough per-cookie object overhead in bytes, excluding string contents.
+COOKIE_OVERHEAD_BYTES = 400
+#: Maximum number of runs merged at once, to limit open temporary files.
+MAX_MERGE_RUNS = 64
+
+
+def estimate_cookie_size(cookie: CookieData) -> int:
+    """
+    Estimate the memory consumed by a cookie.
+
+    Args:
+        cookie: cookie to estimate
+
+    Returns:
+        approximate size in bytes
+    """
+    return (COOKIE_OVERHEAD_BYTES
+            + len(cookie.domain)
+            + len(cookie.name)
+            + len(cookie.path)
+            + cookie.estimate_value_size())
+
+
+def _write_run(cookies: list[CookieData]) -> IO:
+    """
+    Write sorted cookies to a temporary run file.
+
+    Values are written as stored, i.e. HTTP-quoted, so that cookies read back
+    write the same cookie jar values.
+
+    Args:
+        cookies: sorted cookies
+
+    Returns:
+        run file rewound to the start
+    """
+    run_file = TemporaryFile()
+    for cookie in cookies:
+        marshal.dump((
+            cookie.domain,
+            cookie.name,
+            cookie.path,
+            cookie.http_only,
+            cookie.secure,
+            cookie.expires,
+            cookie.created,
+            cookie.get_stored_value(),
+        ), run_file)
+    run_file.seek(0)
+    return run_file
+
+
+def _read_run(run_file: IO) -> Iterator[CookieData]:
+    """
+    Read cookies back from a run file, which is closed when exhausted.
+
+    Args:
+        run_file: run file produced by _write_run()
+
+    Returns:
+        cookie iterator
+    """
+    with run_file:
+        while True:
+            try:
+                record = marshal.load(run_file)
+            except EOFError:
+                break
+            yield CookieView(*record)
+
+
+def _merge_runs(run_files: list[IO], key: SortKey) -> Iterator[CookieData]:
+    """
+    K-way merge run files, pre-merging groups if there are too many.
+
+    Args:
+        run_files: run files in input order
+        key: sort key function
+
+    Returns:
+        merged cookie iterator
+    """
+    while len(run_files) > MAX_MERGE_RUNS:
+        merged_run_files: list[IO] = []
+        for start_idx in range(0, len(run_files), MAX_MERGE_RUNS):
+            group = run_files[start_idx:start_idx + MAX_MERGE_RUNS]
+            merged_cookies = merge(*[_read_run(run_file) for run_file in group], key=key)
+            merged_run_files.append(_write_run(merged_cookies))
+        run_files = merged_run_files
+    return merge(*[_read_run(run_file) for run_file in run_files], key=key)
+
+
+def external_sort(unsorted_cookies: Iterable[CookieData],
+                  key: SortKey,
+                  memory_limit: int,
+                  ) -> Iterable[CookieData]:
+    """
+    Sort cookies while keeping memory consumption bounded.
+
+    Falls back to a plain in-memory sort if the input fits within the budget.
+
+    Args:
+        unsorted_cookies: unsorted input cookies
+        key: sort key function
+        memory_limit: approximate memory budget in bytes
+
+    Returns:
+        iterable sorted cookies
+    """
+    run_files: list[IO] = []
+    batch: list[CookieData] = []
+    batch_size = 0
+    for cookie in unsorted_cookies:
+        batch.append(cookie)
+        batch_size += estimate_cookie_size(cookie)
+        if batch_size >= memory_limit:
+            batch.sort(key=key)
+            run_files.append(_write_run(batch))
+            batch = []
+            batch_size = 0
+    batch.sort(key=key)
+    if not run_files:
+        return batch
+    if batch:
+        run_files.append(_write_run(batch))
+    return _merge_runs(run_files, key)
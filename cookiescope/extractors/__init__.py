@@ -17,5 +17,19 @@
 
 """Cookie extractors package."""
 
-from .binary import generate_binary_cookies, is_binary_cookies_file
-from .sqlite import SQLiteCookiesBase
+from .binary import (
+    BinaryCookiesWriter,
+    generate_binary_cookie_columns,
+    generate_binary_cookies,
+    is_binary_cookies_file,
+    rewrite_binary_cookies,
+)
+from .binary_index import (
+    BinaryCookiesIndex,
+    build_binary_cookies_index,
+    generate_indexed_binary_cookies,
+    load_binary_cookies_index,
+)
+from .jsonl import generate_jsonl_cookies, is_jsonl_cookies_file
+from .netscape import generate_cookie_jar_cookies, is_cookie_jar_file
+from .sqlite import DEFAULT_PURGE_BATCH_SIZE, SQLiteCookiesBase
@@ -21,12 +21,32 @@ Binary cookies handling.
 
 from io import BytesIO
 from pathlib import Path
-from struct import unpack
-from urllib.parse import unquote
+from struct import pack, unpack, unpack_from
+from tempfile import SpooledTemporaryFile
 
-from cookiescope.cookies import CookieData
+from cookiescope.cookies import CookieData, CookieView
+from cookiescope.metrics import METRICS
 from cookiescope.utility import abort, open_binary_file
-from typing import AnyStr, IO, Iterator, Self
+from typing import AnyStr, Callable, IO, Iterable, Iterator, Self
+
+#: File signature.
+FILE_MAGIC = b'cook'
+#: Page header bytes.
+PAGE_HEADER = bytes([0, 0, 1, 0])
+#: Page footer bytes, following the cookie offsets.
+PAGE_FOOTER = bytes([0, 0, 0, 0])
+#: File footer bytes, following the checksum.
+FILE_FOOTER = bytes.fromhex('071720050000004b')
+#: Cookie record header size, i.e. the offset of the first string.
+RECORD_HEADER_SIZE = 56
+#: Cookie record header fields read when decoding, i.e. flags, string offsets, and dates.
+RECORD_HEADER_FORMAT = '<8xi4x4i8x2d'
+#: Mac epoch (1/Jan/2001) offset from the Unix epoch in seconds.
+MAC_EPOCH_OFFSET = 978307200
+#: Default maximum cookies per written page.
+DEFAULT_PAGE_COOKIES = 100
+#: Written page bytes held in memory before spooling to a temporary file.
+PAGE_SPOOL_SIZE = 16 * 1024 * 1024
 
 
 class BinaryCookiesExtractor:
@@ -125,7 +145,7 @@ class BinaryCookiesExtractor:
             extracted seconds since 1970 (Unix epoch) as integer
         """
         # Expiry date is in Mac epoch format: Starts from 1/Jan/2001 (978307200 in seconds)
-        return int(unpack('<d', self.get_bytes(8))[0] + 978307200)
+        return int(unpack('<d', self.get_bytes(8))[0] + MAC_EPOCH_OFFSET)
 
     def get_block(self, length) -> Self:
         """
@@ -166,56 +186,276 @@ def is_binary_cookies_file(path: Path) -> bool:
         return True
 
 
-def generate_binary_cookies(path: Path) -> Iterator[CookieData]:
+def generate_binary_pages(path: Path) -> Iterator[bytes]:
     """
-    Generate cookies by reading file and extracting individual cookies.
+    Generate raw pages by reading a binary cookies file sequentially.
 
     Args:
         path: file path
 
     Returns:
-        cookie iterator
+        raw page bytes iterator
     """
     with open_binary_file(path) as binary_file:
         extractor = BinaryCookiesExtractor(binary_file)
-        extractor.get_string(4, encoding='ascii', expect='cook')
+        extractor.get_bytes(4, expect=FILE_MAGIC)
         num_pages = extractor.get_header_integer()
         page_sizes = [extractor.get_header_integer() for _idx in range(num_pages)]
-        page_blocks = [extractor.get_block(length) for length in page_sizes]
-        for page_block in page_blocks:
-            page_block.get_bytes(4, expect=bytes([0, 0, 1, 0]))
-            num_cookies = page_block.get_integer()
-            cookie_offsets = [page_block.get_integer() for _idx in range(num_cookies)]
-            page_block.get_bytes(4, expect=bytes([0, 0, 0, 0]))
-            for offset in cookie_offsets:
-                page_block.set_offset(offset)
-                cookie_size = page_block.get_integer()
-                cookie_block = page_block.get_block(cookie_size)
-                cookie_block.get_bytes(4)  # unknown
-                secure, http_only = cookie_block.get_flags()
-                cookie_block.get_bytes(4)  # unknown
-                url_offset = cookie_block.get_integer()
-                name_offset = cookie_block.get_integer()
-                path_offset = cookie_block.get_integer()
-                value_offset = cookie_block.get_integer()
-                cookie_block.get_bytes(8)  # end of cookie
-                expires = cookie_block.get_date_time()
-                created = cookie_block.get_date_time()
-                cookie_block.set_offset(url_offset - 4)
-                domain = cookie_block.get_attribute()
-                cookie_block.set_offset(name_offset - 4)
-                name = cookie_block.get_attribute()
-                cookie_block.set_offset(path_offset - 4)
-                path = cookie_block.get_attribute()
-                cookie_block.set_offset(value_offset - 4)
-                value = unquote(cookie_block.get_attribute())
-                yield CookieData(
-                    domain=domain,
-                    name=name,
-                    path=path,
-                    value=value,
-                    http_only=http_only,
-                    secure=secure,
-                    expires=expires,
-                    created=created,
-                )
+        for length in page_sizes:
+            yield extractor.get_bytes(length)
+
+
+def generate_page_records(page: bytes) -> Iterator[bytes]:
+    """
+    Generate raw cookie records from a page.
+
+    Args:
+        page: raw page bytes
+
+    Returns:
+        raw cookie record bytes iterator
+    """
+    page_block = BinaryCookiesExtractor(BytesIO(page))
+    page_block.get_bytes(4, expect=PAGE_HEADER)
+    num_cookies = page_block.get_integer()
+    cookie_offsets = [page_block.get_integer() for _idx in range(num_cookies)]
+    page_block.get_bytes(4, expect=PAGE_FOOTER)
+    for offset in cookie_offsets:
+        cookie_size = unpack_from('<i', page, offset)[0]
+        yield page[offset:offset + cookie_size]
+
+
+def decode_binary_cookie(record: bytes) -> CookieData:
+    """
+    Decode a raw cookie record.
+
+    Strings are sliced directly from the record. The value is decoded and
+    unquoted when it is first read.
+
+    Args:
+        record: raw cookie record bytes, starting with the record size
+
+    Returns:
+        decoded cookie view
+    """
+    flags, url_offset, name_offset, path_offset, value_offset, expires, created = (
+        unpack_from(RECORD_HEADER_FORMAT, record))
+    return CookieView(
+        domain=record[url_offset:record.index(0, url_offset)].decode('utf-8'),
+        name=record[name_offset:record.index(0, name_offset)].decode('utf-8'),
+        path=record[path_offset:record.index(0, path_offset)].decode('utf-8'),
+        http_only=bool(flags & 0x00000004),
+        secure=bool(flags & 0x00000001),
+        expires=int(expires + MAC_EPOCH_OFFSET),
+        created=int(created + MAC_EPOCH_OFFSET),
+        raw_value=record[value_offset:record.index(0, value_offset)],
+        decode_raw_value=bytes.decode,
+    )
+
+
+def generate_binary_cookies(path: Path) -> Iterator[CookieData]:
+    """
+    Generate cookies by reading file and extracting individual cookies.
+
+    Args:
+        path: file path
+
+    Returns:
+        cookie iterator
+    """
+    rows_scanned = METRICS.sample('rows_scanned_total', format='binarycookies')
+    for page in generate_binary_pages(path):
+        for record in generate_page_records(page):
+            rows_scanned.value += 1
+            yield decode_binary_cookie(record)
+
+
+def generate_binary_cookie_columns(path: Path) -> Iterator[tuple[str, int, int, int]]:
+    """
+    Generate (domain, expires, created, value size) columns from record headers.
+
+    Only the domain string is decoded. The value size is the stored size, i.e.
+    before unquoting.
+
+    Args:
+        path: file path
+
+    Returns:
+        (domain, expires, created, value size) tuple iterator
+    """
+    for page in generate_binary_pages(path):
+        for record in generate_page_records(page):
+            url_offset, value_offset = unpack_from('<i8xi', record, 16)
+            expires, created = unpack_from('<dd', record, 40)
+            domain_end = record.index(0, url_offset)
+            yield (
+                record[url_offset:domain_end].decode('utf-8'),
+                int(expires + MAC_EPOCH_OFFSET),
+                int(created + MAC_EPOCH_OFFSET),
+                record.index(0, value_offset) - value_offset,
+            )
+
+
+def encode_binary_cookie(cookie: CookieData) -> bytes:
+    """
+    Encode a cookie as a raw cookie record.
+
+    The value is written in its stored (HTTP-quoted) form, which the reader
+    unquotes again. A zero (session) expiration time is stored as the Unix epoch.
+
+    Args:
+        cookie: cookie to encode
+
+    Returns:
+        raw cookie record bytes
+    """
+    strings = [f'{field}\0'.encode('utf-8')
+               for field in (cookie.domain, cookie.name, cookie.path, cookie.get_stored_value())]
+    offsets: list[int] = []
+    offset = RECORD_HEADER_SIZE
+    for encoded in strings:
+        offsets.append(offset)
+        offset += len(encoded)
+    flags = (0x1 if cookie.secure else 0) | (0x4 if cookie.http_only else 0)
+    header = pack('<iiii4i8x', offset, 0, flags, 0, *offsets)
+    dates = pack('<dd', cookie.expires - MAC_EPOCH_OFFSET, cookie.created - MAC_EPOCH_OFFSET)
+    return header + dates + b''.join(strings)
+
+
+def encode_binary_cookies_page(records: list[bytes]) -> bytes:
+    """
+    Encode raw cookie records as a page.
+
+    Args:
+        records: raw cookie record bytes
+
+    Returns:
+        raw page bytes
+    """
+    offset = len(PAGE_HEADER) + 4 + 4 * len(records) + len(PAGE_FOOTER)
+    offsets: list[int] = []
+    for record in records:
+        offsets.append(offset)
+        offset += len(record)
+    return b''.join([PAGE_HEADER, pack(f'<i{len(records)}i', len(records), *offsets), PAGE_FOOTER, *records])
+
+
+class BinaryCookiesWriter:
+    """
+    Streaming binary cookies file writer.
+
+    The file header lists page sizes before the pages, so pages are spooled,
+    in memory up to PAGE_SPOOL_SIZE and then in a temporary file, until the
+    writer is closed. Raw pages, e.g. untouched pages of an existing file, are
+    copied byte-for-byte.
+    """
+
+    def __init__(self, stream: IO, page_cookies: int = DEFAULT_PAGE_COOKIES):
+        """
+        Binary cookies writer constructor.
+
+        Args:
+            stream: binary file stream to write to
+            page_cookies: maximum cookies per page for written cookies
+        """
+        self._stream = stream
+        self.page_cookies = page_cookies
+        self._pages = SpooledTemporaryFile(max_size=PAGE_SPOOL_SIZE)
+        self._page_sizes: list[int] = []
+        self._checksum = 0
+        self._records: list[bytes] = []
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pages.close()
+
+    def write_cookie(self, cookie: CookieData):
+        """
+        Add a cookie to the current page.
+
+        Args:
+            cookie: cookie to write
+        """
+        self._records.append(encode_binary_cookie(cookie))
+        if len(self._records) >= self.page_cookies:
+            self.flush_page()
+
+    def write_cookies(self, cookies: Iterable[CookieData]):
+        """
+        Add cookies to pages.
+
+        Args:
+            cookies: cookies to write
+        """
+        for cookie in cookies:
+            self.write_cookie(cookie)
+
+    def write_page(self, page: bytes):
+        """
+        Write a raw page, after flushing the current page.
+
+        Args:
+            page: raw page bytes
+        """
+        self.flush_page()
+        self._write_page(page)
+
+    def flush_page(self):
+        """Write the current page, if it has cookies."""
+        if self._records:
+            self._write_page(encode_binary_cookies_page(self._records))
+            self._records = []
+
+    def _write_page(self, page: bytes):
+        self._pages.write(page)
+        self._page_sizes.append(len(page))
+        # The checksum sums every fourth byte of each page.
+        self._checksum += sum(page[::4])
+
+    def close(self):
+        """Write the file header, pages, checksum, and footer."""
+        self.flush_page()
+        num_pages = len(self._page_sizes)
+        self._stream.write(FILE_MAGIC + pack(f'>i{num_pages}i', num_pages, *self._page_sizes))
+        self._pages.seek(0)
+        while chunk := self._pages.read(1024 * 1024):
+            self._stream.write(chunk)
+        self._pages.close()
+        self._stream.write(pack('>I', self._checksum & 0xffffffff) + FILE_FOOTER)
+
+
+def rewrite_binary_cookies(path: Path,
+                           stream: IO,
+                           keep: Callable[[CookieData], bool],
+                           ) -> int:
+    """
+    Rewrite a binary cookies file, keeping selected cookies.
+
+    Pages where every cookie is kept are copied byte-for-byte. Other pages are
+    rebuilt from the raw records of the kept cookies, and dropped if empty.
+
+    Args:
+        path: input file path
+        stream: binary output stream
+        keep: predicate that returns True for cookies to keep
+
+    Returns:
+        removed cookie count
+    """
+    removed_count = 0
+    with BinaryCookiesWriter(stream) as writer:
+        for page in generate_binary_pages(path):
+            records = list(generate_page_records(page))
+            kept_records = [record for record in records if keep(decode_binary_cookie(record))]
+            if len(kept_records) == len(records):
+                writer.write_page(page)
+                continue
+            removed_count += len(records) - len(kept_records)
+            if kept_records:
+                writer.write_page(encode_binary_cookies_page(kept_records))
+    return removed_count
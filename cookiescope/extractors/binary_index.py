@@ -0,0 +1,206 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Sidecar domain index for binary cookies files.
+
+Finding one domain's cookies in a large binary cookies file otherwise means
+decoding every record. The index maps each distinct domain to the (page, cookie
+offset) locations of its records. It is built in one pass that only decodes
+record domains, and saved as JSON in the user cache directory (see
+cookiescope.discovery), keyed on the source file path. An index is valid while
+the source file's size and modification time are unchanged.
+
+Domain filters are partial matches, so they are evaluated against the distinct
+domains, which are far fewer than the cookies. Matching records are then decoded
+in file order from the memory-mapped source file.
+"""
+
+import json
+import mmap
+import os
+from dataclasses import asdict, dataclass
+from hashlib import blake2b
+from pathlib import Path
+from struct import unpack_from
+from typing import Iterable, Iterator
+
+from cookiescope.cookies import CookieData
+from cookiescope.discovery import get_cache_directory
+from cookiescope.metrics import METRICS
+from cookiescope.utility import abort
+from .binary import FILE_MAGIC, PAGE_HEADER, decode_binary_cookie
+
+#: Index file format version, bumped when the index changes shape.
+INDEX_VERSION = 1
+#: Index directory name in the cache directory.
+INDEX_DIRECTORY_NAME = 'binarycookies-index'
+#: Minimum source file size for indexing. Smaller files are quick to parse.
+MIN_INDEXED_FILE_SIZE = 1024 * 1024
+
+
+@dataclass
+class BinaryCookiesIndex:
+    """Domain index for a binary cookies file."""
+    #: Source file size.
+    size: int
+    #: Source file modification time in nanoseconds.
+    mtime_ns: int
+    #: Page file offsets by page number.
+    page_offsets: list[int]
+    #: Record (page number, cookie offset in page) locations by domain.
+    domains: dict[str, list[list[int]]]
+
+    def find_record_offsets(self, domain_filters: Iterable[list[str]]) -> list[int]:
+        """
+        Find record file offsets for domains matching all domain filters.
+
+        Matching is the same as for cookie filters, i.e. a domain matches a
+        filter if it contains any of its values, ignoring case.
+
+        Args:
+            domain_filters: lists of lower-case domain filter values
+
+        Returns:
+            record file offsets in file order
+        """
+        domain_filters = list(domain_filters)
+        offsets: list[int] = []
+        for domain, locations in self.domains.items():
+            lower_domain = domain.lower()
+            if all(any(value in lower_domain for value in values) for values in domain_filters):
+                offsets.extend(self.page_offsets[page] + cookie_offset for page, cookie_offset in locations)
+        offsets.sort()
+        return offsets
+
+
+def build_binary_cookies_index(path: Path) -> BinaryCookiesIndex:
+    """
+    Build a domain index with one pass through a binary cookies file.
+
+    Only record domains are decoded.
+
+    Args:
+        path: binary cookies file path
+
+    Returns:
+        domain index
+    """
+    stat = os.stat(path)
+    page_offsets: list[int] = []
+    domains: dict[str, list[list[int]]] = {}
+    with open(path, 'rb') as binary_file:
+        with mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] != FILE_MAGIC:
+                abort(f'Expected bytes "{FILE_MAGIC}", found "{data[:4]}".')
+            num_pages = unpack_from('>i', data, 4)[0]
+            page_offset = 8 + 4 * num_pages
+            for page, page_size in enumerate(unpack_from(f'>{num_pages}i', data, 8)):
+                if data[page_offset:page_offset + 4] != PAGE_HEADER:
+                    abort(f'Expected bytes "{PAGE_HEADER}", found "{data[page_offset:page_offset + 4]}".')
+                page_offsets.append(page_offset)
+                num_cookies = unpack_from('<i', data, page_offset + 4)[0]
+                for cookie_offset in unpack_from(f'<{num_cookies}i', data, page_offset + 8):
+                    domain_offset = page_offset + cookie_offset + unpack_from(
+                        '<i', data, page_offset + cookie_offset + 16)[0]
+                    domain = data[domain_offset:data.find(b'\0', domain_offset)].decode('utf-8')
+                    locations = domains.get(domain)
+                    if locations is None:
+                        locations = domains[domain] = []
+                    locations.append([page, cookie_offset])
+                page_offset += page_size
+    return BinaryCookiesIndex(stat.st_size, stat.st_mtime_ns, page_offsets, domains)
+
+
+def get_index_path(path: Path) -> Path | None:
+    """
+    Get the sidecar index path for a binary cookies file.
+
+    Args:
+        path: binary cookies file path
+
+    Returns:
+        index file path in the cache directory, or None if caching is disabled
+    """
+    cache_directory = get_cache_directory()
+    if cache_directory is None:
+        return None
+    digest = blake2b(str(path.absolute()).encode('utf-8'), digest_size=16).hexdigest()
+    return cache_directory / INDEX_DIRECTORY_NAME / f'{digest}.json'
+
+
+def load_binary_cookies_index(path: Path) -> BinaryCookiesIndex | None:
+    """
+    Load a valid sidecar index, or build and save a new one.
+
+    Save failures are ignored, because the index is only an optimization.
+
+    Args:
+        path: binary cookies file path
+
+    Returns:
+        domain index, or None if caching is disabled or the file is too small
+    """
+    index_path = get_index_path(path)
+    stat = os.stat(path)
+    if index_path is None or stat.st_size < MIN_INDEXED_FILE_SIZE:
+        return None
+    try:
+        with index_path.open(encoding='utf-8') as index_file:
+            document = json.load(index_file)
+        if (document.get('version') == INDEX_VERSION
+                and document.get('size') == stat.st_size
+                and document.get('mtime_ns') == stat.st_mtime_ns):
+            METRICS.increment('cache_hits_total', cache='binary_index')
+            return BinaryCookiesIndex(document['size'], document['mtime_ns'],
+                                      document['page_offsets'], document['domains'])
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    METRICS.increment('cache_misses_total', cache='binary_index')
+    index = build_binary_cookies_index(path)
+    # Don't save an index for a file that changed while it was read.
+    stat = os.stat(path)
+    if index.size == stat.st_size and index.mtime_ns == stat.st_mtime_ns:
+        try:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = index_path.with_name(f'{index_path.name}.{os.getpid()}.tmp')
+            with temporary_path.open('w', encoding='utf-8') as index_file:
+                json.dump({'version': INDEX_VERSION, **asdict(index)}, index_file)
+            os.replace(temporary_path, index_path)
+        except OSError:
+            pass
+    return index
+
+
+def generate_indexed_binary_cookies(path: Path, record_offsets: Iterable[int]) -> Iterator[CookieData]:
+    """
+    Generate cookies by decoding records at known offsets.
+
+    Args:
+        path: binary cookies file path
+        record_offsets: record file offsets, e.g. from an index
+
+    Returns:
+        cookie iterator
+    """
+    rows_scanned = METRICS.sample('rows_scanned_total', format='binarycookies')
+    with open(path, 'rb') as binary_file:
+        with mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in record_offsets:
+                rows_scanned.value += 1
+                record_size = unpack_from('<i', data, offset)[0]
+                yield decode_binary_cookie(data[offset:offset + record_size])
@@ -0,0 +1,126 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+JSON lines cookie file handling.
+
+Each line is a JSON object with CookieData fields, as written by the "--jsonl"
+query option. Records with a "type" other than "cookie", e.g. "store" records
+written by the scan command, are skipped. Missing fields get empty defaults.
+"""
+
+import json
+from pathlib import Path
+from typing import Iterator
+
+from cookiescope.cookies import CookieData
+from cookiescope.metrics import METRICS
+from cookiescope.utility import open_binary_file, warning
+
+#: Fields that identify a cookie record.
+REQUIRED_FIELDS = ['domain', 'name']
+#: Record types that identify a JSON lines cookie file.
+RECORD_TYPES = ['cookie', 'store']
+#: Bytes read to identify a JSON lines cookie file.
+DETECTION_BYTES = 64 * 1024
+
+
+def parse_cookie_record(record: dict) -> CookieData | None:
+    """
+    Convert a JSON record to cookie data.
+
+    Args:
+        record: decoded JSON record
+
+    Returns:
+        cookie or None if the record is not a cookie
+    """
+    if record.get('type', 'cookie') != 'cookie':
+        return None
+    if any(not isinstance(record.get(field_name), str) for field_name in REQUIRED_FIELDS):
+        return None
+    return CookieData(
+        domain=record['domain'],
+        name=record['name'],
+        path=record.get('path') or '',
+        value=record.get('value') or '',
+        http_only=bool(record.get('http_only')),
+        secure=bool(record.get('secure')),
+        expires=int(record.get('expires') or 0),
+        created=int(record.get('created') or 0),
+    )
+
+
+def is_jsonl_cookies_file(path: Path) -> bool:
+    """
+    Check if file appears to be a JSON lines cookie file.
+
+    Only the first non-blank line is checked.
+
+    Args:
+        path: file path
+
+    Returns:
+        True if the first record is a cookie or scan store record
+    """
+    with open_binary_file(path) as binary_file:
+        head = binary_file.read(DETECTION_BYTES)
+    raw_line = head.lstrip().split(b'\n', maxsplit=1)[0]
+    if not raw_line.startswith(b'{'):
+        return False
+    try:
+        record = json.loads(raw_line)
+    except ValueError:
+        return False
+    if not isinstance(record, dict):
+        return False
+    if 'type' in record:
+        return record['type'] in RECORD_TYPES
+    return parse_cookie_record(record) is not None
+
+
+def generate_jsonl_cookies(path: Path) -> Iterator[CookieData]:
+    """
+    Generate cookies by reading a JSON lines file line by line.
+
+    Args:
+        path: file path
+
+    Returns:
+        cookie iterator
+    """
+    bad_line_count = 0
+    rows_scanned = METRICS.sample('rows_scanned_total', format='jsonl')
+    with open_binary_file(path) as binary_file:
+        for raw_line in binary_file:
+            if not raw_line.strip():
+                continue
+            rows_scanned.value += 1
+            try:
+                record = json.loads(raw_line)
+            except ValueError:
+                bad_line_count += 1
+                continue
+            try:
+                cookie = parse_cookie_record(record)
+            except (AttributeError, TypeError, ValueError):
+                bad_line_count += 1
+                continue
+            if cookie is not None:
+                yield cookie
+    if bad_line_count:
+        warning(f'Skipped {bad_line_count} malformed JSON line(s): {path}')
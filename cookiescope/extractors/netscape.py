@@ -0,0 +1,129 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Netscape cookie jar (curl/wget cookies.txt) handling.
+
+https://curl.se/docs/http-cookies.html
+"""
+
+from io import TextIOWrapper
+from pathlib import Path
+from typing import Iterator
+
+from cookiescope.cookies import CookieData, CookieView
+from cookiescope.metrics import METRICS
+from cookiescope.utility import open_binary_file, warning
+
+#: Header comments that identify a cookie jar, e.g. as written by curl.
+JAR_HEADERS = ['# Netscape HTTP Cookie File', '# HTTP Cookie File']
+#: Domain prefix marking HTTP-only cookies.
+HTTP_ONLY_PREFIX = '#HttpOnly_'
+#: Number of tab-separated fields per cookie line.
+JAR_FIELD_COUNT = 7
+#: Bytes read to identify a cookie jar file.
+DETECTION_BYTES = 64 * 1024
+
+
+def parse_cookie_jar_line(line: str) -> CookieData | None:
+    """
+    Parse a cookie jar line.
+
+    Args:
+        line: cookie jar line without the line ending
+
+    Returns:
+        cookie or None for comments, blank lines, and malformed lines
+    """
+    http_only = line.startswith(HTTP_ONLY_PREFIX)
+    if http_only:
+        line = line[len(HTTP_ONLY_PREFIX):]
+    elif not line or line.startswith('#'):
+        return None
+    fields = line.split('\t')
+    if len(fields) != JAR_FIELD_COUNT:
+        return None
+    domain, _subdomains, path, secure, expires, name, value = fields
+    try:
+        expires_timestamp = int(expires)
+    except ValueError:
+        return None
+    return CookieView(
+        domain=domain,
+        name=name,
+        path=path,
+        http_only=http_only,
+        secure=secure.upper() == 'TRUE',
+        expires=expires_timestamp,
+        created=0,
+        raw_value=value,
+    )
+
+
+def is_cookie_jar_file(path: Path) -> bool:
+    """
+    Check if file appears to be a Netscape cookie jar.
+
+    It is a cookie jar if it starts with a known header comment, or if the first
+    line that isn't blank or a comment parses as a cookie.
+
+    Args:
+        path: file path
+
+    Returns:
+        True if the file contains a cookie jar
+    """
+    with open_binary_file(path) as binary_file:
+        head = binary_file.read(DETECTION_BYTES)
+    if b'\0' in head:
+        return False
+    lines = head.decode('utf-8', errors='replace').splitlines()
+    # The last line may be truncated.
+    if len(head) == DETECTION_BYTES:
+        lines = lines[:-1]
+    for line in lines:
+        line = line.rstrip('\r')
+        if any(line.startswith(header) for header in JAR_HEADERS):
+            return True
+        if line.strip() and (not line.startswith('#') or line.startswith(HTTP_ONLY_PREFIX)):
+            return parse_cookie_jar_line(line) is not None
+    return False
+
+
+def generate_cookie_jar_cookies(path: Path) -> Iterator[CookieData]:
+    """
+    Generate cookies by reading a cookie jar file line by line.
+
+    Args:
+        path: file path
+
+    Returns:
+        cookie iterator
+    """
+    bad_line_count = 0
+    rows_scanned = METRICS.sample('rows_scanned_total', format='netscape')
+    with open_binary_file(path) as binary_file:
+        for line in TextIOWrapper(binary_file, encoding='utf-8', errors='replace'):
+            line = line.rstrip('\r\n')
+            cookie = parse_cookie_jar_line(line)
+            if cookie is not None:
+                rows_scanned.value += 1
+                yield cookie
+            elif line.strip() and (not line.startswith('#') or line.startswith(HTTP_ONLY_PREFIX)):
+                bad_line_count += 1
+    if bad_line_count:
+        warning(f'Skipped {bad_line_count} malformed cookie jar line(s): {path}')
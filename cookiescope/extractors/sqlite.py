@@ -15,38 +15,106 @@
 # You should have received a copy of the GNU General Public License
 # along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
 
+import multiprocessing
+import os
 import sqlite3
-from abc import ABC, abstractmethod
-from collections import namedtuple
+from abc import ABC
 from pathlib import Path
-from typing import Iterable, Iterator
+from tempfile import mkstemp
+from time import time
+from typing import Callable, Iterable, Iterator
 from urllib.parse import unquote
 
-from cookiescope.cookies import CookieData, FilterBy, SortBy, filter_cookies, sort_cookies
-from cookiescope.utility import open_binary_file
+from cookiescope.analytics import ColumnRow
+from cookiescope.archives import ArchiveMember
+from cookiescope.cookies import (
+    CookieData,
+    CookieView,
+    FILTER_FIELDS,
+    Filter,
+    FilterBy,
+    SortBy,
+    filter_cookies,
+    sort_cookies,
+)
+from cookiescope.pagination import (
+    CookiesPage,
+    decode_page_token,
+    encode_page_token,
+    get_cookies_page,
+    get_page_sort_fields,
+)
+from cookiescope.metrics import METRICS, MetricsSnapshot
+from cookiescope.profiling import PROFILER
+from cookiescope.sites import get_site
+from cookiescope.stats import GroupStats, StatsAggregator, get_expiry_bucket_sql
+from cookiescope.utility import abort, open_binary_file, replace_file
+
+#: Fields that can be filtered inside SQLite. Values are excluded, because
+#: they are compared unquoted and may be encrypted.
+PUSHDOWN_FILTER_FIELDS = ['domain', 'name', 'path']
+#: Default number of rows deleted per statement when purging requires decryption.
+DEFAULT_PURGE_BATCH_SIZE = 500
+#: Row ID partitions per worker process for parallel scans. Extra partitions
+#: balance the load when rows are spread unevenly across the row ID range.
+PARTITIONS_PER_JOB = 4
+#: Minimum rows per worker process, below which scans stay in one process.
+MIN_ROWS_PER_JOB = 10000
+
+#: Cookies database of a parallel scan worker process, set by the initializer.
+_worker_cookies_db: 'SQLiteCookiesBase | None' = None
+
+
+def _init_scan_worker(cookies_db: 'SQLiteCookiesBase'):
+    """
+    Worker process initializer for parallel scans.
+
+    Args:
+        cookies_db: cookies database, including any prepared decryptor
+    """
+    global _worker_cookies_db
+    _worker_cookies_db = cookies_db
+    # Forked workers inherit the parent's metrics, which must not be counted twice.
+    METRICS.reset()
+
+
+def _scan_partition_worker(task: tuple[str, dict, list[Filter]]) -> tuple[list[tuple], MetricsSnapshot]:
+    """
+    Worker process function to scan one row ID partition.
+
+    Args:
+        task: (query, parameters, filters left for Python) tuple
+
+    Returns:
+        (list of filtered cookie tuples in CookieView argument order, with stored values,
+        metrics recorded for the partition) tuple
+    """
+    query, parameters, remaining_filters = task
+    make_cookie = _worker_cookies_db.get_cookie_factory()
+    connection = _worker_cookies_db.connect_read_only()
+    try:
+        rows = METRICS.count_items('rows_scanned_total', connection.execute(query, parameters), format='sqlite')
+        cookies = filter_cookies(map(make_cookie, rows), remaining_filters)
+        cookie_tuples = [
+            (cookie.domain, cookie.name, cookie.path, cookie.http_only, cookie.secure,
+             cookie.expires, cookie.created, cookie.get_stored_value())
+            for cookie in cookies
+        ]
+        return cookie_tuples, METRICS.take_snapshot(reset=True)
+    finally:
+        connection.close()
 
 
 class SQLiteCookiesBase(ABC):
     """Base utility class for SQLite cookie access."""
 
-    #: Named tuple that row data is assigned to.
-    CanonicalRow = namedtuple(
-        'CanonicalRow',
-        [
-            'domain',
-            'name',
-            'value',
-            'path',
-            'has_expires',
-            'expires_utc',
-            'creation_utc',
-            'httponly',
-            'secure',
-        ]
-    )
+    #: Must be provided by the subclass. Describes the schema by mapping
+    #: CookieData field names to SQL expressions producing the same values,
+    #: including Unix timestamps, except that "value" is raw (HTTP-quoted).
+    field_expressions: dict[str, str] = None
 
-    #: Must be provided by the subclass.
-    DatabaseRow: namedtuple = None
+    #: Encrypted value column, if the subclass supports encrypted values.
+    encrypted_value_column: str = None
 
     def __init__(self, path: Path, table_name: str):
         """
@@ -58,10 +126,34 @@ class SQLiteCookiesBase(ABC):
         """
         self.path = path
         self.table_name = table_name
-        assert self.DatabaseRow is not None
-        # noinspection PyProtectedMember
-        columns_string = ", ".join(self.DatabaseRow._fields)
-        self.cookie_query = f'SELECT {columns_string} FROM {self.table_name}'
+        assert self.field_expressions is not None
+        self.cookie_columns = self.compile_cookie_columns()
+        self.cookie_query = f'SELECT {self.cookie_columns} FROM {self.table_name}'
+
+    def compile_cookie_columns(self) -> str:
+        """
+        Compile field expressions into SELECT columns in CookieData field order.
+
+        Booleans are normalized to 0 or 1 and timestamps are converted in SQL.
+        The encrypted value column, if any, is appended.
+
+        Returns:
+            comma-separated column expressions
+        """
+        fields = self.field_expressions
+        columns = [
+            fields['domain'],
+            fields['name'],
+            fields['path'],
+            fields['value'],
+            f'({fields["http_only"]}) != 0',
+            f'({fields["secure"]}) != 0',
+            fields['expires'],
+            fields['created'],
+        ]
+        if self.encrypted_value_column:
+            columns.append(self.encrypted_value_column)
+        return ', '.join(columns)
 
     def is_cookies_db(self) -> bool:
         """
@@ -75,7 +167,7 @@ class SQLiteCookiesBase(ABC):
             pass
         # Then see if we can query it as a cookies database.
         try:
-            connection = sqlite3.connect(self.path)
+            connection = self.connect()
             try:
                 cursor = connection.execute(
                     f"SELECT count(*) from sqlite_master "
@@ -90,45 +182,636 @@ class SQLiteCookiesBase(ABC):
         except sqlite3.Error:
             return False
 
-    @abstractmethod
-    def canonicalize_row(self, row: DatabaseRow) -> CanonicalRow:
+    def get_filter_clause(self, filter_by: FilterBy | None) -> tuple[str, dict[str, str], list[Filter]]:
+        """
+        Convert filters to an SQL WHERE clause where possible.
+
+        Filtering in SQLite avoids converting rows that would be rejected. Note
+        that SQLite lower() only lower-cases ASCII characters. Parameters are
+        named, so that callers can add their own named parameters.
+
+        Site filters are also left for Python, but since a site is part of the
+        domain, the same values pre-filter domains in SQLite.
+
+        Args:
+            filter_by: optional (name, values) filter pairs
+
+        Returns:
+            (WHERE clause or empty string, parameters, filters left for Python) tuple
+        """
+        conditions: list[str] = []
+        parameters: dict[str, str] = {}
+        remaining_filters: list[Filter] = []
+        for name, values in filter_by or []:
+            if name not in PUSHDOWN_FILTER_FIELDS or name not in FILTER_FIELDS:
+                remaining_filters.append((name, values))
+                if name != 'site':
+                    continue
+            expression = self.field_expressions['domain' if name == 'site' else name]
+            value_conditions: list[str] = []
+            for value in values:
+                parameter_name = f'filter{len(parameters)}'
+                value_conditions.append(f'instr(lower({expression}), :{parameter_name}) > 0')
+                parameters[parameter_name] = value.lower()
+            conditions.append(f'({" OR ".join(value_conditions)})')
+        if not conditions:
+            return '', parameters, remaining_filters
+        return f'WHERE {" AND ".join(conditions)}', parameters, remaining_filters
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Open a database connection.
+
+        Archive members are deserialized into an in-memory database.
+
+        Returns:
+            database connection
+        """
+        if isinstance(self.path, ArchiveMember):
+            return self.path.open_sqlite()
+        return sqlite3.connect(self.path)
+
+    def connect_read_only(self) -> sqlite3.Connection:
+        """
+        Open a read-only database connection.
+
+        Archive members are deserialized into a private in-memory database.
+
+        Returns:
+            database connection
+        """
+        if isinstance(self.path, ArchiveMember):
+            return self.path.open_sqlite()
+        return sqlite3.connect(f'{self.path.absolute().as_uri()}?mode=ro', uri=True)
+
+    def prepare_decryption(self):
+        """
+        Prepare decryption before values are decrypted in worker processes.
+
+        Subclasses with encrypted values can override this to set up their
+        decryptor once, e.g. to access the keyring once, instead of once per
+        worker. The base class does nothing.
+        """
+        pass
+
+    def start_decryption(self):
+        """
+        Start preparing decryption in the background, while rows are scanned.
+
+        Subclasses with encrypted values can override this, e.g. to access the
+        keyring and derive keys in a background thread. The base class does
+        nothing.
+        """
+        pass
+
+    def is_decryption_ready(self) -> bool:
+        """
+        Check if values can be decrypted without waiting for background setup.
+
+        Returns:
+            True if decryption is ready, always True in the base class
+        """
+        return True
+
+    def get_cookie_factory(self, unquote_value: Callable[[str], str] = unquote) -> Callable[[tuple], CookieData]:
+        """
+        Get a function that converts a compiled query row to cookie data.
+
+        Cookies are views that unquote values when first read. Subclasses with
+        an encrypted value column override this to also decrypt values.
+
+        Args:
+            unquote_value: optional value unquoting function
+
+        Returns:
+            row conversion function
+        """
+        def _make_cookie(row: tuple) -> CookieData:
+            domain, name, path, value, http_only, secure, expires, created = row
+            return CookieView(domain, name, path, http_only == 1, secure == 1, expires, created,
+                              value, None, unquote_value)
+        return _make_cookie
+
+    def generate_overlapped_cookies(self,
+                                    rows: Iterable[tuple],
+                                    make_cookie: Callable[[tuple], CookieData],
+                                    ) -> Iterator[CookieData]:
+        """
+        Convert rows while decryption is prepared in the background.
+
+        Rows flow until the first encrypted row. From then on rows are held,
+        in order, until decryption is ready, so the scan continues while the
+        keyring and key derivation are busy, and the output order is unchanged.
+
+        Args:
+            rows: compiled query rows, with the encrypted value last
+            make_cookie: row conversion function
+
+        Returns:
+            cookie iterator
+        """
+        rows = iter(rows)
+        held_rows: list[tuple] = []
+        for row in rows:
+            if held_rows or row[-1]:
+                held_rows.append(row)
+                if self.is_decryption_ready():
+                    break
+            else:
+                yield make_cookie(row)
+        if held_rows:
+            with PROFILER.stage('decryptor_wait'):
+                self.prepare_decryption()
+            yield from map(make_cookie, held_rows)
+            yield from map(make_cookie, rows)
+
+    def get_rowid_partitions(self, partitions: int, min_rows: int) -> list[tuple[int, int]] | None:
+        """
+        Split the table row ID range into contiguous partitions.
+
+        The row count is estimated from the row ID range, which SQLite finds
+        without scanning the table.
+
+        Args:
+            partitions: number of partitions
+            min_rows: minimum estimated row count for partitioning
+
+        Returns:
+            list of inclusive (low, high) row ID ranges, or None if too few rows
+        """
+        connection = self.connect_read_only()
+        try:
+            low, high = connection.execute(f'SELECT min(rowid), max(rowid) FROM {self.table_name}').fetchone()
+        finally:
+            connection.close()
+        if low is None or high - low + 1 < min_rows:
+            return None
+        size = (high - low + partitions) // partitions
+        return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
+
+    def has_encrypted_values(self, where_clause: str, parameters: dict) -> bool:
+        """
+        Check if any rows matching a WHERE clause have encrypted values.
+
+        Args:
+            where_clause: WHERE clause or empty string
+            parameters: WHERE clause parameters
+
+        Returns:
+            True if decryption will be needed
+        """
+        if not self.encrypted_value_column:
+            return False
+        condition = f'length({self.encrypted_value_column}) > 0'
+        where_clause = f'{where_clause} AND {condition}' if where_clause else f'WHERE {condition}'
+        connection = self.connect_read_only()
+        try:
+            return connection.execute(
+                f'SELECT 1 FROM {self.table_name} {where_clause} LIMIT 1', parameters).fetchone() is not None
+        finally:
+            connection.close()
+
+    def generate_partitioned_cookies(self,
+                                     where_clause: str,
+                                     parameters: dict,
+                                     remaining_filters: list[Filter],
+                                     partitions: list[tuple[int, int]],
+                                     jobs: int,
+                                     ordered: bool,
+                                     ) -> Iterator[CookieData]:
         """
-        Required method to convert database row to canonical row.
+        Scan row ID partitions in worker processes.
+
+        Each worker opens its own read-only connection, and converts, decrypts,
+        and filters the rows of one partition at a time. Any decryptor is
+        prepared once and shared with the workers, so that the keyring is only
+        accessed once.
+
         Args:
-            row: database row
+            where_clause: WHERE clause for filters pushed down to SQLite
+            parameters: WHERE clause parameters
+            remaining_filters: filters applied to converted rows
+            partitions: inclusive (low, high) row ID ranges
+            jobs: number of worker processes
+            ordered: yield cookies in row ID order if True, or as partitions complete
 
         Returns:
-            canonical row
+            cookie iterator
         """
-        ...
+        if self.has_encrypted_values(where_clause, parameters):
+            self.prepare_decryption()
+        condition = 'rowid BETWEEN :rowid_low AND :rowid_high'
+        where_clause = f'{where_clause} AND {condition}' if where_clause else f'WHERE {condition}'
+        query = f'{self.cookie_query} {where_clause}'
+        tasks = [
+            (query, {**parameters, 'rowid_low': low, 'rowid_high': high}, remaining_filters)
+            for low, high in partitions
+        ]
+        make_cookie = PROFILER.function('convert', CookieView)
+        with multiprocessing.Pool(jobs, initializer=_init_scan_worker, initargs=(self,)) as pool:
+            scan_partition = pool.imap if ordered else pool.imap_unordered
+            for rows, snapshot in PROFILER.iterate('parallel_scan', scan_partition(_scan_partition_worker, tasks)):
+                METRICS.merge(snapshot)
+                for row in rows:
+                    yield make_cookie(*row)
 
     def generate_cookies(self,
                          filter_by: FilterBy,
                          sort_by: SortBy,
+                         sort_memory_limit: int | None = None,
+                         jobs: int | None = None,
                          ) -> Iterable[CookieData]:
-        """Required override: query cookies with optional filtering and sorting."""
+        """
+        Query cookies with optional filtering and sorting.
+
+        With multiple jobs, large tables are scanned in row ID partitions by
+        worker processes. Partitions are merged in row ID order, so that output,
+        including the order of cookies with equal sort keys, matches a scan in
+        one process.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            sort_by: sort by named attributes in order provided
+            sort_memory_limit: optional sort memory budget in bytes
+            jobs: optional number of worker processes for scanning
+
+        Returns:
+            iterable cookies
+        """
+        where_clause, parameters, remaining_filters = self.get_filter_clause(filter_by)
+        if jobs is not None and jobs > 1:
+            partitions = self.get_rowid_partitions(jobs * PARTITIONS_PER_JOB, jobs * MIN_ROWS_PER_JOB)
+            if partitions:
+                cookies = self.generate_partitioned_cookies(where_clause, parameters, remaining_filters,
+                                                            partitions, jobs, ordered=True)
+                return sort_cookies(cookies, sort_by, sort_memory_limit)
+
         def _generate() -> Iterator[CookieData]:
-            connection = sqlite3.connect(self.path)
+            # Prepare decryption concurrently, unless no matching rows need it.
+            background_decryption = False
+            if not self.is_decryption_ready() and self.has_encrypted_values(where_clause, parameters):
+                self.start_decryption()
+                background_decryption = not self.is_decryption_ready()
+            # Profiling wrappers are applied once, and are no-ops when disabled.
+            unquote_value = PROFILER.function('unquote', unquote)
+            make_cookie = PROFILER.function('convert', self.get_cookie_factory(unquote_value))
+            with PROFILER.stage('sqlite_open'):
+                connection = self.connect()
             try:
                 cursor = connection.cursor()
                 try:
-                    cursor.execute(self.cookie_query)
-                    for raw_row in cursor:
-                        row = self.canonicalize_row(self.DatabaseRow(*raw_row))
-                        yield CookieData(
-                            domain=row.domain,
-                            name=row.name,
-                            path=row.path,
-                            value=unquote(row.value),
-                            http_only=bool(row.httponly),
-                            secure=bool(row.secure),
-                            expires=row.expires_utc if row.has_expires else 0,
-                            created=row.creation_utc,
-                        )
+                    with PROFILER.stage('sqlite_scan'):
+                        cursor.execute(f'{self.cookie_query} {where_clause}', parameters)
+                    rows = PROFILER.iterate('sqlite_scan', METRICS.count_items('rows_scanned_total', cursor,
+                                                                               format='sqlite'))
+                    if background_decryption:
+                        yield from self.generate_overlapped_cookies(rows, make_cookie)
+                    else:
+                        yield from map(make_cookie, rows)
                 finally:
                     cursor.close()
             finally:
                 connection.close()
         # Avoid excess memory consumption by passing generator to filtering/sorting.
-        filtered_cookies = filter_cookies(_generate(), filter_by)
-        return sort_cookies(filtered_cookies, sort_by)
+        filtered_cookies = filter_cookies(_generate(), remaining_filters)
+        return sort_cookies(filtered_cookies, sort_by, sort_memory_limit)
+
+    def get_cookies_page(self,
+                         filter_by: FilterBy | None,
+                         sort_by: SortBy | None,
+                         page_size: int,
+                         page_token: str = None,
+                         ) -> CookiesPage:
+        """
+        Get one page of cookies with keyset pagination.
+
+        Pages are ordered by the sort fields and then row ID. Each page is read
+        with a "WHERE (key) > (last key) ORDER BY key LIMIT n" query on its own
+        connection, which is closed before returning. Without sort fields pages
+        seek directly by row ID. Otherwise SQLite sorts candidates, keeping only
+        a page of rows. Filters applied in Python, e.g. on values, may need more
+        queries to fill a page, and may leave the last page empty.
+
+        Sorting by value, which may be encrypted, falls back to a scan.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            sort_by: optional sort field names in priority order
+            page_size: maximum cookies per page
+            page_token: optional continuation token from the previous page
+
+        Returns:
+            cookie page
+        """
+        sort_fields = get_page_sort_fields(sort_by)
+        if any(sort_field not in PUSHDOWN_FILTER_FIELDS for sort_field in sort_fields):
+            return get_cookies_page(self.generate_cookies(filter_by, None), sort_fields, filter_by,
+                                    page_size, page_token)
+        if page_size < 1:
+            raise ValueError('Page size must be positive.')
+        after = decode_page_token(page_token, sort_fields, filter_by) if page_token else None
+        where_clause, parameters, remaining_filters = self.get_filter_clause(filter_by)
+        key_expressions = [self.field_expressions[sort_field] for sort_field in sort_fields] + ['rowid']
+        key_columns = ', '.join(key_expressions)
+        key_placeholders = ', '.join(f':key{key_idx}' for key_idx in range(len(key_expressions)))
+        key_condition = f'({key_columns}) > ({key_placeholders})'
+        make_cookie = self.get_cookie_factory()
+        # One extra row tells whether another page follows.
+        batch_size = page_size + 1
+        cookies: list[CookieData] = []
+        connection = self.connect()
+        try:
+            while True:
+                query_where_clause = where_clause
+                query_parameters = {**parameters, 'limit': batch_size}
+                if after is not None:
+                    query_where_clause = (f'{where_clause} AND {key_condition}' if where_clause
+                                          else f'WHERE {key_condition}')
+                    query_parameters.update((f'key{key_idx}', value) for key_idx, value in enumerate(after))
+                rows = connection.execute(
+                    f'SELECT {key_columns}, {self.cookie_columns} FROM {self.table_name} {query_where_clause}'
+                    f' ORDER BY {key_columns} LIMIT :limit',
+                    query_parameters,
+                ).fetchall()
+                METRICS.increment('rows_scanned_total', len(rows), format='sqlite')
+                for row in rows:
+                    if len(cookies) == page_size:
+                        return CookiesPage(cookies, encode_page_token(sort_fields, filter_by, after))
+                    after = list(row[:len(key_expressions)])
+                    cookie = make_cookie(row[len(key_expressions):])
+                    if any(True for _cookie in filter_cookies([cookie], remaining_filters)):
+                        cookies.append(cookie)
+                if len(rows) < batch_size:
+                    return CookiesPage(cookies, None)
+        finally:
+            connection.close()
+
+    def generate_stats(self,
+                       group_by: str,
+                       filter_by: FilterBy,
+                       value_sizes: bool,
+                       ) -> Iterator[GroupStats]:
+        """
+        Generate aggregate statistics grouped by a cookie field.
+
+        Aggregation happens inside SQLite with GROUP BY, unless value filters or
+        value sizes require decrypted values. Then it falls back to streaming
+        aggregation over generated cookies. Site statistics fold SQLite domain
+        groups by site, so each distinct domain is looked up once.
+
+        Args:
+            group_by: grouping field name
+            filter_by: filters as a mapping of attribute names to filtered values
+            value_sizes: collect value sizes if True
+
+        Returns:
+            group statistics iterator ordered by key
+        """
+        now = int(time())
+        where_clause, parameters, remaining_filters = self.get_filter_clause(filter_by)
+        if remaining_filters or (value_sizes and self.encrypted_value_column):
+            aggregator = StatsAggregator(group_by, value_sizes, now=now)
+            aggregator.add_all(self.generate_cookies(filter_by, None))
+            yield from aggregator.generate_stats()
+            return
+        fields = self.field_expressions
+        value_bytes_expression = (f'sum(length(CAST({fields["value"]} AS BLOB)))'
+                                  if value_sizes else 'NULL')
+        # Group by key and expiry bucket, then fold buckets into GroupStats.
+        query = (f'SELECT {fields["domain" if group_by == "site" else group_by]} AS key,'
+                 f' {get_expiry_bucket_sql(fields["expires"])} AS bucket,'
+                 f' count(*),'
+                 f' sum(({fields["secure"]}) != 0),'
+                 f' sum(({fields["http_only"]}) != 0),'
+                 f' {value_bytes_expression}'
+                 f' FROM {self.table_name} {where_clause}'
+                 f' GROUP BY key, bucket ORDER BY key')
+        connection = self.connect()
+        try:
+            rows = connection.execute(query, {**parameters, 'now': now})
+            if group_by == 'site':
+                site_groups: dict[str, GroupStats] = {}
+                for key, bucket, count, secure, http_only, value_bytes in rows:
+                    site = get_site(key)
+                    group = site_groups.get(site)
+                    if group is None:
+                        group = site_groups[site] = GroupStats(site)
+                    group.add_counts(bucket, count, secure, http_only, value_bytes)
+                for site in sorted(site_groups.keys()):
+                    yield site_groups[site]
+                return
+            group: GroupStats | None = None
+            for key, bucket, count, secure, http_only, value_bytes in rows:
+                if group is None or group.key != key:
+                    if group is not None:
+                        yield group
+                    group = GroupStats(key)
+                group.add_counts(bucket, count, secure, http_only, value_bytes)
+            if group is not None:
+                yield group
+        finally:
+            connection.close()
+
+    def generate_column_rows(self, filter_by: FilterBy, value_sizes: bool) -> Iterable[ColumnRow]:
+        """
+        Generate (domain, expires, created, value size) column rows for analytics.
+
+        Columns are converted inside SQLite and fetched in one call, unless value
+        filters or value sizes require decrypted values. Then rows come from
+        generated cookies.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            value_sizes: provide value sizes if True, otherwise None
+
+        Returns:
+            column rows
+        """
+        where_clause, parameters, remaining_filters = self.get_filter_clause(filter_by)
+        if remaining_filters or (value_sizes and self.encrypted_value_column):
+            return [
+                (cookie.domain, cookie.expires, cookie.created,
+                 len(cookie.get_stored_value().encode('utf-8')) if value_sizes else None)
+                for cookie in self.generate_cookies(filter_by, None)
+            ]
+        fields = self.field_expressions
+        value_size_expression = f'length(CAST({fields["value"]} AS BLOB))' if value_sizes else 'NULL'
+        query = (f'SELECT {fields["domain"]}, {fields["expires"]}, {fields["created"]},'
+                 f' {value_size_expression} FROM {self.table_name} {where_clause}')
+        connection = self.connect()
+        try:
+            with PROFILER.stage('sqlite_scan'):
+                return connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def get_purge_clause(self, filter_by: FilterBy | None, expired: bool) -> tuple[str, dict, list[Filter]]:
+        """
+        Build the purge WHERE clause from filters and the expired flag.
+
+        Expired cookies have an expiration time that is not after the current
+        time, bound as the named parameter ":now". Session cookies never expire.
+
+        Args:
+            filter_by: optional (name, values) filter pairs
+            expired: only purge expired cookies if True
+
+        Returns:
+            (WHERE clause or empty string, parameters, filters left for Python) tuple
+        """
+        where_clause, parameters, remaining_filters = self.get_filter_clause(filter_by)
+        if expired:
+            expires_expression = self.field_expressions['expires']
+            condition = f'(({expires_expression}) != 0 AND ({expires_expression}) <= :now)'
+            where_clause = f'{where_clause} AND {condition}' if where_clause else f'WHERE {condition}'
+            parameters['now'] = int(time())
+        return where_clause, parameters, remaining_filters
+
+    def generate_purge_batches(self,
+                               connection: sqlite3.Connection,
+                               where_clause: str,
+                               parameters: dict,
+                               remaining_filters: list[Filter],
+                               batch_size: int,
+                               ) -> Iterator[list[int]]:
+        """
+        Generate batches of row IDs for rows matching filters applied in Python.
+
+        Rows are scanned in row ID order. The scan cursor is closed before each
+        batch is yielded, and the next scan resumes after the last scanned row
+        ID, so that no statement is open while a batch is deleted.
+
+        Args:
+            connection: database connection
+            where_clause: WHERE clause for filters pushed down to SQLite
+            parameters: WHERE clause parameters
+            remaining_filters: filters applied to converted rows
+            batch_size: maximum row IDs per batch
+
+        Returns:
+            row ID batch iterator
+        """
+        make_cookie = self.get_cookie_factory()
+        query = f'SELECT rowid, {self.cookie_columns} FROM {self.table_name} {where_clause} ORDER BY rowid'
+        resume_clause = (f'{where_clause} AND rowid > :last_rowid' if where_clause
+                         else 'WHERE rowid > :last_rowid')
+        resume_query = f'SELECT rowid, {self.cookie_columns} FROM {self.table_name} {resume_clause} ORDER BY rowid'
+        last_rowid: int | None = None
+        while True:
+            batch: list[int] = []
+            finished = True
+            if last_rowid is None:
+                cursor = connection.execute(query, parameters)
+            else:
+                cursor = connection.execute(resume_query, {**parameters, 'last_rowid': last_rowid})
+            try:
+                for rowid, *row in cursor:
+                    last_rowid = rowid
+                    cookie = make_cookie(row)
+                    for _cookie in filter_cookies([cookie], remaining_filters):
+                        batch.append(rowid)
+                    if len(batch) >= batch_size:
+                        finished = False
+                        break
+            finally:
+                cursor.close()
+            if batch:
+                yield batch
+            if finished:
+                return
+
+    def purge_cookies(self,
+                      filter_by: FilterBy | None,
+                      expired: bool = False,
+                      vacuum: bool = False,
+                      dry_run: bool = False,
+                      batch_size: int = DEFAULT_PURGE_BATCH_SIZE,
+                      ) -> int:
+        """
+        Delete cookies matching filters and/or expiration.
+
+        Filters that SQLite can evaluate become a single set-based DELETE in one
+        transaction. Value filters fall back to deleting batches of row IDs
+        selected by filtering converted (possibly decrypted) rows.
+
+        Deletion happens on a snapshot copy made with the SQLite backup API,
+        after checkpointing any write-ahead log. The original stays locked
+        against writers until the copy replaces it atomically.
+
+        Args:
+            filter_by: filters as a mapping of attribute names to filtered values
+            expired: only purge expired cookies if True
+            vacuum: vacuum the database after purging if True
+            dry_run: count matching cookies without deleting if True
+            batch_size: maximum rows per DELETE statement for value filters
+
+        Returns:
+            purged cookie count, or matching cookie count for a dry run
+        """
+        where_clause, parameters, remaining_filters = self.get_purge_clause(filter_by, expired)
+        if not where_clause and not remaining_filters:
+            abort('Refusing to purge all cookies. Provide filters and/or purge expired cookies.')
+        if dry_run:
+            connection = self.connect()
+            try:
+                if not remaining_filters:
+                    return connection.execute(
+                        f'SELECT count(*) FROM {self.table_name} {where_clause}', parameters).fetchone()[0]
+                return sum(len(batch) for batch in self.generate_purge_batches(
+                    connection, where_clause, parameters, remaining_filters, batch_size))
+            finally:
+                connection.close()
+        # Autocommit mode, so that the write lock below is taken explicitly.
+        original_connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            with PROFILER.stage('snapshot'):
+                busy, _log_frames, _checkpointed_frames = original_connection.execute(
+                    'PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+                if busy:
+                    abort(f'Unable to checkpoint busy database: {self.path}',
+                          'Make sure there are no foreground or background browser processes.')
+                # Block writers, but not readers, until the original is replaced, so
+                # that no commit lands in a write-ahead log left next to the replacement.
+                original_connection.execute('BEGIN IMMEDIATE')
+                original_stat = os.stat(self.path)
+            file_descriptor, copy_path_string = mkstemp(
+                prefix=f'.{self.path.name}.', suffix='.purge', dir=self.path.parent)
+            copy_path = Path(copy_path_string)
+            try:
+                os.close(file_descriptor)
+                copy_connection = sqlite3.connect(copy_path)
+                try:
+                    with PROFILER.stage('snapshot'):
+                        # The locking connection can't be the backup source.
+                        source_connection = sqlite3.connect(self.path)
+                        try:
+                            source_connection.backup(copy_connection)
+                        finally:
+                            source_connection.close()
+                    with PROFILER.stage('delete'):
+                        if not remaining_filters:
+                            cursor = copy_connection.execute(
+                                f'DELETE FROM {self.table_name} {where_clause}', parameters)
+                            count = cursor.rowcount
+                        else:
+                            count = 0
+                            for batch in self.generate_purge_batches(
+                                    copy_connection, where_clause, parameters, remaining_filters, batch_size):
+                                placeholders = ', '.join('?' * len(batch))
+                                copy_connection.execute(
+                                    f'DELETE FROM {self.table_name} WHERE rowid IN ({placeholders})', batch)
+                                count += len(batch)
+                        copy_connection.commit()
+                    if vacuum:
+                        with PROFILER.stage('vacuum'):
+                            copy_connection.execute('VACUUM')
+                finally:
+                    copy_connection.close()
+                with PROFILER.stage('replace'):
+                    replace_file(copy_path, self.path, original_stat)
+            finally:
+                if copy_path.exists():
+                    copy_path.unlink()
+        finally:
+            original_connection.close()
+        return count
@@ -0,0 +1,406 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope fleet index of scanned cookie stores.
+
+Scan results are kept in a SQLite database with one row per cookie, tagged
+with the user, browser, and profile of its store. Domains, names, paths, and
+sites repeat across stores, so each distinct string is stored once as a term,
+and cookie rows refer to terms by ID. Terms are indexed by an FTS5 table with
+the trigram tokenizer, so that partial, case-insensitive matches find terms,
+and then cookies through term ID indexes, instead of reading every row. Only
+new terms add to the full-text index, which keeps re-indexing stores cheap.
+
+Values are never stored. Optionally, a keyed hash of each value is stored,
+which supports exact value lookups without revealing values.
+
+Stores are identified by path, and only scanned again when their size or
+modification time changes, or when their previous scan failed. Stores that
+disappear from a scanned root directory are removed, and optionally all
+stores that weren't found, e.g. after home directories were deleted.
+"""
+
+import secrets
+import sqlite3
+from dataclasses import dataclass
+from hashlib import blake2b
+from pathlib import Path
+from time import time
+from typing import Callable, Iterable, Iterator
+
+from cookiescope.cookies import FilterBy
+from cookiescope.scan import DEFAULT_STORE_TIMEOUT, ScanRecord, StoreLocation, scan_stores
+from cookiescope.sites import get_site
+from cookiescope.utility import abort, warning
+
+#: Index schema version, stored in the meta table.
+INDEX_SCHEMA_VERSION = 1
+#: Fields supported by index query filters. "value" matches whole values by hash.
+INDEX_FILTER_FIELDS = ['domain', 'name', 'path', 'site', 'value']
+#: Fields stored as terms, i.e. searched with the trigram full-text index.
+TERM_FIELDS = ['domain', 'name', 'path', 'site']
+#: Shortest string the trigram tokenizer can match. Shorter strings are scanned for in terms.
+TRIGRAM_MIN_LENGTH = 3
+#: Value hash digest size in bytes.
+VALUE_HASH_SIZE = 16
+#: Cookie rows inserted per statement execution.
+INSERT_BATCH_SIZE = 1000
+
+INDEX_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS stores(
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    user TEXT NOT NULL,
+    browser TEXT NOT NULL,
+    profile TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    value_hashes INTEGER NOT NULL DEFAULT 0,
+    cookies INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    indexed REAL);
+CREATE TABLE IF NOT EXISTS terms(id INTEGER PRIMARY KEY, text TEXT NOT NULL UNIQUE);
+CREATE VIRTUAL TABLE IF NOT EXISTS term_text USING fts5(
+    text, content='terms', content_rowid='id', tokenize='trigram');
+CREATE TABLE IF NOT EXISTS cookies(
+    id INTEGER PRIMARY KEY,
+    store_id INTEGER NOT NULL REFERENCES stores(id),
+    domain_id INTEGER NOT NULL REFERENCES terms(id),
+    name_id INTEGER NOT NULL REFERENCES terms(id),
+    path_id INTEGER NOT NULL REFERENCES terms(id),
+    site_id INTEGER NOT NULL REFERENCES terms(id),
+    value_hash BLOB,
+    http_only INTEGER NOT NULL,
+    secure INTEGER NOT NULL,
+    expires INTEGER NOT NULL,
+    created INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS cookies_store ON cookies(store_id);
+CREATE INDEX IF NOT EXISTS cookies_domain ON cookies(domain_id);
+CREATE INDEX IF NOT EXISTS cookies_name ON cookies(name_id);
+CREATE INDEX IF NOT EXISTS cookies_path ON cookies(path_id);
+CREATE INDEX IF NOT EXISTS cookies_site ON cookies(site_id);
+CREATE INDEX IF NOT EXISTS cookies_value_hash ON cookies(value_hash) WHERE value_hash IS NOT NULL;
+'''
+
+
+@dataclass
+class IndexBuildSummary:
+    """Index build counts."""
+    #: Stores scanned because they were new, changed, or previously failed.
+    scanned: int = 0
+    #: Unchanged stores that were skipped.
+    unchanged: int = 0
+    #: Stores removed because they no longer exist under a scanned root.
+    removed: int = 0
+    #: Stores that failed or timed out.
+    failed: int = 0
+    #: Cookies indexed from scanned stores.
+    cookies: int = 0
+    #: Unused terms removed.
+    removed_terms: int = 0
+
+
+def open_index(index_path: Path, create: bool = False) -> sqlite3.Connection:
+    """
+    Open a fleet index database.
+
+    Args:
+        index_path: index database path
+        create: create the database if it doesn't exist if True
+
+    Returns:
+        database connection
+    """
+    if not create and not index_path.is_file():
+        abort(f'Index database not found: {index_path}')
+    try:
+        connection = sqlite3.connect(index_path)
+        if create:
+            connection.executescript(INDEX_SCHEMA)
+            connection.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('schema_version', ?)",
+                               (str(INDEX_SCHEMA_VERSION),))
+            connection.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('value_hash_key', ?)",
+                               (secrets.token_hex(32),))
+            connection.commit()
+        row = connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    except sqlite3.DatabaseError as exc:
+        abort('Unable to open index database due to exception:', str(index_path), str(exc))
+    if row is None or row[0] != str(INDEX_SCHEMA_VERSION):
+        abort(f'Unsupported index database version: {index_path}')
+    return connection
+
+
+def get_value_hasher(connection: sqlite3.Connection) -> Callable[[str], bytes]:
+    """
+    Get a function that hashes values with the index's secret key.
+
+    The key is random for each index, so that hashes of guessable values can't
+    be looked up without access to the index.
+
+    Args:
+        connection: index database connection
+
+    Returns:
+        function to convert a value to its hash
+    """
+    key = bytes.fromhex(connection.execute("SELECT value FROM meta WHERE key = 'value_hash_key'").fetchone()[0])
+
+    def _hash_value(value: str) -> bytes:
+        return blake2b(value.encode('utf-8', errors='surrogatepass'), key=key, digest_size=VALUE_HASH_SIZE).digest()
+
+    return _hash_value
+
+
+class _TermIds:
+    # Term IDs by text. New terms get IDs right away, and are added to the
+    # terms and full-text tables in bulk by flush(), which is much faster than
+    # adding them one at a time.
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.ids: dict[str, int] = {text: term_id for term_id, text in connection.execute('SELECT id, text FROM terms')}
+        self.next_id = max(self.ids.values(), default=0) + 1
+        self.new_terms: list[tuple[int, str]] = []
+
+    def get(self, text: str) -> int:
+        term_id = self.ids.get(text)
+        if term_id is None:
+            term_id = self.ids[text] = self.next_id
+            self.next_id += 1
+            self.new_terms.append((term_id, text))
+        return term_id
+
+    def flush(self):
+        if self.new_terms:
+            self.connection.executemany('INSERT INTO terms(id, text) VALUES (?, ?)', self.new_terms)
+            self.connection.executemany('INSERT INTO term_text(rowid, text) VALUES (?, ?)', self.new_terms)
+            self.new_terms = []
+
+
+def build_index(index_path: Path,
+                roots: Iterable[Path],
+                locations: Iterable[StoreLocation],
+                value_hashes: bool = False,
+                jobs: int = None,
+                timeout: float = DEFAULT_STORE_TIMEOUT,
+                prune: bool = False,
+                ) -> IndexBuildSummary:
+    """
+    Add or refresh scanned stores in a fleet index.
+
+    Only new stores, changed stores, stores that failed before, and stores
+    indexed with a different value hashing choice are scanned. Each store is
+    committed when its scan finishes, so an interrupted build resumes with the
+    stores that weren't finished.
+
+    Args:
+        index_path: index database path, created if it doesn't exist
+        roots: scanned root directories, for removing stores that disappeared
+        locations: store locations found under the root directories
+        value_hashes: decrypt values and store their hashes if True
+        jobs: maximum concurrent worker processes (default: CPU count)
+        timeout: per-store timeout in seconds
+        prune: remove all indexed stores that weren't found, not only those under the roots, if True
+
+    Returns:
+        build summary
+    """
+    summary = IndexBuildSummary()
+    connection = open_index(index_path, create=True)
+    try:
+        hash_value = get_value_hasher(connection) if value_hashes else None
+        indexed_stores = {
+            path: (store_id, size, mtime_ns, bool(store_value_hashes))
+            for path, store_id, size, mtime_ns, store_value_hashes
+            in connection.execute('SELECT path, id, size, mtime_ns, value_hashes FROM stores')
+        }
+        changed_locations: list[StoreLocation] = []
+        identities: dict[str, tuple[int, int]] = {}
+        store_ids: dict[str, int] = {}
+        found_paths: set[str] = set()
+        replaced_stores = 0
+        for location in locations:
+            path = str(location.path)
+            found_paths.add(path)
+            try:
+                # Identity is taken before scanning, so that changes during the scan are caught next time.
+                stat = location.path.stat()
+                identity = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                identity = (None, None)
+            indexed_store = indexed_stores.get(path)
+            if identity[0] is not None and indexed_store is not None and indexed_store[1:] == (*identity, value_hashes):
+                summary.unchanged += 1
+                continue
+            changed_locations.append(location)
+            identities[path] = identity
+            # The identity stays unset until the scan finishes.
+            if indexed_store is not None:
+                store_id = indexed_store[0]
+                replaced_stores += 1
+                connection.execute('DELETE FROM cookies WHERE store_id = ?', (store_id,))
+                connection.execute('UPDATE stores SET user = ?, browser = ?, profile = ?, size = NULL,'
+                                   ' mtime_ns = NULL, cookies = 0, error = NULL WHERE id = ?',
+                                   (location.user, location.browser, location.profile, store_id))
+            else:
+                store_id = connection.execute('INSERT INTO stores(path, user, browser, profile) VALUES (?, ?, ?, ?)',
+                                              (path, location.user, location.browser, location.profile)).lastrowid
+            store_ids[path] = store_id
+        root_paths = list(roots)
+        for path, indexed_store in indexed_stores.items():
+            if path not in found_paths and (prune or any(Path(path).is_relative_to(root) for root in root_paths)):
+                connection.execute('DELETE FROM cookies WHERE store_id = ?', (indexed_store[0],))
+                connection.execute('DELETE FROM stores WHERE id = ?', (indexed_store[0],))
+                summary.removed += 1
+        connection.commit()
+
+        insert_query = ('INSERT INTO cookies(store_id, domain_id, name_id, path_id, site_id, value_hash,'
+                        ' http_only, secure, expires, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+        term_ids = _TermIds(connection)
+        batch: list[tuple] = []
+        for record in scan_stores(changed_locations, filter_by=[], jobs=jobs, timeout=timeout, decrypt=value_hashes):
+            store_id = store_ids[record['store']]
+            if record['type'] == 'cookie':
+                batch.append((
+                    store_id,
+                    term_ids.get(record['domain']),
+                    term_ids.get(record['name']),
+                    term_ids.get(record['path']),
+                    term_ids.get(get_site(record['domain'])),
+                    hash_value(record['value']) if hash_value is not None and record['value'] is not None else None,
+                    int(record['http_only']),
+                    int(record['secure']),
+                    record['expires'],
+                    record['created'],
+                ))
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    term_ids.flush()
+                    connection.executemany(insert_query, batch)
+                    batch = []
+                continue
+            term_ids.flush()
+            if batch:
+                connection.executemany(insert_query, batch)
+                batch = []
+            summary.scanned += 1
+            if record['error']:
+                # Leave the identity unset, so that the store is scanned again next time.
+                warning(f'{record["store"]}: {record["error"]}')
+                summary.failed += 1
+                connection.execute('DELETE FROM cookies WHERE store_id = ?', (store_id,))
+                connection.execute('UPDATE stores SET error = ?, indexed = ? WHERE id = ?',
+                                   (record['error'], time(), store_id))
+            else:
+                size, mtime_ns = identities[record['store']]
+                summary.cookies += record['cookies']
+                connection.execute('UPDATE stores SET size = ?, mtime_ns = ?, value_hashes = ?, cookies = ?,'
+                                   ' indexed = ? WHERE id = ?',
+                                   (size, mtime_ns, int(value_hashes), record['cookies'], time(), store_id))
+            connection.commit()
+        # Replaced and removed cookies may leave terms unused.
+        if replaced_stores or summary.removed:
+            connection.execute(
+                'CREATE TEMP TABLE unused_terms AS SELECT id, text FROM terms'
+                ' WHERE NOT EXISTS (SELECT 1 FROM cookies WHERE domain_id = terms.id)'
+                ' AND NOT EXISTS (SELECT 1 FROM cookies WHERE name_id = terms.id)'
+                ' AND NOT EXISTS (SELECT 1 FROM cookies WHERE path_id = terms.id)'
+                ' AND NOT EXISTS (SELECT 1 FROM cookies WHERE site_id = terms.id)')
+            connection.execute("INSERT INTO term_text(term_text, rowid, text)"
+                               " SELECT 'delete', id, text FROM unused_terms")
+            summary.removed_terms = connection.execute(
+                'DELETE FROM terms WHERE id IN (SELECT id FROM unused_terms)').rowcount
+            connection.execute('DROP TABLE unused_terms')
+            connection.commit()
+    finally:
+        connection.close()
+    return summary
+
+
+def _get_match_term(value: str) -> str:
+    # Quote a full-text search string, i.e. a trigram substring match.
+    return '"' + value.replace('"', '""') + '"'
+
+
+def query_index(index_path: Path, filter_by: FilterBy, by_store: bool = False) -> Iterator[ScanRecord]:
+    """
+    Find indexed cookies matching all filters.
+
+    Domain, name, path, and site filter values match partially and ignore case.
+    Value filter values match whole values, using hashes stored by builds with
+    value hashing. Filter values of at least TRIGRAM_MIN_LENGTH characters are
+    looked up in the trigram index of terms, and shorter ones scan the terms.
+
+    Args:
+        index_path: index database path
+        filter_by: filters as a mapping of attribute names to filtered values
+        by_store: yield one "store" record with a match count per store if True
+
+    Returns:
+        iterator of "cookie" records, or "store" records if by_store is True
+    """
+    connection = open_index(index_path)
+    try:
+        hash_value = get_value_hasher(connection)
+        conditions: list[str] = []
+        parameters: list = []
+        for name, values in filter_by:
+            if name not in INDEX_FILTER_FIELDS:
+                abort(f'Unsupported index filter field: {name}')
+            if name == 'value':
+                conditions.append(f'c.value_hash IN ({", ".join("?" for _value in values)})')
+                parameters.extend(hash_value(value) for value in values)
+            elif all(len(value) >= TRIGRAM_MIN_LENGTH for value in values):
+                conditions.append(f'c.{name}_id IN (SELECT rowid FROM term_text WHERE term_text MATCH ?)')
+                parameters.append(' OR '.join(_get_match_term(value) for value in values))
+            else:
+                conditions.append(f'c.{name}_id IN (SELECT id FROM terms WHERE '
+                                  + ' OR '.join('instr(lower(text), ?) > 0' for _value in values) + ')')
+                parameters.extend(value.lower() for value in values)
+        where_clause = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        if by_store:
+            query = (f'SELECT s.user, s.browser, s.profile, s.path, count(*) FROM cookies c'
+                     f' JOIN stores s ON s.id = c.store_id {where_clause}'
+                     f' GROUP BY s.id ORDER BY s.user, s.browser, s.profile, s.path')
+            for user, browser, profile, store, count in connection.execute(query, parameters):
+                yield {'type': 'store', 'user': user, 'browser': browser, 'profile': profile, 'store': store,
+                       'matches': count}
+            return
+        query = (f'SELECT s.user, s.browser, s.profile, s.path, d.text, n.text, p.text, c.http_only, c.secure,'
+                 f' c.expires, c.created FROM cookies c JOIN stores s ON s.id = c.store_id'
+                 f' JOIN terms d ON d.id = c.domain_id JOIN terms n ON n.id = c.name_id'
+                 f' JOIN terms p ON p.id = c.path_id {where_clause}'
+                 f' ORDER BY s.user, s.browser, s.profile, s.path, d.text, n.text, p.text')
+        for (user, browser, profile, store, domain, name, path, http_only, secure,
+             expires, created) in connection.execute(query, parameters):
+            yield {
+                'type': 'cookie',
+                'user': user,
+                'browser': browser,
+                'profile': profile,
+                'store': store,
+                'domain': domain,
+                'name': name,
+                'path': path,
+                'http_only': bool(http_only),
+                'secure': bool(secure),
+                'expires': expires,
+                'created': created,
+            }
+    finally:
+        connection.close()
@@ -33,9 +33,26 @@ not recognizable at this point.
 """
 
 import argparse
+import cProfile
+import glob
+import json
 import os
+import sys
 from pathlib import Path
+from time import perf_counter, time
+from typing import Callable
 
+from cookiescope.analytics import analyze_columns, display_analytics, display_analytics_json, load_columns
+from cookiescope.archives import ARCHIVE_MEMBER_SEPARATOR, ArchiveMember
+from cookiescope.bloat import (
+    BLOAT_SORT_FIELDS,
+    DEFAULT_BLOAT_CONTRIBUTORS,
+    DEFAULT_BLOAT_TARGETS,
+    DEFAULT_HEADER_LIMIT,
+    compute_bloat,
+    display_bloat,
+    display_bloat_json,
+)
 from cookiescope.browsers import (
     BrowserBase,
     ChromeBrowser,
@@ -43,15 +60,30 @@ from cookiescope.browsers import (
     EdgeBrowser,
     FirefoxBrowser,
     GenericChromeBrowser,
+    JSONLBrowser,
+    NetscapeJarBrowser,
     SafariBrowser,
 )
 from cookiescope.cookies import (
     DEFAULT_SORT_FIELDS,
+    DEFAULT_SORT_MEMORY_LIMIT,
+    SORT_FIELDS,
     display_cookies,
     display_cookie_jar,
+    display_cookies_jsonl,
+    merge_sorted_cookies,
     get_filter_by,
+    get_sort_by,
+    sort_cookies,
 )
-from cookiescope.utility import abort
+from cookiescope.dedupe import DEDUPE_KEY_FIELDS, DEDUPE_POLICIES, dedupe_cookies
+from cookiescope.extractors import DEFAULT_PURGE_BATCH_SIZE
+from cookiescope.metrics import METRICS, METRICS_FORMATS
+from cookiescope.profiling import PROFILER
+from cookiescope.fleet_index import build_index, query_index
+from cookiescope.scan import DEFAULT_STORE_TIMEOUT, find_stores, scan_stores
+from cookiescope.stats import DEFAULT_GROUP_FIELD, GROUP_FIELDS, display_stats, display_stats_json
+from cookiescope.utility import abort, warning
 
 
 #: Command line help description.
@@ -61,7 +93,11 @@ CLI_EPILOG = '''
 Cookie source can be a browser name, e.g. "safari", or a cookies file path. A
 browser name can followed by ":<profile>" to specify a user profile. E.g.
 "firefox:lucy" targets the Firefox profile named "lucy". Otherwise it works with
-the default profile.
+the default profile. Cookies files can also be Netscape cookie jars or JSON lines
+files, e.g. as written with the "--jar" or "--jsonl" options.
+
+Additional cookie sources may follow the first one, before any filters. Their
+cookies are combined, and optionally de-duplicated with "--dedupe".
 
 Filter values match full or partial attribute values. Multiple filter values can
 be comma-separated. For the comparison, filter values are HTTP-quoted and
@@ -75,12 +111,121 @@ Frequently-used attribute names:
   * value - primary cookie data field
   * name - cookie name
   * domain - website domain responsible for cookie
+  * site - registrable domain (eTLD+1) of the cookie domain, e.g. "example.co.uk"
   * path - website location path string
 
 The following named browsers are supported:
 '''.strip()
+#: Command line help epilog text introducing commands.
+CLI_COMMANDS_EPILOG = '''
+Other commands are available, with separate help, e.g. "stats -h":'''
+#: Stats command help description.
+STATS_DESCRIPTION = 'Cookie statistics tool.'
+#: Stats command help epilog text.
+STATS_EPILOG = '''
+Displays per-group cookie counts, secure/HTTP-only counts, session cookie
+counts, and expiry histogram buckets relative to the current time.
+
+SQLite cookie databases are aggregated inside SQLite without decryption, unless
+value sizes are requested or filtering by value.
+'''.strip()
+#: Scan command help description.
+SCAN_DESCRIPTION = 'Cookie store scanning tool for many home directories.'
+#: Scan command help epilog text.
+SCAN_EPILOG = '''
+Finds cookie stores for every supported browser and profile under each root
+directory, which is treated as a home directory, i.e. it replaces "~" in the
+standard browser file locations. The root directory name is reported as the
+user name.
+
+Stores are read concurrently by worker processes. A store that fails or times
+out is reported without affecting other stores.
+
+Output is JSON lines. Each cookie is a "cookie" record tagged with user,
+browser, profile, and store path. Each store ends with a "store" record with
+the file size, modification time, cookie count, and any error.
+
+Decryption usually requires the store owner's keyring. Use --no-values when
+scanning other users' stores, e.g. as root.
+'''.strip()
+#: Index command help description.
+INDEX_DESCRIPTION = 'Fleet cookie index tool.'
+#: Index command help epilog text.
+INDEX_EPILOG = '''
+Commands:
+  build - scan stores under root directories into an index database
+  query - find indexed cookies by domain, name, path, site, or value
+
+Builds locate and read stores like the "scan" command. A store is only scanned
+again when its size or modification time changes, or its last scan failed.
+Stores that disappeared from a scanned root directory are removed. Add --prune
+to remove all indexed stores that weren't found, e.g. for deleted home
+directories that no longer match a root pattern.
+
+Values are not stored. With --value-hashes, builds decrypt values and store a
+keyed hash of each value, so that queries can match whole values. Domain and
+name queries of at least 3 characters use a trigram full-text index.
+
+Query output is JSON lines with "cookie" records, or "store" records with
+match counts when using --stores.
+'''.strip()
+#: Analyze command help description.
+ANALYZE_DESCRIPTION = 'Cookie expiry, age, and value size analytics tool.'
+#: Analyze command help epilog text.
+ANALYZE_EPILOG = '''
+Displays expiry windows and age buckets relative to the current time, value
+size percentiles, and optionally per-domain age and expiry distributions.
+
+Columns are read without building cookie objects where possible, e.g. inside
+SQLite or from Safari record headers. Computation is vectorized with NumPy when
+it is installed, and falls back to plain Python otherwise.
+'''.strip()
+#: Bloat command help description.
+BLOAT_DESCRIPTION = 'Cookie request header size report tool.'
+#: Bloat command help epilog text.
+BLOAT_EPILOG = '''
+Computes the Cookie header size a browser sends to every host and path in the
+cookie store, using domain, path, and secure flag matching, and ignoring expired
+cookies. Ranks the largest headers with their largest cookies, and the cookies
+that contribute the most bytes over all hosts and paths. Sizes over HTTPS
+include secure cookies, and "http_bytes" sizes over plain HTTP don't.
+
+Filters select the cookies that are counted. Use "site" filters to keep cookies
+of parent domains, which are also sent to subdomains.
+'''.strip()
+#: Profiles command help description.
+PROFILES_DESCRIPTION = 'Browser profile listing tool.'
+#: Profiles command help epilog text.
+PROFILES_EPILOG = '''
+Lists every browser profile with a cookies file, using Chrome-family "Local
+State" files and Firefox "profiles.ini" files. The listed profile names can be
+used in "browser:profile" cookie sources. Chrome-family profiles also match by
+display name.
+
+Parsed profile configurations are cached by modification time in the user cache
+directory, which the COOKIESCOPE_CACHE_DIR environment variable can override.
+An empty value disables the cache file.
+'''.strip()
+#: Purge command help description.
+PURGE_DESCRIPTION = 'Cookie purging tool.'
+#: Purge command help epilog text.
+PURGE_EPILOG = '''
+Deletes cookies that match all filters. With --expired only cookies that have
+expired are deleted. At least one filter or --expired is required.
+
+Domain, name, and path filters become a single SQL DELETE statement. Value
+filters require reading and possibly decrypting each candidate row, and delete
+matching rows in batches.
+
+The database is first copied to a snapshot next to it, and the snapshot is
+purged and then atomically moved over the original. Quit the browser first.
+The original is left unmodified if it changes while purging.
+
+Safari binary cookies files are rewritten to a temporary file in one pass,
+copying pages without purged cookies byte-for-byte.
+'''.strip()
 #: Cookie source argument help.
-COOKIE_SOURCE_HELP = 'cookies path or browser[:profile]'
+COOKIE_SOURCE_HELP = 'cookies path, ARCHIVE!/MEMBER path in a tar or zip archive, or browser[:profile]'
 FILTER_HELP = 'name=value expression for filtering on cookie fields'
 
 
@@ -97,6 +242,9 @@ FILE_CHECK_BROWSERS: list[type[BrowserBase]] = [
     FirefoxBrowser,
     SafariBrowser,
     ChromiumBrowser,
+    # Text formats are checked last, because detection is heuristic.
+    NetscapeJarBrowser,
+    JSONLBrowser,
 ]
 
 
@@ -105,13 +253,17 @@ def get_browser_for_cookie_source(cookie_source: str) -> BrowserBase:
     Get browser object based on cookie source (file path or browser name).
 
     Args:
-        cookie_source: file path or browser name
+        cookie_source: file path, archive member path, or browser name
 
     Returns:
         browser object for processing query
     """
+    file_path = None
     if os.path.isfile(cookie_source):
         file_path = Path(cookie_source)
+    elif ARCHIVE_MEMBER_SEPARATOR in cookie_source:
+        file_path = ArchiveMember.from_cookie_source(cookie_source)
+    if file_path is not None:
         for browser_class in FILE_CHECK_BROWSERS:
             browser = browser_class.from_file(file_path)
             if browser is not None:
@@ -138,26 +290,572 @@ def get_browser_for_cookie_source(cookie_source: str) -> BrowserBase:
     return browser
 
 
-def main():
-    """Main function."""
+def add_profile_arguments(arg_parser: argparse.ArgumentParser):
+    """
+    Add profiling and metrics options to a command argument parser.
+
+    Args:
+        arg_parser: command argument parser
+    """
+    arg_parser.add_argument('--profile', dest='PROFILE', action='store_true',
+                            help='display per-stage timings and counters on stderr')
+    arg_parser.add_argument('--profile-json', dest='PROFILE_JSON', action='store_true',
+                            help='display per-stage timings and counters on stderr as JSON')
+    arg_parser.add_argument('--profile-dump', dest='PROFILE_DUMP', metavar='PATH',
+                            help='run under cProfile and dump statistics to a file')
+    arg_parser.add_argument('--metrics', dest='METRICS', metavar='PATH',
+                            help='write operational metrics to a file at exit, e.g. for a textfile collector')
+    arg_parser.add_argument('--metrics-format', dest='METRICS_FORMAT', choices=METRICS_FORMATS,
+                            default=METRICS_FORMATS[0],
+                            help=f'metrics file format (default: {METRICS_FORMATS[0]})')
+
+
+def run_profiled(args: argparse.Namespace, function: Callable[[], None], command: str):
+    """
+    Run a command function with optional profiling and metrics output.
+
+    Metrics are written even if the command fails or aborts.
+
+    Args:
+        args: parsed arguments, including those added by add_profile_arguments()
+        function: command function to run
+        command: command name for metrics
+    """
+    if args.PROFILE or args.PROFILE_JSON:
+        PROFILER.enable()
+    start_time = perf_counter()
+    success = False
+    try:
+        if args.PROFILE_DUMP:
+            profile = cProfile.Profile()
+            try:
+                profile.runcall(function)
+            finally:
+                profile.dump_stats(args.PROFILE_DUMP)
+        else:
+            function()
+        success = True
+    finally:
+        if args.METRICS:
+            METRICS.set('run_seconds', perf_counter() - start_time, command=command)
+            METRICS.set('last_run_success', int(success), command=command)
+            METRICS.set('last_run_timestamp_seconds', time(), command=command)
+            METRICS.add_profiler_stages()
+            try:
+                METRICS.write(Path(args.METRICS), args.METRICS_FORMAT)
+            except OSError as exc:
+                warning(f'Unable to write metrics file: {args.METRICS}: {exc}')
+        if PROFILER.enabled:
+            total_seconds = perf_counter() - start_time
+            if args.PROFILE_JSON:
+                PROFILER.display_json(total_seconds)
+            else:
+                PROFILER.display_summary(total_seconds)
+
+
+def query_command(command_args: list[str]):
+    """
+    Default command to query and display cookies.
+
+    Args:
+        command_args: command line arguments
+    """
     epilog_parts = [CLI_EPILOG] + [f'  - {name}' for name in sorted(NAMED_BROWSERS.keys())]
+    epilog_parts.append(CLI_COMMANDS_EPILOG)
+    epilog_parts.extend(f'  - {name}' for name in sorted(COMMANDS.keys()))
     arg_parser = argparse.ArgumentParser(
         description=CLI_DESCRIPTION,
         epilog=os.linesep.join(epilog_parts),
         formatter_class=argparse.RawTextHelpFormatter,
     )
     arg_parser.add_argument(dest='COOKIE_SOURCE', help=COOKIE_SOURCE_HELP)
+    arg_parser.add_argument(dest='FILTER', nargs='*',
+                            help=f'{FILTER_HELP}, or additional cookie source before filters')
+    output_group = arg_parser.add_mutually_exclusive_group()
+    output_group.add_argument('-j', '--jar', dest='JAR', action='store_true',
+                              help='generate Netscape cookie jar format, e.g. for use with "curl"')
+    output_group.add_argument('--jsonl', dest='JSONL', action='store_true',
+                              help='generate JSON lines, i.e. one JSON object per cookie')
+    arg_parser.add_argument('--dedupe', dest='DEDUPE', choices=DEDUPE_POLICIES,
+                            help='collapse cookies with the same domain, name, and path across sources,'
+                                 ' keeping the newest or the first')
+    arg_parser.add_argument('--dedupe-by', dest='DEDUPE_BY', choices=DEDUPE_KEY_FIELDS, default='domain',
+                            help='identify duplicates by exact domain or by site (default: domain)')
+    arg_parser.add_argument('--sort', dest='SORT', metavar='FIELDS',
+                            help=f'comma-separated sort fields, prefixed with "-" for descending order,'
+                                 f' e.g. "site,-expires,name", or "" for no sorting'
+                                 f' (default: {",".join(DEFAULT_SORT_FIELDS)})\n'
+                                 f'fields: {", ".join(SORT_FIELDS)}, where "site" orders domains by'
+                                 f' reversed labels, so that subdomains follow their parent')
+    arg_parser.add_argument('--sort-memory', dest='SORT_MEMORY', type=int, metavar='MB',
+                            help=f'memory budget for sorting before spilling to temporary files'
+                                 f' (default: {DEFAULT_SORT_MEMORY_LIMIT // (1024 * 1024)})')
+    arg_parser.add_argument('--jobs', dest='JOBS', type=int, metavar='N',
+                            help='scan large SQLite databases with N worker processes')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    # Additional cookie sources precede filters, and aren't name=value expressions.
+    cookie_sources = [args.COOKIE_SOURCE]
+    filter_args = list(args.FILTER)
+    while filter_args and ('=' not in filter_args[0] or os.path.exists(filter_args[0])):
+        cookie_sources.append(filter_args.pop(0))
+    filter_by = get_filter_by(filter_args)
+    sort_by = get_sort_by(args.SORT) if args.SORT is not None else DEFAULT_SORT_FIELDS
+    if args.SORT_MEMORY is not None and args.SORT_MEMORY < 1:
+        abort('Sort memory budget must be positive.')
+    if args.JOBS is not None and args.JOBS < 1:
+        abort('Jobs count must be positive.')
+    sort_memory_limit = args.SORT_MEMORY * 1024 * 1024 if args.SORT_MEMORY else None
+
+    def _run():
+        with PROFILER.stage('open'):
+            browsers = [get_browser_for_cookie_source(cookie_source) for cookie_source in cookie_sources]
+        if len(browsers) == 1 and not args.DEDUPE:
+            cookies = browsers[0].generate_cookies(filter_by=filter_by,
+                                                   sort_by=sort_by,
+                                                   sort_memory_limit=sort_memory_limit,
+                                                   jobs=args.JOBS)
+        elif args.DEDUPE:
+            # Winners are only known after reading every source, so they are sorted afterwards.
+            source_cookies = (browser.generate_cookies(filter_by=filter_by, sort_by=None, jobs=args.JOBS)
+                              for browser in browsers)
+            cookies = sort_cookies(dedupe_cookies(source_cookies, args.DEDUPE, args.DEDUPE_BY),
+                                   sort_by, sort_memory_limit)
+        else:
+            # Each source is sorted on its own, sharing the memory budget, and the results are merged.
+            source_memory_limit = (sort_memory_limit or DEFAULT_SORT_MEMORY_LIMIT) // len(browsers)
+            cookies = merge_sorted_cookies([browser.generate_cookies(filter_by=filter_by,
+                                                                     sort_by=sort_by,
+                                                                     sort_memory_limit=source_memory_limit,
+                                                                     jobs=args.JOBS)
+                                            for browser in browsers],
+                                           sort_by)
+        if args.JAR:
+            display_cookie_jar(cookies)
+        elif args.JSONL:
+            display_cookies_jsonl(cookies)
+        else:
+            heading = ', '.join(f'{browser.name}: {browser.file_path}' for browser in browsers)
+            display_cookies(cookies, heading=heading)
+
+    run_profiled(args, _run, 'query')
+
+
+def stats_command(command_args: list[str]):
+    """
+    Stats command to display aggregate cookie statistics.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} stats',
+        description=STATS_DESCRIPTION,
+        epilog=STATS_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='COOKIE_SOURCE', help=COOKIE_SOURCE_HELP)
+    arg_parser.add_argument(dest='FILTER', nargs='*', help=FILTER_HELP)
+    arg_parser.add_argument('--by', dest='GROUP_BY', choices=GROUP_FIELDS, default=DEFAULT_GROUP_FIELD,
+                            help=f'field to group statistics by (default: {DEFAULT_GROUP_FIELD})')
+    arg_parser.add_argument('--value-sizes', dest='VALUE_SIZES', action='store_true',
+                            help='total value sizes, which may require decryption')
+    arg_parser.add_argument('--json', dest='JSON', action='store_true',
+                            help='generate JSON output')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    filter_by = get_filter_by(args.FILTER)
+
+    def _run():
+        with PROFILER.stage('open'):
+            browser = get_browser_for_cookie_source(args.COOKIE_SOURCE)
+        with PROFILER.stage('aggregate'):
+            stats = list(browser.generate_stats(args.GROUP_BY, filter_by, args.VALUE_SIZES))
+        with PROFILER.stage('output'):
+            if args.JSON:
+                display_stats_json(stats, args.GROUP_BY, source=str(browser.file_path))
+            else:
+                display_stats(stats, args.GROUP_BY, heading=f'{browser.name}: {browser.file_path}')
+
+    run_profiled(args, _run, 'stats')
+
+
+def add_root_arguments(arg_parser: argparse.ArgumentParser):
+    """
+    Add arguments for locating and reading stores under root directories.
+
+    Args:
+        arg_parser: argument parser
+    """
+    arg_parser.add_argument('--root', dest='ROOTS', action='extend', nargs='+', required=True, metavar='DIR',
+                            help='home directory or glob pattern to scan, e.g. /home/*')
+    arg_parser.add_argument('--browser', dest='BROWSERS', action='extend', nargs='+',
+                            choices=sorted(NAMED_BROWSERS.keys()),
+                            help='browser to scan (default: all)')
+    arg_parser.add_argument('--platform', dest='PLATFORM', choices=['darwin', 'linux', 'win32'],
+                            help=f'platform for file locations, e.g. for disk images (default: {sys.platform})')
+    arg_parser.add_argument('--jobs', dest='JOBS', type=int,
+                            help='maximum concurrent worker processes (default: CPU count)')
+    arg_parser.add_argument('--timeout', dest='TIMEOUT', type=float, default=DEFAULT_STORE_TIMEOUT,
+                            help=f'per-store timeout in seconds (default: {DEFAULT_STORE_TIMEOUT})')
+
+
+def get_roots(root_args: list[str], filter_args: list[str]) -> tuple[list[Path], list[str]]:
+    """
+    Expand root directory arguments, separating misplaced filter expressions.
+
+    "--root" consumes following arguments, e.g. for a shell-expanded "/home/*".
+    So name=value filter expressions that follow it are moved to the filters.
+
+    Args:
+        root_args: root directory or glob pattern arguments
+        filter_args: filter expression arguments
+
+    Returns:
+        (root directories, filter expressions) tuple
+    """
+    root_patterns = [root for root in root_args if '=' not in root or os.path.isdir(root)]
+    filter_args = filter_args + [root for root in root_args if root not in root_patterns]
+    roots: list[Path] = []
+    for root in root_patterns:
+        for root_path in sorted(glob.glob(root)) if glob.has_magic(root) else [root]:
+            if os.path.isdir(root_path):
+                roots.append(Path(root_path))
+            else:
+                warning(f'Ignoring root that is not a directory: {root_path}')
+    return roots, filter_args
+
+
+def scan_command(command_args: list[str]):
+    """
+    Scan command to read cookie stores under many home directories.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} scan',
+        description=SCAN_DESCRIPTION,
+        epilog=SCAN_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='FILTER', nargs='*', help=FILTER_HELP)
+    add_root_arguments(arg_parser)
+    arg_parser.add_argument('--no-values', dest='NO_VALUES', action='store_true',
+                            help='omit values and skip decryption, e.g. without keyring access')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    roots, filter_args = get_roots(args.ROOTS, args.FILTER)
+    filter_by = get_filter_by(filter_args)
+    if args.JOBS is not None and args.JOBS < 1:
+        abort('Jobs count must be positive.')
+    browser_classes = {name: NAMED_BROWSERS[name] for name in (args.BROWSERS or sorted(NAMED_BROWSERS.keys()))}
+
+    def _run():
+        locations = find_stores(roots, browser_classes, platform=args.PLATFORM)
+        for record in scan_stores(locations,
+                                  filter_by=filter_by,
+                                  jobs=args.JOBS,
+                                  timeout=args.TIMEOUT,
+                                  decrypt=not args.NO_VALUES):
+            if record['type'] == 'store' and record['error']:
+                warning(f'{record["store"]}: {record["error"]}')
+            print(json.dumps(record))
+
+    run_profiled(args, _run, 'scan')
+
+
+def index_build_command(command_args: list[str]):
+    """
+    Index build command to scan stores into a fleet index.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} index build',
+        description=INDEX_DESCRIPTION,
+        epilog=INDEX_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='INDEX', help='index database path, created if missing')
+    add_root_arguments(arg_parser)
+    arg_parser.add_argument('--value-hashes', dest='VALUE_HASHES', action='store_true',
+                            help='decrypt values and store keyed hashes of them, for value queries')
+    arg_parser.add_argument('--prune', dest='PRUNE', action='store_true',
+                            help='remove indexed stores that were not found under any root')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    roots, filter_args = get_roots(args.ROOTS, [])
+    if filter_args:
+        abort(f'Filters are not supported when building an index: {" ".join(filter_args)}')
+    if args.JOBS is not None and args.JOBS < 1:
+        abort('Jobs count must be positive.')
+    browser_classes = {name: NAMED_BROWSERS[name] for name in (args.BROWSERS or sorted(NAMED_BROWSERS.keys()))}
+
+    def _run():
+        summary = build_index(Path(args.INDEX),
+                              roots,
+                              find_stores(roots, browser_classes, platform=args.PLATFORM),
+                              value_hashes=args.VALUE_HASHES,
+                              jobs=args.JOBS,
+                              timeout=args.TIMEOUT,
+                              prune=args.PRUNE)
+        print(f'{summary.scanned} store(s) scanned with {summary.cookies} cookie(s),'
+              f' {summary.failed} failed, {summary.unchanged} unchanged, {summary.removed} removed:'
+              f' {args.INDEX}')
+
+    run_profiled(args, _run, 'index_build')
+
+
+def index_query_command(command_args: list[str]):
+    """
+    Index query command to find cookies in a fleet index.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} index query',
+        description=INDEX_DESCRIPTION,
+        epilog=INDEX_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='INDEX', help='index database path')
+    arg_parser.add_argument(dest='FILTER', nargs='*',
+                            help=f'{FILTER_HELP}, except that value filters match whole values')
+    arg_parser.add_argument('--stores', dest='STORES', action='store_true',
+                            help='generate one record per matching store with a match count')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    filter_by = get_filter_by(args.FILTER)
+
+    def _run():
+        for record in query_index(Path(args.INDEX), filter_by, by_store=args.STORES):
+            print(json.dumps(record))
+
+    run_profiled(args, _run, 'index_query')
+
+
+#: Index sub-command functions mapped by name.
+INDEX_COMMANDS: dict[str, Callable[[list[str]], None]] = {
+    'build': index_build_command,
+    'query': index_query_command,
+}
+
+
+def index_command(command_args: list[str]):
+    """
+    Index command to dispatch index sub-commands.
+
+    Args:
+        command_args: command line arguments
+    """
+    if not command_args or command_args[0] not in INDEX_COMMANDS:
+        if command_args and command_args[0] in ('-h', '--help'):
+            print(f'usage: {os.path.basename(sys.argv[0])} index {{{",".join(INDEX_COMMANDS.keys())}}} ...')
+            print('')
+            print(INDEX_DESCRIPTION)
+            print('')
+            print(INDEX_EPILOG)
+            return
+        abort(f'Index command required: {", ".join(INDEX_COMMANDS.keys())}')
+    INDEX_COMMANDS[command_args[0]](command_args[1:])
+
+
+def analyze_command(command_args: list[str]):
+    """
+    Analyze command to display cookie time and size analytics.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} analyze',
+        description=ANALYZE_DESCRIPTION,
+        epilog=ANALYZE_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='COOKIE_SOURCE', help=COOKIE_SOURCE_HELP)
+    arg_parser.add_argument(dest='FILTER', nargs='*', help=FILTER_HELP)
+    arg_parser.add_argument('--by-domain', dest='BY_DOMAIN', action='store_true',
+                            help='add per-domain age and expiry distributions')
+    arg_parser.add_argument('--value-sizes', dest='VALUE_SIZES', action='store_true',
+                            help='add value size percentiles, which may require decryption')
+    arg_parser.add_argument('--no-numpy', dest='NO_NUMPY', action='store_true',
+                            help='compute without NumPy, even if it is installed')
+    arg_parser.add_argument('--json', dest='JSON', action='store_true',
+                            help='generate JSON output')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    filter_by = get_filter_by(args.FILTER)
+
+    def _run():
+        with PROFILER.stage('open'):
+            browser = get_browser_for_cookie_source(args.COOKIE_SOURCE)
+        with PROFILER.stage('load'):
+            columns = load_columns(browser.generate_column_rows(filter_by, args.VALUE_SIZES),
+                                   args.VALUE_SIZES,
+                                   use_numpy=not args.NO_NUMPY)
+        with PROFILER.stage('analyze'):
+            analytics = analyze_columns(columns, by_domain=args.BY_DOMAIN)
+        with PROFILER.stage('output'):
+            if args.JSON:
+                display_analytics_json(analytics, source=str(browser.file_path))
+            else:
+                display_analytics(analytics, heading=f'{browser.name}: {browser.file_path}')
+
+    run_profiled(args, _run, 'analyze')
+
+
+def bloat_command(command_args: list[str]):
+    """
+    Bloat command to display Cookie request header sizes by host and path.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} bloat',
+        description=BLOAT_DESCRIPTION,
+        epilog=BLOAT_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='COOKIE_SOURCE', help=COOKIE_SOURCE_HELP)
     arg_parser.add_argument(dest='FILTER', nargs='*', help=FILTER_HELP)
-    arg_parser.add_argument('-j', '--jar', dest='JAR', action='store_true',
-                            help='generate Netscape cookie jar format, e.g. for use with "curl"')
-    args = arg_parser.parse_args()
+    arg_parser.add_argument('--top', dest='TOP', type=int, default=DEFAULT_BLOAT_TARGETS, metavar='N',
+                            help=f'number of worst hosts/paths and largest cookies to display'
+                                 f' (default: {DEFAULT_BLOAT_TARGETS})')
+    arg_parser.add_argument('--contributors', dest='CONTRIBUTORS', type=int, default=DEFAULT_BLOAT_CONTRIBUTORS,
+                            metavar='N',
+                            help=f'number of largest cookies to display per host/path'
+                                 f' (default: {DEFAULT_BLOAT_CONTRIBUTORS})')
+    arg_parser.add_argument('--limit', dest='LIMIT', type=int, default=DEFAULT_HEADER_LIMIT, metavar='BYTES',
+                            help=f'header size limit for counting oversized headers'
+                                 f' (default: {DEFAULT_HEADER_LIMIT})')
+    arg_parser.add_argument('--json', dest='JSON', action='store_true',
+                            help='generate JSON output')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
     filter_by = get_filter_by(args.FILTER)
-    browser = get_browser_for_cookie_source(args.COOKIE_SOURCE)
-    cookies = browser.generate_cookies(filter_by=filter_by, sort_by=DEFAULT_SORT_FIELDS)
-    if args.JAR:
-        display_cookie_jar(cookies)
+    if args.TOP < 1:
+        abort('Top count must be positive.')
+    if args.CONTRIBUTORS < 1:
+        abort('Contributors count must be positive.')
+
+    def _run():
+        with PROFILER.stage('open'):
+            browser = get_browser_for_cookie_source(args.COOKIE_SOURCE)
+        cookies = browser.generate_cookies(filter_by=filter_by, sort_by=BLOAT_SORT_FIELDS)
+        with PROFILER.stage('bloat'):
+            report = compute_bloat(cookies, limit=args.LIMIT, top=args.TOP, contributors=args.CONTRIBUTORS)
+        with PROFILER.stage('output'):
+            if args.JSON:
+                display_bloat_json(report, source=str(browser.file_path))
+            else:
+                display_bloat(report, heading=f'{browser.name}: {browser.file_path}')
+
+    run_profiled(args, _run, 'bloat')
+
+
+def profiles_command(command_args: list[str]):
+    """
+    Profiles command to list discovered browser profiles.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} profiles',
+        description=PROFILES_DESCRIPTION,
+        epilog=PROFILES_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument('--home', dest='HOME', metavar='DIR',
+                            help='home directory to search (default: current user home)')
+    arg_parser.add_argument('--platform', dest='PLATFORM', choices=['darwin', 'linux', 'win32'],
+                            help=f'platform for file locations, e.g. for disk images (default: {sys.platform})')
+    arg_parser.add_argument('--json', dest='JSON', action='store_true',
+                            help='generate JSON lines output')
+    args = arg_parser.parse_args(command_args)
+    home = Path(args.HOME) if args.HOME else Path('~').expanduser()
+    for location in find_stores([home], NAMED_BROWSERS, platform=args.PLATFORM):
+        if args.JSON:
+            print(json.dumps({'browser': location.browser, 'profile': location.profile, 'path': str(location.path)}))
+        else:
+            source = f'{location.browser}:{location.profile}' if location.profile else location.browser
+            print(f'{source}\t{location.path}')
+
+
+def purge_command(command_args: list[str]):
+    """
+    Purge command to delete cookies from a cookie database.
+
+    Args:
+        command_args: command line arguments
+    """
+    arg_parser = argparse.ArgumentParser(
+        prog=f'{os.path.basename(sys.argv[0])} purge',
+        description=PURGE_DESCRIPTION,
+        epilog=PURGE_EPILOG,
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    arg_parser.add_argument(dest='COOKIE_SOURCE', help=COOKIE_SOURCE_HELP)
+    arg_parser.add_argument(dest='FILTER', nargs='*', help=FILTER_HELP)
+    arg_parser.add_argument('--expired', dest='EXPIRED', action='store_true',
+                            help='only purge expired cookies')
+    arg_parser.add_argument('--vacuum', dest='VACUUM', action='store_true',
+                            help='vacuum the database after purging to reclaim space')
+    arg_parser.add_argument('--dry-run', dest='DRY_RUN', action='store_true',
+                            help='count matching cookies without deleting them')
+    arg_parser.add_argument('--batch-size', dest='BATCH_SIZE', type=int, default=DEFAULT_PURGE_BATCH_SIZE,
+                            help=f'rows per DELETE statement for value filters'
+                                 f' (default: {DEFAULT_PURGE_BATCH_SIZE})')
+    add_profile_arguments(arg_parser)
+    args = arg_parser.parse_intermixed_args(command_args)
+    filter_by = get_filter_by(args.FILTER)
+    if not filter_by and not args.EXPIRED:
+        abort('Purging requires at least one filter and/or --expired.')
+    if args.BATCH_SIZE < 1:
+        abort('Batch size must be positive.')
+
+    def _run():
+        with PROFILER.stage('open'):
+            browser = get_browser_for_cookie_source(args.COOKIE_SOURCE)
+        if isinstance(browser.file_path, ArchiveMember) and not args.DRY_RUN:
+            abort('Unable to purge cookies from an archive member.', 'Use --dry-run to count matching cookies.')
+        count = browser.purge_cookies(filter_by,
+                                      expired=args.EXPIRED,
+                                      vacuum=args.VACUUM,
+                                      dry_run=args.DRY_RUN,
+                                      batch_size=args.BATCH_SIZE)
+        if args.DRY_RUN:
+            print(f'{count} cookie(s) would be purged from: {browser.file_path}')
+        else:
+            print(f'{count} cookie(s) purged from: {browser.file_path}')
+
+    run_profiled(args, _run, 'purge')
+
+
+#: Command functions mapped by name. Other arguments are handled by query_command().
+COMMANDS: dict[str, Callable[[list[str]], None]] = {
+    'analyze': analyze_command,
+    'bloat': bloat_command,
+    'index': index_command,
+    'profiles': profiles_command,
+    'purge': purge_command,
+    'scan': scan_command,
+    'stats': stats_command,
+}
+
+
+def main():
+    """Main function."""
+    command_args = sys.argv[1:]
+    if command_args and command_args[0] in COMMANDS:
+        COMMANDS[command_args[0]](command_args[1:])
     else:
-        display_cookies(cookies, heading=f'{browser.name}: {browser.file_path}')
+        query_command(command_args)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,262 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope operational metrics for batch and scheduled runs.
+
+Counters and gauges are recorded in a global registry by browsers, extractors,
+decryptors, caches, and scans, and can be written at exit as a Prometheus
+textfile, e.g. for the node exporter textfile collector, or as a JSON document.
+
+Unlike profiling, metrics are always collected. They are updated per store, per
+query, or per decrypted value, so they stay cheap. Worker processes send their
+metrics back as snapshots that are merged into the parent registry.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+from cookiescope.profiling import PROFILER
+
+T = TypeVar('T')
+
+#: Metric name prefix.
+METRIC_PREFIX = 'cookiescope_'
+#: Supported output formats.
+METRICS_FORMATS = ['prometheus', 'json']
+
+#: Metric (type, help) pairs by name, without the prefix.
+METRIC_DEFINITIONS: dict[str, tuple[str, str]] = {
+    'stores_opened_total': ('counter', 'Cookie stores opened.'),
+    'store_bytes_total': ('counter', 'Size in bytes of cookie stores opened.'),
+    'rows_scanned_total': ('counter', 'Cookie rows or records read from stores, after any SQLite filtering.'),
+    'values_decrypted_total': ('counter', 'Cookie values decrypted.'),
+    'decrypt_failures_total': ('counter', 'Cookie values that failed to decrypt.'),
+    'cache_hits_total': ('counter', 'Cache lookups satisfied without reading the source.'),
+    'cache_misses_total': ('counter', 'Cache lookups that read or parsed the source.'),
+    'scan_stores_total': ('counter', 'Stores finished by fleet scans, by status.'),
+    'scan_store_seconds_total': ('counter', 'Seconds spent scanning stores in fleet scans.'),
+    'messages_total': ('counter', 'Warning and error messages displayed.'),
+    'stage_seconds_total': ('counter', 'Exclusive seconds by profiling stage, when profiling is enabled.'),
+    'run_seconds': ('gauge', 'Duration of the last run in seconds.'),
+    'last_run_success': ('gauge', '1 if the last run succeeded, otherwise 0.'),
+    'last_run_timestamp_seconds': ('gauge', 'Unix time when the last run finished.'),
+}
+
+#: Metric sample key, i.e. (name, sorted (label, value) pairs).
+SampleKey = tuple[str, tuple[tuple[str, str], ...]]
+#: Metric snapshot as (name, labels, value) tuples, e.g. to send between processes.
+MetricsSnapshot = list[tuple[str, dict[str, str], float]]
+
+
+@dataclass
+class Sample:
+    """Metric sample value that callers can keep and update directly."""
+    value: float = 0
+
+
+class MetricsRegistry:
+    """Registry of labeled metric samples."""
+
+    def __init__(self):
+        """Metrics registry constructor."""
+        self.samples: dict[SampleKey, Sample] = {}
+
+    def sample(self, name: str, **labels: str) -> Sample:
+        """
+        Get a sample, creating it if necessary.
+
+        Args:
+            name: metric name without the prefix, defined in METRIC_DEFINITIONS
+            labels: label values, which must be strings
+
+        Returns:
+            sample
+        """
+        key = (name, tuple(sorted(labels.items())))
+        sample = self.samples.get(key)
+        if sample is None:
+            if name not in METRIC_DEFINITIONS:
+                raise KeyError(f'Undefined metric: {name}')
+            sample = self.samples[key] = Sample()
+        return sample
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        """
+        Increment a counter.
+
+        Args:
+            name: metric name without the prefix
+            amount: amount to add
+            labels: label values
+        """
+        self.sample(name, **labels).value += amount
+
+    def set(self, name: str, value: float, **labels: str):
+        """
+        Set a gauge.
+
+        Args:
+            name: metric name without the prefix
+            value: new value
+            labels: label values
+        """
+        self.sample(name, **labels).value = value
+
+    def count_items(self, name: str, items: Iterable[T], **labels: str) -> Iterator[T]:
+        """
+        Count items as they are produced by an iterable.
+
+        Args:
+            name: counter name without the prefix
+            items: iterable to wrap
+            labels: label values
+
+        Returns:
+            wrapped iterator
+        """
+        sample = self.sample(name, **labels)
+        for item in items:
+            sample.value += 1
+            yield item
+
+    def reset(self):
+        """Remove all samples, e.g. in a forked worker process."""
+        self.samples.clear()
+
+    def take_snapshot(self, reset: bool = False) -> MetricsSnapshot:
+        """
+        Take a picklable snapshot of all samples.
+
+        Args:
+            reset: reset the registry after taking the snapshot if True
+
+        Returns:
+            snapshot
+        """
+        snapshot = [(name, dict(labels), sample.value) for (name, labels), sample in self.samples.items()]
+        if reset:
+            self.reset()
+        return snapshot
+
+    def merge(self, snapshot: MetricsSnapshot):
+        """
+        Merge a snapshot, e.g. from a worker process.
+
+        Counters are added and gauges are replaced.
+
+        Args:
+            snapshot: snapshot to merge
+        """
+        for name, labels, value in snapshot:
+            if METRIC_DEFINITIONS[name][0] == 'counter':
+                self.increment(name, value, **labels)
+            else:
+                self.set(name, value, **labels)
+
+    def add_profiler_stages(self):
+        """Add profiler stage times, if profiling is enabled."""
+        if PROFILER.enabled:
+            for stage_name, stage in PROFILER.stages.items():
+                self.increment('stage_seconds_total', stage.seconds, stage=stage_name)
+
+    def format_prometheus(self) -> str:
+        """
+        Format samples in the Prometheus text exposition format.
+
+        Returns:
+            Prometheus text
+        """
+        samples_by_name: dict[str, list[tuple[tuple[tuple[str, str], ...], float]]] = {}
+        for (name, labels), sample in self.samples.items():
+            samples_by_name.setdefault(name, []).append((labels, sample.value))
+        lines: list[str] = []
+        for name in sorted(samples_by_name.keys()):
+            metric_type, help_text = METRIC_DEFINITIONS[name]
+            full_name = f'{METRIC_PREFIX}{name}'
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            for labels, value in sorted(samples_by_name[name]):
+                label_text = ','.join(f'{label}="{escape_label_value(label_value)}"'
+                                      for label, label_value in labels)
+                value_text = format_sample_value(value)
+                lines.append(f'{full_name}{{{label_text}}} {value_text}' if label_text else f'{full_name} {value_text}')
+        return '\n'.join(lines) + '\n'
+
+    def format_json(self) -> str:
+        """
+        Format samples as a JSON document.
+
+        Returns:
+            JSON text
+        """
+        metrics: dict[str, dict] = {}
+        for (name, labels), sample in sorted(self.samples.items()):
+            metric_type, help_text = METRIC_DEFINITIONS[name]
+            metric = metrics.setdefault(f'{METRIC_PREFIX}{name}', {'type': metric_type, 'help': help_text,
+                                                                    'samples': []})
+            metric['samples'].append({'labels': dict(labels), 'value': sample.value})
+        return json.dumps({'metrics': metrics}, indent=2) + '\n'
+
+    def write(self, path: Path, metrics_format: str):
+        """
+        Write metrics to a file atomically, so that collectors never see partial files.
+
+        Args:
+            path: output file path
+            metrics_format: output format, i.e. one of METRICS_FORMATS
+        """
+        text = self.format_json() if metrics_format == 'json' else self.format_prometheus()
+        temporary_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        with temporary_path.open('w', encoding='utf-8') as metrics_file:
+            metrics_file.write(text)
+        os.replace(temporary_path, path)
+
+
+def format_sample_value(value: float) -> str:
+    """
+    Format a sample value without losing precision, e.g. for timestamps.
+
+    Args:
+        value: sample value
+
+    Returns:
+        formatted value
+    """
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escape a Prometheus label value.
+
+    Args:
+        value: raw label value
+
+    Returns:
+        escaped label value
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+#: Global metrics registry used by instrumented code.
+METRICS = MetricsRegistry()
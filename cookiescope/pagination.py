@@ -0,0 +1,177 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope resumable keyset pagination for library and service consumers.
+
+Pages are ordered by the sort fields, followed by a unique position, e.g. the
+SQLite row ID, that breaks ties. Each page comes with an opaque continuation
+token encoding the key of the last row read. The next page starts after that
+key, so nothing stays open between requests, e.g. a database connection or a
+generator.
+
+Tokens are URL-safe base64 JSON. A token is only accepted with the sort fields
+and filters it was issued for. Tokens are not encrypted or signed, and they
+reveal the sort field values of the last row read.
+"""
+
+import base64
+import heapq
+import json
+from dataclasses import dataclass
+from hashlib import blake2b
+from typing import Iterable, Iterator
+
+from cookiescope.cookies import COOKIE_FIELD_NAMES, CookieData, FilterBy, SortBy
+
+#: Page token format version, bumped when the token changes shape.
+PAGE_TOKEN_VERSION = 1
+#: Filter digest size in bytes, used to tie tokens to their filters.
+FILTER_DIGEST_SIZE = 8
+
+#: Page key, i.e. sort field values followed by a unique position.
+PageKey = list
+
+
+@dataclass
+class CookiesPage:
+    """One page of cookies."""
+    #: Cookies in page order.
+    cookies: list[CookieData]
+    #: Continuation token for the next page, or None after the last page.
+    next_token: str | None
+
+
+def get_page_sort_fields(sort_by: SortBy | None) -> list[str]:
+    """
+    Validate and normalize pagination sort fields.
+
+    Pages are always in ascending order of plain cookie fields, because keys
+    are stored in tokens.
+
+    Args:
+        sort_by: optional attribute names to sort by in priority order
+
+    Returns:
+        unique sort field names
+    """
+    sort_fields: list[str] = []
+    for sort_field in sort_by or []:
+        if sort_field not in COOKIE_FIELD_NAMES:
+            raise ValueError(f'Bad sort field: {sort_field}')
+        if sort_field not in sort_fields:
+            sort_fields.append(sort_field)
+    return sort_fields
+
+
+def get_filter_digest(filter_by: FilterBy | None) -> str:
+    """
+    Get a short digest identifying filters.
+
+    Args:
+        filter_by: optional (name, values) filter pairs
+
+    Returns:
+        hexadecimal digest
+    """
+    filter_data = json.dumps([[name, list(values)] for name, values in filter_by or []])
+    return blake2b(filter_data.encode('utf-8'), digest_size=FILTER_DIGEST_SIZE).hexdigest()
+
+
+def encode_page_token(sort_fields: list[str], filter_by: FilterBy | None, key: PageKey) -> str:
+    """
+    Encode a continuation token.
+
+    Args:
+        sort_fields: sort field names
+        filter_by: optional (name, values) filter pairs
+        key: key of the last row read
+
+    Returns:
+        opaque token string
+    """
+    document = {'v': PAGE_TOKEN_VERSION, 's': sort_fields, 'f': get_filter_digest(filter_by), 'k': key}
+    token_data = json.dumps(document, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(token_data).decode('ascii').rstrip('=')
+
+
+def decode_page_token(token: str, sort_fields: list[str], filter_by: FilterBy | None) -> PageKey:
+    """
+    Decode and check a continuation token.
+
+    Args:
+        token: opaque token string
+        sort_fields: sort field names, which must match the token
+        filter_by: optional (name, values) filter pairs, which must match the token
+
+    Returns:
+        key of the last row read
+    """
+    try:
+        token_data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        document = json.loads(token_data)
+        version, token_sort_fields, filter_digest, key = (document['v'], document['s'], document['f'],
+                                                          document['k'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Bad page token.')
+    if version != PAGE_TOKEN_VERSION or not isinstance(key, list) or len(key) != len(sort_fields) + 1:
+        raise ValueError('Bad page token.')
+    if token_sort_fields != sort_fields or filter_digest != get_filter_digest(filter_by):
+        raise ValueError('Page token does not match the sort fields and filters.')
+    return key
+
+
+def get_cookies_page(cookies: Iterable[CookieData],
+                     sort_fields: list[str],
+                     filter_by: FilterBy | None,
+                     page_size: int,
+                     page_token: str = None,
+                     ) -> CookiesPage:
+    """
+    Get one page of cookies by scanning filtered cookies.
+
+    This is the fallback for sources that can't seek, e.g. files. Positions
+    in the filtered cookie sequence break ties, so tokens are only valid while
+    the source is unchanged. Only the page is kept in memory.
+
+    Args:
+        cookies: cookies filtered by filter_by, in a repeatable order
+        sort_fields: sort field names
+        filter_by: optional (name, values) filter pairs the cookies were filtered by
+        page_size: maximum cookies per page
+        page_token: optional continuation token from the previous page
+
+    Returns:
+        cookie page
+    """
+    if page_size < 1:
+        raise ValueError('Page size must be positive.')
+    after = decode_page_token(page_token, sort_fields, filter_by) if page_token else None
+
+    def _generate_keyed_cookies() -> Iterator[tuple[PageKey, CookieData]]:
+        for position, cookie in enumerate(cookies):
+            key = [getattr(cookie, name) for name in sort_fields]
+            key.append(position)
+            if after is None or key > after:
+                yield key, cookie
+
+    keyed_cookies = heapq.nsmallest(page_size + 1, _generate_keyed_cookies(), key=lambda keyed: keyed[0])
+    if len(keyed_cookies) <= page_size:
+        return CookiesPage([cookie for _key, cookie in keyed_cookies], None)
+    keyed_cookies.pop()
+    return CookiesPage([cookie for _key, cookie in keyed_cookies],
+                       encode_page_token(sort_fields, filter_by, keyed_cookies[-1][0]))
@@ -0,0 +1,222 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope per-stage profiling.
+
+Stages are timed with a monotonic clock. Time is exclusive, i.e. time spent in a
+nested stage, such as a filter pulling rows from a database scan, is subtracted
+from the enclosing stage. That makes lazy generator pipelines measurable.
+Nesting is tracked per thread, so that background work, such as decryptor
+setup, is timed independently of the thread that consumes its results.
+
+When profiling is disabled (the default) the helpers return their inputs, or a
+shared null context, so instrumented code pays essentially nothing. Per-row
+instrumentation should therefore be applied once per pipeline, e.g. by wrapping
+a function or iterator, rather than by checking inside loops.
+"""
+
+import json
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from time import perf_counter
+from typing import Callable, ContextManager, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+#: Shared no-op context returned while profiling is disabled.
+_NULL_CONTEXT = nullcontext()
+
+
+@dataclass
+class StageStats:
+    """Accumulated statistics for one stage."""
+    #: Exclusive seconds spent in the stage.
+    seconds: float = 0.0
+    #: Number of times the stage was entered.
+    calls: int = 0
+    #: Number of items (rows, values, etc.) processed.
+    items: int = 0
+    #: Number of bytes processed, if applicable.
+    bytes: int = 0
+
+
+class Profiler:
+    """Exclusive-time stage profiler."""
+
+    def __init__(self):
+        """Profiler constructor."""
+        self.enabled = False
+        self.stages: dict[str, StageStats] = {}
+        self._local = threading.local()
+
+    def enable(self):
+        """Enable profiling."""
+        self.enabled = True
+
+    @property
+    def _frames(self) -> list[list]:
+        # Active frames of the current thread as [stage name, start time, nested seconds] lists.
+        frames = getattr(self._local, 'frames', None)
+        if frames is None:
+            frames = self._local.frames = []
+        return frames
+
+    def _enter(self, name: str):
+        self._frames.append([name, perf_counter(), 0.0])
+
+    def _exit(self, items: int = 0, byte_count: int = 0):
+        frames = self._frames
+        name, start_time, nested_seconds = frames.pop()
+        elapsed = perf_counter() - start_time
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats()
+        stage.seconds += elapsed - nested_seconds
+        stage.calls += 1
+        stage.items += items
+        stage.bytes += byte_count
+        if frames:
+            frames[-1][2] += elapsed
+
+    @contextmanager
+    def _stage(self, name: str) -> Iterator[None]:
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def stage(self, name: str) -> ContextManager:
+        """
+        Get a context manager that times a stage.
+
+        Args:
+            name: stage name
+
+        Returns:
+            context manager
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._stage(name)
+
+    def iterate(self, name: str, items: Iterable[T]) -> Iterable[T]:
+        """
+        Time the production of items by an iterable, and count them.
+
+        Args:
+            name: stage name
+            items: iterable to wrap
+
+        Returns:
+            wrapped iterable, or the original iterable if disabled
+        """
+        if not self.enabled:
+            return items
+
+        def _iterate() -> Iterator[T]:
+            iterator = iter(items)
+            while True:
+                self._enter(name)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._exit()
+                    return
+                except BaseException:
+                    self._exit()
+                    raise
+                self._exit(items=1)
+                yield item
+
+        return _iterate()
+
+    def function(self, name: str, function: Callable[..., T], count_bytes: bool = False) -> Callable[..., T]:
+        """
+        Time calls to a function, and count them.
+
+        Args:
+            name: stage name
+            function: function to wrap
+            count_bytes: add the length of the first argument to the byte count if True
+
+        Returns:
+            wrapped function, or the original function if disabled
+        """
+        if not self.enabled:
+            return function
+
+        def _function(*args, **kwargs) -> T:
+            self._enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit(items=1, byte_count=len(args[0]) if count_bytes and args else 0)
+
+        return _function
+
+    def count(self, name: str, items: int = 1, byte_count: int = 0):
+        """
+        Add to stage counters without timing.
+
+        Args:
+            name: stage name
+            items: item count to add
+            byte_count: byte count to add
+        """
+        if not self.enabled:
+            return
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = StageStats()
+        stage.items += items
+        stage.bytes += byte_count
+
+    def display_summary(self, total_seconds: float = None):
+        """
+        Display a text summary on stderr.
+
+        Args:
+            total_seconds: optional total elapsed time to display
+        """
+        lines = [f'{"stage":<16} {"seconds":>10} {"calls":>10} {"items":>10} {"bytes":>12}']
+        for name, stage in sorted(self.stages.items(), key=lambda name_stage: -name_stage[1].seconds):
+            lines.append(f'{name:<16} {stage.seconds:10.4f} {stage.calls:10} {stage.items:10} {stage.bytes:12}')
+        if total_seconds is not None:
+            lines.append(f'{"(total)":<16} {total_seconds:10.4f}')
+        sys.stderr.write('=== profile ===\n')
+        sys.stderr.write('\n'.join(lines) + '\n')
+
+    def display_json(self, total_seconds: float = None):
+        """
+        Display a JSON summary on stderr.
+
+        Args:
+            total_seconds: optional total elapsed time to include
+        """
+        document = {
+            'total_seconds': total_seconds,
+            'stages': {name: asdict(stage) for name, stage in self.stages.items()},
+        }
+        sys.stderr.write(json.dumps(document, indent=2) + '\n')
+
+
+#: Global profiler used by instrumented code.
+PROFILER = Profiler()
@@ -0,0 +1,289 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope fleet scanning across many home directories.
+
+Stores are located under each root (home) directory with the browser location
+maps, with "~" rebased to the root. Each store is read in its own worker
+process, with a bounded number running concurrently. Workers are forked from
+the scanning process where the platform allows, so they don't re-pay interpreter
+startup. A per-store timeout terminates stuck workers, and failures are
+isolated to the store that caused them.
+
+Results stream back in chunks and are yielded as records tagged with the user,
+browser, and profile. Each store ends with a "store" summary record, which also
+identifies the store file by size and modification time.
+"""
+
+import multiprocessing
+import os
+from dataclasses import dataclass
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+from time import monotonic
+from typing import Iterable, Iterator
+
+from cookiescope.browsers import BrowserBase, GenericChromeBrowser
+from cookiescope.browsers.chrome_generic import GenericChromeSQLiteCookies
+from cookiescope.cookies import FilterBy
+from cookiescope.decryptors.base import NullDecryptor
+from cookiescope.metrics import METRICS
+
+#: Default per-store timeout in seconds.
+DEFAULT_STORE_TIMEOUT = 300
+#: Cookies sent from a worker per message.
+CHUNK_SIZE = 1000
+
+#: Scan result record, i.e. a JSON-compatible dictionary.
+ScanRecord = dict
+
+
+@dataclass
+class StoreLocation:
+    """Located cookie store."""
+    #: User name, taken from the root directory name.
+    user: str
+    #: Browser name, as used for cookie sources, e.g. "chrome".
+    browser: str
+    #: Browser class that reads the store.
+    browser_class: type[BrowserBase]
+    #: Profile name or None for the default profile.
+    profile: str | None
+    #: Cookie store path.
+    path: Path
+
+    def as_record(self, record_type: str) -> ScanRecord:
+        """
+        Start a record tagged with the store location.
+
+        Args:
+            record_type: record type, "cookie" or "store"
+
+        Returns:
+            record dictionary
+        """
+        return {
+            'type': record_type,
+            'user': self.user,
+            'browser': self.browser,
+            'profile': self.profile,
+            'store': str(self.path),
+        }
+
+
+def find_stores(roots: Iterable[Path],
+                browser_classes: dict[str, type[BrowserBase]],
+                platform: str = None,
+                ) -> Iterator[StoreLocation]:
+    """
+    Find cookie stores for every profile of every browser under root directories.
+
+    Args:
+        roots: root (home) directories
+        browser_classes: browser classes mapped by name
+        platform: optional platform name for location maps (default: current platform)
+
+    Returns:
+        store location iterator
+    """
+    for root in roots:
+        found_paths: set[Path] = set()
+        for browser_name, browser_class in browser_classes.items():
+            for profile, path in browser_class.find_all_cookies(home=root, platform=platform):
+                # Some location maps overlap, e.g. when browsers share a path.
+                if path not in found_paths:
+                    found_paths.add(path)
+                    yield StoreLocation(root.name, browser_name, browser_class, profile, path)
+
+
+def _scan_store_worker(location: StoreLocation, decrypt: bool, filter_by: FilterBy, connection: Connection):
+    """
+    Worker process function to read one store and send results in chunks.
+
+    Messages are ("cookies", list of cookie tuples), ("metrics", snapshot), and
+    finally ("done", count) or ("error", message).
+
+    Args:
+        location: store location
+        decrypt: decrypt and include values if True
+        filter_by: filters as a mapping of attribute names to filtered values
+        connection: pipe connection to the scanning process
+    """
+    # Forked workers inherit the scanning process's metrics, which must not be counted twice.
+    METRICS.reset()
+    try:
+        browser_class = location.browser_class
+        if not decrypt and issubclass(browser_class, GenericChromeBrowser):
+            cookies_db = GenericChromeSQLiteCookies(location.path, browser_class.name,
+                                                    decryptor=NullDecryptor(browser_class.name))
+            browser = browser_class(location.path, cookies_db) if cookies_db.is_cookies_db() else None
+        else:
+            browser = browser_class.from_file(location.path)
+        if browser is None:
+            raise ValueError(f'{browser_class.name} did not recognize the cookies file.')
+        chunk: list[tuple] = []
+        count = 0
+        for cookie in browser.generate_cookies(filter_by, None):
+            chunk.append((
+                cookie.domain,
+                cookie.name,
+                cookie.path,
+                cookie.value if decrypt else None,
+                cookie.http_only,
+                cookie.secure,
+                cookie.expires,
+                cookie.created,
+            ))
+            if len(chunk) == CHUNK_SIZE:
+                connection.send(('cookies', chunk))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            connection.send(('cookies', chunk))
+            count += len(chunk)
+        connection.send(('metrics', METRICS.take_snapshot()))
+        connection.send(('done', count))
+    # Catch everything, including SystemExit from abort(), to isolate failures.
+    except BaseException as exc:
+        connection.send(('metrics', METRICS.take_snapshot()))
+        connection.send(('error', f'{exc.__class__.__name__}: {exc}'))
+    finally:
+        connection.close()
+
+
+class _RunningScan:
+    """Bookkeeping for a running worker process."""
+
+    def __init__(self, location: StoreLocation, process: multiprocessing.Process, connection: Connection):
+        self.location = location
+        self.process = process
+        self.connection = connection
+        self.start_time = monotonic()
+        self.count = 0
+
+    def get_store_record(self, error: str = None, status: str = None) -> ScanRecord:
+        """
+        Build the store summary record, and count the store in the metrics.
+
+        Args:
+            error: optional error message
+            status: metrics status (default: "error" with an error, or "ok")
+
+        Returns:
+            store record
+        """
+        record = self.location.as_record('store')
+        try:
+            stat = self.location.path.stat()
+            record['size'] = stat.st_size
+            record['mtime'] = stat.st_mtime
+        except OSError:
+            record['size'] = record['mtime'] = None
+        record['cookies'] = self.count
+        seconds = monotonic() - self.start_time
+        record['seconds'] = round(seconds, 3)
+        record['error'] = error
+        if status is None:
+            status = 'error' if error else 'ok'
+        METRICS.increment('scan_stores_total', status=status, browser=self.location.browser)
+        METRICS.increment('scan_store_seconds_total', seconds, browser=self.location.browser)
+        return record
+
+
+def scan_stores(locations: Iterable[StoreLocation],
+                filter_by: FilterBy = None,
+                jobs: int = None,
+                timeout: float = DEFAULT_STORE_TIMEOUT,
+                decrypt: bool = True,
+                ) -> Iterator[ScanRecord]:
+    """
+    Scan stores with concurrent worker processes and stream tagged records.
+
+    Args:
+        locations: store locations
+        filter_by: filters as a mapping of attribute names to filtered values
+        jobs: maximum concurrent worker processes (default: CPU count)
+        timeout: per-store timeout in seconds
+        decrypt: decrypt and include values if True
+
+    Returns:
+        iterator of "cookie" and "store" records
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    pending = list(locations)
+    pending.reverse()
+    running: dict[Connection, _RunningScan] = {}
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                location = pending.pop()
+                receive_connection, send_connection = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_scan_store_worker,
+                    args=(location, decrypt, filter_by, send_connection),
+                    daemon=True,
+                )
+                process.start()
+                send_connection.close()
+                running[receive_connection] = _RunningScan(location, process, receive_connection)
+            # Wake up in time for the earliest timeout.
+            now = monotonic()
+            wait_seconds = max(0.0, min(scan.start_time + timeout - now for scan in running.values()))
+            for connection in wait(list(running.keys()), timeout=wait_seconds):
+                scan = running[connection]
+                try:
+                    message_type, payload = connection.recv()
+                except EOFError:
+                    message_type, payload = 'error', 'Worker process exited unexpectedly.'
+                if message_type == 'cookies':
+                    scan.count += len(payload)
+                    for domain, name, path, value, http_only, secure, expires, created in payload:
+                        record = scan.location.as_record('cookie')
+                        record.update(
+                            domain=domain,
+                            name=name,
+                            path=path,
+                            value=value,
+                            http_only=http_only,
+                            secure=secure,
+                            expires=expires,
+                            created=created,
+                        )
+                        yield record
+                    continue
+                if message_type == 'metrics':
+                    METRICS.merge(payload)
+                    continue
+                del running[connection]
+                connection.close()
+                scan.process.join()
+                yield scan.get_store_record(error=payload if message_type == 'error' else None)
+            now = monotonic()
+            for connection, scan in list(running.items()):
+                if now - scan.start_time >= timeout:
+                    del running[connection]
+                    scan.process.terminate()
+                    scan.process.join()
+                    connection.close()
+                    yield scan.get_store_record(error=f'Timed out after {timeout} seconds.', status='timeout')
+    finally:
+        for scan in running.values():
+            scan.process.terminate()
+            scan.process.join()
+            scan.connection.close()
@@ -0,0 +1,198 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope site (eTLD+1) lookup with the Public Suffix List.
+
+A site is the registrable domain of a cookie domain, i.e. its public suffix plus
+one label, e.g. "example.co.uk" for ".www.example.co.uk". The Public Suffix List
+is bundled in the package, including private domains, so lookups work offline.
+
+The list is compiled into a label trie, keyed from the top-level label down,
+with nested dictionaries. The compiled trie is cached with marshal in the user
+cache directory, keyed on the bundled list file's size and modification time,
+so that later runs load it without parsing. Lookups are memoized per domain,
+because cookie stores repeat a limited set of domains many times.
+"""
+
+import marshal
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from cookiescope.discovery import get_cache_directory
+from cookiescope.metrics import METRICS
+
+#: Bundled Public Suffix List path.
+PUBLIC_SUFFIX_LIST_PATH = Path(__file__).parent / 'data' / 'public_suffix_list.dat'
+#: Compiled trie cache file name in the cache directory.
+SUFFIX_TRIE_FILE_NAME = 'public-suffix-trie.marshal'
+#: Compiled trie format version, bumped when the trie changes shape.
+SUFFIX_TRIE_VERSION = 1
+#: Maximum memoized domain lookups.
+SITE_MEMO_SIZE = 64 * 1024
+
+#: Trie node key marking the end of a rule. Labels are never empty.
+RULE_END = ''
+#: Rule end marker value for normal and wildcard rules.
+NORMAL_RULE = 1
+#: Rule end marker value for exception ("!") rules.
+EXCEPTION_RULE = 2
+#: Wildcard label.
+WILDCARD = '*'
+
+#: Public suffix trie node, mapping labels to child nodes and RULE_END to a rule type.
+SuffixTrie = dict
+
+#: Loaded trie, compiled or read from the cache on first use.
+_suffix_trie: SuffixTrie | None = None
+
+
+def compile_public_suffix_list(path: Path) -> SuffixTrie:
+    """
+    Compile a Public Suffix List file into a label trie.
+
+    Internationalized rules are added in both Unicode and IDNA ("xn--") forms,
+    because browsers store IDNA cookie domains.
+
+    Args:
+        path: Public Suffix List file path
+
+    Returns:
+        trie root node
+    """
+    root: SuffixTrie = {}
+    with path.open(encoding='utf-8') as list_file:
+        for line in list_file:
+            # Rules end at the first whitespace.
+            rule = line.split(maxsplit=1)[0].lower() if line.strip() else ''
+            if not rule or rule.startswith('//'):
+                continue
+            rule_type = NORMAL_RULE
+            if rule.startswith('!'):
+                rule = rule[1:]
+                rule_type = EXCEPTION_RULE
+            rules = {rule}
+            if not rule.isascii():
+                try:
+                    rules.add(rule.encode('idna').decode('ascii'))
+                except UnicodeError:
+                    pass
+            for rule_form in rules:
+                node = root
+                for label in reversed(rule_form.split('.')):
+                    node = node.setdefault(label, {})
+                node[RULE_END] = rule_type
+    return root
+
+
+def load_public_suffix_trie() -> SuffixTrie:
+    """
+    Load the compiled public suffix trie from the cache, or compile and cache it.
+
+    Cache failures are ignored, because the cache is only an optimization.
+
+    Returns:
+        trie root node
+    """
+    stat = os.stat(PUBLIC_SUFFIX_LIST_PATH)
+    signature = [SUFFIX_TRIE_VERSION, stat.st_size, stat.st_mtime_ns]
+    cache_directory = get_cache_directory()
+    cache_path = cache_directory / SUFFIX_TRIE_FILE_NAME if cache_directory else None
+    if cache_path is not None:
+        try:
+            # Loading from bytes is much faster than from a file object.
+            cached_signature, trie = marshal.loads(cache_path.read_bytes())
+            if cached_signature == signature and isinstance(trie, dict):
+                METRICS.increment('cache_hits_total', cache='public_suffixes')
+                return trie
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+    METRICS.increment('cache_misses_total', cache='public_suffixes')
+    trie = compile_public_suffix_list(PUBLIC_SUFFIX_LIST_PATH)
+    if cache_path is not None:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+            with temporary_path.open('wb') as cache_file:
+                marshal.dump((signature, trie), cache_file)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            pass
+    return trie
+
+
+def get_public_suffix_length(labels: list[str], trie: SuffixTrie) -> int:
+    """
+    Get the number of labels in the public suffix of a domain.
+
+    Follows the Public Suffix List algorithm. Exception rules win, and
+    otherwise the longest matching rule wins. Unlisted top-level domains match
+    the implicit "*" rule.
+
+    Args:
+        labels: lower-case domain labels in reverse order, i.e. top-level first
+        trie: trie root node
+
+    Returns:
+        public suffix label count
+    """
+    longest = 1
+    pending = [(trie, 0)]
+    while pending:
+        node, depth = pending.pop()
+        rule_type = node.get(RULE_END)
+        if rule_type == EXCEPTION_RULE:
+            return depth - 1
+        if rule_type == NORMAL_RULE and depth > longest:
+            longest = depth
+        if depth < len(labels):
+            child = node.get(labels[depth])
+            if child is not None:
+                pending.append((child, depth + 1))
+            wildcard = node.get(WILDCARD)
+            if wildcard is not None:
+                pending.append((wildcard, depth + 1))
+    return longest
+
+
+@lru_cache(maxsize=SITE_MEMO_SIZE)
+def get_site(domain: str) -> str:
+    """
+    Get the site, i.e. registrable domain (eTLD+1), for a cookie domain.
+
+    Domains that are public suffixes themselves, or IP addresses, are
+    returned as is, without a leading dot and lower-cased.
+
+    Args:
+        domain: cookie domain, with or without a leading dot
+
+    Returns:
+        site domain
+    """
+    global _suffix_trie
+    host = domain.lstrip('.').lower().rstrip('.')
+    if not host or host.replace('.', '').isdigit() or ':' in host:
+        return host
+    if _suffix_trie is None:
+        _suffix_trie = load_public_suffix_trie()
+    labels = host.split('.')
+    labels.reverse()
+    suffix_length = get_public_suffix_length(labels, _suffix_trie)
+    if suffix_length >= len(labels):
+        return host
+    return '.'.join(reversed(labels[:suffix_length + 1]))
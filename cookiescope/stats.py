@@ -0,0 +1,268 @@
+# Copyright (C) 2023, Steven Cooper
+#
+# This file is part of Cookiescope.
+#
+# Cookiescope is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Cookiescope is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Cookiescope.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cookiescope aggregate cookie statistics.
+
+Statistics are grouped by a single cookie field. Each group counts cookies,
+secure and HTTP-only flags, session cookies, and expiry buckets relative to the
+current time. Value sizes are optional, because they may require decryption.
+"""
+
+import json
+from dataclasses import asdict, dataclass, field
+from time import time
+from typing import Iterable, Iterator
+
+from cookiescope.cookies import CookieData
+
+#: Field names supported for grouping, including "site" for registrable domains.
+GROUP_FIELDS = ['domain', 'name', 'path', 'site']
+#: Default grouping field.
+DEFAULT_GROUP_FIELD = 'domain'
+
+#: Expiry bucket (label, maximum seconds from now) pairs, in ascending order.
+#: Expired cookies (<= 0 seconds) land in the first bucket. Cookies beyond the
+#: last maximum land in the final bucket.
+EXPIRY_BUCKETS: list[tuple[str, int | None]] = [
+    ('expired', 0),
+    ('<1d', 86400),
+    ('<7d', 7 * 86400),
+    ('<30d', 30 * 86400),
+    ('<365d', 365 * 86400),
+    ('>=365d', None),
+]
+#: Expiry bucket index for session cookies (no expiration).
+SESSION_BUCKET = -1
+
+
+@dataclass
+class GroupStats:
+    """Aggregate statistics for one group of cookies."""
+    #: Grouping field value.
+    key: str
+    #: Cookie count.
+    count: int = 0
+    #: Secure cookie count.
+    secure: int = 0
+    #: HTTP-only cookie count.
+    http_only: int = 0
+    #: Session cookie (no expiration) count.
+    session: int = 0
+    #: Cookie counts by expiry bucket label.
+    expiry: dict[str, int] = field(default_factory=lambda: {label: 0 for label, _max in EXPIRY_BUCKETS})
+    #: Total stored (HTTP-quoted) value size in UTF-8 bytes, if requested.
+    value_bytes: int | None = None
+
+    def add_counts(self,
+                   bucket: int,
+                   count: int,
+                   secure: int,
+                   http_only: int,
+                   value_bytes: int | None,
+                   ):
+        """
+        Add counts for cookies that share an expiry bucket.
+
+        Args:
+            bucket: expiry bucket index or SESSION_BUCKET
+            count: cookie count
+            secure: secure cookie count
+            http_only: HTTP-only cookie count
+            value_bytes: total value size or None if not collected
+        """
+        self.count += count
+        self.secure += secure
+        self.http_only += http_only
+        if bucket == SESSION_BUCKET:
+            self.session += count
+        else:
+            self.expiry[EXPIRY_BUCKETS[bucket][0]] += count
+        if value_bytes is not None:
+            self.value_bytes = (self.value_bytes or 0) + value_bytes
+
+
+def get_expiry_bucket(expires: int, now: int) -> int:
+    """
+    Get the expiry bucket index for an expiration timestamp.
+
+    Args:
+        expires: expiration timestamp or 0 for session cookies
+        now: current timestamp
+
+    Returns:
+        bucket index or SESSION_BUCKET
+    """
+    if not expires:
+        return SESSION_BUCKET
+    remaining = expires - now
+    for bucket_idx, (_label, max_seconds) in enumerate(EXPIRY_BUCKETS):
+        if max_seconds is None or remaining <= max_seconds:
+            return bucket_idx
+    return len(EXPIRY_BUCKETS) - 1
+
+
+def get_expiry_bucket_sql(expires_expression: str) -> str:
+    """
+    Build an SQL expression that matches get_expiry_bucket().
+
+    The current timestamp is bound as the named parameter ":now".
+
+    Args:
+        expires_expression: SQL expression providing the expiration timestamp
+
+    Returns:
+        SQL CASE expression
+    """
+    whens = [f'WHEN ({expires_expression}) = 0 THEN {SESSION_BUCKET}']
+    for bucket_idx, (_label, max_seconds) in enumerate(EXPIRY_BUCKETS):
+        if max_seconds is not None:
+            whens.append(f'WHEN ({expires_expression}) - :now <= {max_seconds} THEN {bucket_idx}')
+    return f'CASE {" ".join(whens)} ELSE {len(EXPIRY_BUCKETS) - 1} END'
+
+
+class StatsAggregator:
+    """Streaming statistics aggregator for cookie sources without SQL support."""
+
+    def __init__(self, group_by: str, value_sizes: bool, now: int = None):
+        """
+        Statistics aggregator constructor.
+
+        Args:
+            group_by: grouping field name
+            value_sizes: collect value sizes if True
+            now: optional current timestamp (default: current time)
+        """
+        self.group_by = group_by
+        self.value_sizes = value_sizes
+        self.now = int(time()) if now is None else now
+        self.groups: dict[str, GroupStats] = {}
+
+    def add(self, cookie: CookieData):
+        """
+        Add a cookie to the statistics.
+
+        Args:
+            cookie: cookie to add
+        """
+        key = getattr(cookie, self.group_by)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = GroupStats(key)
+        group.add_counts(
+            get_expiry_bucket(cookie.expires, self.now),
+            1,
+            int(bool(cookie.secure)),
+            int(bool(cookie.http_only)),
+            len(cookie.get_stored_value().encode('utf-8')) if self.value_sizes else None,
+        )
+
+    def add_all(self, cookies: Iterable[CookieData]):
+        """
+        Add cookies to the statistics.
+
+        Args:
+            cookies: cookies to add
+        """
+        for cookie in cookies:
+            self.add(cookie)
+
+    def generate_stats(self) -> Iterator[GroupStats]:
+        """
+        Generate group statistics ordered by key.
+
+        Returns:
+            group statistics iterator
+        """
+        for key in sorted(self.groups.keys()):
+            yield self.groups[key]
+
+
+def get_total_stats(stats: Iterable[GroupStats]) -> GroupStats:
+    """
+    Sum group statistics.
+
+    Args:
+        stats: group statistics
+
+    Returns:
+        total statistics with an empty key
+    """
+    total = GroupStats('')
+    for group in stats:
+        total.count += group.count
+        total.secure += group.secure
+        total.http_only += group.http_only
+        total.session += group.session
+        for label, count in group.expiry.items():
+            total.expiry[label] += count
+        if group.value_bytes is not None:
+            total.value_bytes = (total.value_bytes or 0) + group.value_bytes
+    return total
+
+
+def display_stats(stats: Iterable[GroupStats], group_by: str, heading: str = None):
+    """
+    Display group statistics as a text table.
+
+    Args:
+        stats: group statistics
+        group_by: grouping field name for the key column heading
+        heading: optional heading to display
+    """
+    stats = list(stats)
+    total = get_total_stats(stats)
+    columns = [group_by, 'count', 'secure', 'http_only', 'session']
+    columns.extend(label for label, _max in EXPIRY_BUCKETS)
+    if total.value_bytes is not None:
+        columns.append('value_bytes')
+    rows: list[list[str]] = []
+    for group in stats + [total]:
+        row = [group.key or '(total)', str(group.count), str(group.secure), str(group.http_only),
+               str(group.session)]
+        row.extend(str(group.expiry[label]) for label, _max in EXPIRY_BUCKETS)
+        if total.value_bytes is not None:
+            row.append(str(group.value_bytes or 0))
+        rows.append(row)
+    widths = [max(len(column), *(len(row[idx]) for row in rows)) for idx, column in enumerate(columns)]
+    if heading:
+        print(f'=== {heading} ===')
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(
+            value.ljust(width) if idx == 0 else value.rjust(width)
+            for idx, (value, width) in enumerate(zip(row, widths))
+        ))
+
+
+def display_stats_json(stats: Iterable[GroupStats], group_by: str, source: str = None):
+    """
+    Display group statistics as a JSON document.
+
+    Args:
+        stats: group statistics
+        group_by: grouping field name
+        source: optional source description
+    """
+    stats = list(stats)
+    document = {
+        'source': source,
+        'group_by': group_by,
+        'groups': [asdict(group) for group in stats],
+        'total': asdict(get_total_stats(stats)),
+    }
+    print(json.dumps(document, indent=2))
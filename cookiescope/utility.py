@@ -19,11 +19,14 @@
 Cookie scope utilities.
 """
 
+import os
 import sys
 from contextlib import contextmanager
 from pathlib import Path
 from typing import IO, Iterator
 
+from cookiescope.metrics import METRICS
+
 
 def warning(*messages: str):
     """
@@ -32,6 +35,7 @@ def warning(*messages: str):
     Args:
         messages: warning messages
     """
+    METRICS.increment('messages_total', len(messages), level='warning')
     for message in messages:
         sys.stderr.write(f'WARNING: {message}\n')
 
@@ -43,6 +47,7 @@ def error(*messages: str):
     Args:
         messages: error messages
     """
+    METRICS.increment('messages_total', len(messages), level='error')
     for message in messages:
         sys.stderr.write(f'ERROR: {message}\n')
 
@@ -58,6 +63,49 @@ def abort(*messages: str):
     sys.exit(1)
 
 
+def expand_home(path: str | Path, home: Path = None) -> Path:
+    """
+    Expand a leading "~" in a path, optionally using an alternate home directory.
+
+    Args:
+        path: path that may start with "~"
+        home: optional home directory (default: current user home)
+
+    Returns:
+        expanded path
+    """
+    path = Path(path)
+    if home is None:
+        return path.expanduser()
+    if path.parts and path.parts[0] == '~':
+        return home.joinpath(*path.parts[1:])
+    return path
+
+
+def replace_file(temporary_path: Path, path: Path, original_stat: os.stat_result):
+    """
+    Atomically replace a file with a rewritten temporary copy.
+
+    Aborts, leaving the original unmodified, if it changed since it was copied.
+    The copy gets the original's permissions, and ownership where permitted.
+
+    Args:
+        temporary_path: rewritten copy in the same directory as the original
+        path: original file path
+        original_stat: original file status from before it was copied
+    """
+    current_stat = os.stat(path)
+    if (current_stat.st_mtime_ns, current_stat.st_size) != (original_stat.st_mtime_ns, original_stat.st_size):
+        abort(f'File changed while rewriting, leaving it unmodified: {path}')
+    os.chmod(temporary_path, original_stat.st_mode & 0o7777)
+    if hasattr(os, 'chown'):
+        try:
+            os.chown(temporary_path, original_stat.st_uid, original_stat.st_gid)
+        except OSError:
+            pass
+    os.replace(temporary_path, path)
+
+
 @contextmanager
 def open_binary_file(path: Path) -> Iterator[IO]:
     try: